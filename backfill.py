@@ -0,0 +1,166 @@
+# This module loads the initial history of FRED series into empty
+# or newly added database tables. The history is split into
+# date-range chunks that are inserted in parallel over several
+# pooled sessions and committed one chunk at a time.
+# Completed chunks are recorded in the state store, so an
+# interrupted backfill resumes from where it stopped.
+#
+# Usage: python backfill.py [--workers N] [--chunk-years N]
+#                           [--direct-path] [CODE ...]
+
+# Import required resources.
+import argparse
+import concurrent.futures
+import time
+from config import *
+from datastore import *
+from derived import *
+from state import *
+
+# Splits a Pandas series into chunks of whole calendar years
+# aligned on multiples of chunk_years (so chunk boundaries stay
+# the same between runs) and returns a list of
+# (chunk start, chunk end, Pandas series) tuples.
+def backfill_chunks(pandas_series, chunk_years = 10):
+    chunks = []
+    if len(pandas_series) == 0:
+        return chunks
+    years = pandas_series.index.year
+    first_year = (int(years.min()) // chunk_years) * chunk_years
+    for year in range(first_year, int(years.max()) + 1, chunk_years):
+        chunk_series = pandas_series[(years >= year) &
+                                     (years < year + chunk_years)]
+        if len(chunk_series) > 0:
+            chunks.append((str(year) + '-01-01',
+                           str(year + chunk_years - 1) + '-12-31',
+                           chunk_series))
+    return chunks
+
+# This is the backfill for one target database (any sink).
+class Backfill:
+    def __init__(self, sink, data_store, state_store, workers = 4,
+                 chunk_years = 10, direct_path = False, verbosity = 0):
+        self.bkf_sink = sink
+        self.bkf_data_store = data_store
+        self.bkf_state_store = state_store
+        self.bkf_workers = int(workers)
+        self.bkf_chunk_years = int(chunk_years)
+        self.bkf_direct_path = bool(direct_path)
+        self.bkf_verbosity = int(verbosity)
+
+    # Inserts one chunk and records it as completed.
+    # Returns the number of rows inserted.
+    def load_chunk(self, fred_series, chunk):
+        chunk_start, chunk_end, chunk_series = chunk
+        row_tally = self.bkf_sink.insert_chunk(fred_series, chunk_series,
+                                              self.bkf_direct_path)
+        self.bkf_state_store.backfill_mark(fred_series.code(),
+                                           self.bkf_sink.target(),
+                                           chunk_start, chunk_end,
+                                           row_tally)
+        if self.verbosity() > 1:
+            print("Backfilled", fred_series.code(), chunk_start, "to",
+                  chunk_end, "-", row_tally, "row(s) ...")
+        return row_tally
+
+    # Returns the series that need a backfill on the target:
+    # those without any rows yet and those with a backfill
+    # in progress.
+    def pending(self, fred_series_list):
+        started = self.bkf_state_store.backfill_started(self.bkf_sink.target())
+        bookmarks = self.bkf_sink.bookmarks(fred_series_list)
+        return [fs for fs in fred_series_list
+                if bookmarks[fs.code()] is None or fs.code() in started]
+
+    # Backfills the pending series from the local data store.
+    # All chunks of all series share one pool of workers, and
+    # chunks completed by an earlier run are skipped.
+    # Returns a dictionary of code and rows inserted.
+    def run(self, fred_series_list):
+        target = self.bkf_sink.target()
+        row_tallies = {}
+        futures = {}
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers = self.bkf_workers) as executor:
+            for fs in self.pending(fred_series_list):
+                done = self.bkf_state_store.backfill_done(fs.code(), target)
+                chunks = [chunk for chunk in
+                          backfill_chunks(self.bkf_data_store.read(fs.code()),
+                                          self.bkf_chunk_years)
+                          if chunk[0] not in done]
+                if self.verbosity() > 0:
+                    print("Backfilling", fs.code(), "into", target, "in",
+                          len(chunks), "chunk(s) ...")
+                row_tallies[fs.code()] = 0
+                for chunk in chunks:
+                    futures[executor.submit(self.load_chunk, fs, chunk)] = fs
+            failed_codes = set()
+            for future in concurrent.futures.as_completed(futures):
+                fs = futures[future]
+                try:
+                    row_tallies[fs.code()] += future.result()
+                except Exception as e:
+                    print(f"Unexpected error backfilling {fs.code()} "
+                          f"into {target}: {e}")
+                    failed_codes.add(fs.code())
+        # Forget the chunks of completed series so the nightly
+        # incremental run takes over from their bookmarks.
+        for code in row_tallies:
+            if code not in failed_codes:
+                self.bkf_state_store.backfill_clear(code, target)
+            else:
+                print("Backfill of", code, "into", target,
+                      "incomplete; rerun to resume.")
+        return row_tallies
+
+    # Return and optionally set the verbosity level for the object.
+    def verbosity(self, v = None):
+        if v is not None:
+            self.bkf_verbosity = v
+        return self.bkf_verbosity
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description = "Backfill the history of FRED series into " +
+                      "empty or newly added database tables.")
+    parser.add_argument('codes', nargs = '*',
+                        help = "series codes (default: all configured)")
+    parser.add_argument('--workers', type = int, default = 4,
+                        help = "parallel sessions per database")
+    parser.add_argument('--chunk-years', type = int, default = 10,
+                        help = "calendar years per chunk")
+    parser.add_argument('--direct-path', action = 'store_true',
+                        help = "use direct-path (APPEND_VALUES) inserts, " +
+                               "which serialize sessions per table")
+    parser.add_argument('--sqlite', action = 'store_true',
+                        help = "also backfill the SQLite databases")
+    parser.add_argument('--verbosity', type = int, default = 1)
+    args = parser.parse_args()
+
+    config_path = 'config/'
+    data_path = 'data/'
+    state_path = 'state/'
+    fred_codes = SeriesRegistry(config_path, args.verbosity).codes()
+    state_store = StateStore(state_path + 'fredflow_state.db', args.verbosity)
+    data_store = DataStore(data_path, verbosity = args.verbosity)
+    # Backfill only series with local data (fetched by main.py),
+    # including the series derived from them.
+    fred_series = state_store.load(fred_codes)
+    fred_series = [fs for fs in fred_series + DerivedEngine(
+                       config_derived_series(config_path, args.verbosity),
+                       fred_series, data_store).series()
+                   if (len(args.codes) == 0 or fs.code() in args.codes) and
+                   data_store.exists(fs.code())]
+    sink_list = config_oracle_databases(config_path, args.verbosity)
+    if args.sqlite:
+        sink_list += config_sqlite_databases(config_path, args.verbosity)
+    for sink in sink_list:
+        start = time.monotonic()
+        row_tallies = Backfill(sink, data_store, state_store, args.workers,
+                               args.chunk_years, args.direct_path,
+                               args.verbosity).run(fred_series)
+        print("Backfilled", sum(row_tallies.values()), "row(s) of",
+              len(row_tallies), "series into", sink.target(), "in",
+              round(time.monotonic() - start, 1), "second(s).")
+        sink.close()
+    state_store.close()
@@ -0,0 +1,237 @@
+# This module is a reproducible benchmark for the FREDflow hot loop
+# that needs neither a FRED API key nor an Oracle server.
+# A fake Fred client serves synthetic series and an SQLite sink
+# stands in for the database while counting round trips and commits.
+# Startup (config), state load, fetch, local persistence, bookmark
+# and upsert are timed for catalogues of several sizes, first for
+# a full load and then for an incremental (nightly) run.
+#
+# Usage: python bench.py [--sizes 10 1000 10000] [--length 500]
+#                        [--output bench_results.json]
+
+# Import required resources.
+import argparse
+import csv
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from config import *
+from datastore import *
+from pipeline import *
+from scheduler import *
+from sqlitedb import *
+from state import *
+
+# Pandas frequencies used for the synthetic series of each granularity.
+bench_frequencies = {'DAILY': 'D',
+                     'WEEKLY': 'W-SAT',
+                     'MONTHLY': 'MS',
+                     'QUARTERLY': 'QS'}
+
+# This is a stand-in for the fredapi Fred client that serves
+# synthetic series of a configurable length, with an optional
+# simulated network latency per request.
+class FakeFred:
+    def __init__(self, length = 500, latency = 0.0, seed = 0):
+        self.ff_length = int(length)
+        self.ff_latency = float(latency)
+        self.ff_seed = int(seed)
+        self.ff_granularities = {}
+        self.ff_requests = 0
+
+    # Registers the granularity of a series code.
+    def add(self, code, granularity):
+        self.ff_granularities[code] = granularity
+
+    # Returns the synthetic series, optionally from a start date
+    # like fredapi's get_series.
+    def get_series(self, series_id, observation_start = None,
+                   observation_end = None, **kwargs):
+        self.ff_requests += 1
+        if self.ff_latency > 0:
+            time.sleep(self.ff_latency)
+        frequency = bench_frequencies[self.ff_granularities[series_id]]
+        index = pd.date_range(end = pd.Timestamp('2025-01-01'),
+                              periods = self.ff_length, freq = frequency)
+        random = np.random.default_rng(self.ff_seed + len(series_id))
+        series = pd.Series(random.normal(100.0, 10.0, self.ff_length).round(2),
+                           index = index)
+        if observation_start is not None:
+            series = series[pd.Timestamp(observation_start):]
+        return series
+
+    # Returns series metadata with a fixed last_updated timestamp.
+    def get_series_info(self, series_id):
+        self.ff_requests += 1
+        return pd.Series({'id': series_id,
+                          'last_updated': '2025-01-02 07:00:00-06'})
+
+    # Returns the number of requests served.
+    def requests(self):
+        return self.ff_requests
+
+# This wraps an SQLite connection to count the calls that would be
+# database round trips (execute, executemany) and the commits.
+class CountingConnection:
+    def __init__(self, connection, tally):
+        self.cc_connection = connection
+        self.cc_tally = tally
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.cc_connection.rollback()
+        return False
+
+    def commit(self):
+        self.cc_tally['commits'] += 1
+        self.cc_connection.commit()
+
+    def execute(self, *args):
+        self.cc_tally['round_trips'] += 1
+        return self.cc_connection.execute(*args)
+
+    def executemany(self, *args):
+        self.cc_tally['round_trips'] += 1
+        return self.cc_connection.executemany(*args)
+
+    def rollback(self):
+        self.cc_connection.rollback()
+
+# This is an SQLite sink that records round trips and commits.
+class BenchSink(SQLiteDB):
+    def __init__(self, path, verbosity = 0):
+        SQLiteDB.__init__(self, path, 'bench', verbosity)
+        self.bs_tally = {'round_trips': 0, 'commits': 0}
+
+    def connection(self):
+        return CountingConnection(SQLiteDB.connection(self), self.bs_tally)
+
+    # Returns and resets the round trip and commit tallies.
+    def tally(self):
+        tally = dict(self.bs_tally)
+        self.bs_tally['round_trips'] = 0
+        self.bs_tally['commits'] = 0
+        return tally
+
+# Writes a fred_series.csv catalogue of n synthetic series
+# cycling through the granularities.
+def write_catalogue(config_path, n):
+    granularities = list(bench_frequencies.keys())
+    with open(config_path + 'fred_series.csv', 'w', newline = '') as file:
+        csvwriter = csv.writer(file)
+        csvwriter.writerow(['code', 'name', 'granularity', 'lookback'])
+        for i in range(n):
+            csvwriter.writerow(['S' + str(i).zfill(6),
+                                'Synthetic series ' + str(i),
+                                granularities[i % len(granularities)],
+                                30])
+
+# Times one call and returns (seconds, result).
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+# Runs one pass of fetch, persist, bookmark and upsert over
+# the series and returns the timings and tallies.
+def bench_pass(fred, fred_series, data_store, state_store, sink):
+    timings = {}
+    requests = fred.requests()
+    scheduler = FetchScheduler(fred, workers = 4, rate_per_minute = 1e9)
+    timings['fetch_secs'], fetched = timed(
+        lambda: [(fs, ds) for fs, ds, latency in scheduler.run(fred_series)
+                 if ds is not None])
+    timings['fetch_requests'] = fred.requests() - requests
+    timings['persist_secs'], persisted = timed(
+        lambda: [(fs, persist_series(fs, ds, data_store, state_store))
+                 for fs, ds in fetched])
+    sink.tally()
+    timings['bookmark_secs'], bookmarks = timed(sink.bookmarks, fred_series)
+    timings['bookmark_round_trips'] = sink.tally()['round_trips']
+    timings['upsert_secs'], row_tallies = timed(
+        lambda: [load_series(sink, fs, ds) for fs, ds in persisted])
+    tally = sink.tally()
+    timings['upsert_rows'] = int(sum(row_tallies))
+    timings['upsert_round_trips'] = tally['round_trips']
+    timings['upsert_commits'] = tally['commits']
+    if timings['upsert_secs'] > 0:
+        timings['upsert_rows_per_sec'] = \
+            timings['upsert_rows'] / timings['upsert_secs']
+    return timings
+
+# Benchmarks a catalogue of n series in a scratch directory
+# and returns the results.
+def bench_catalogue(n, length, latency, work_path):
+    config_path = os.path.join(work_path, 'config') + os.sep
+    data_path = os.path.join(work_path, 'data') + os.sep
+    os.makedirs(config_path)
+    os.makedirs(data_path)
+    write_catalogue(config_path, n)
+    results = {'series': n, 'length': length, 'latency': latency}
+    fred = FakeFred(length, latency)
+
+    # Startup: read the catalogue and instantiate the series.
+    def startup():
+        return SeriesRegistry(config_path).instantiate()
+    results['startup_secs'], fred_series = timed(startup)
+    for fs in fred_series:
+        fred.add(fs.code(), fs.granularity())
+    state_store = StateStore(os.path.join(work_path, 'state.db'))
+    data_store = DataStore(data_path)
+    sink = BenchSink(os.path.join(work_path, 'sink.db'))
+
+    results['full'] = bench_pass(fred, fred_series, data_store,
+                                 state_store, sink)
+    # State load: read back the state saved by the full pass.
+    results['state_load_secs'], fred_series = timed(
+        state_store.load, {fs.code() for fs in fred_series})
+    sink.close()
+    sink = BenchSink(os.path.join(work_path, 'sink.db'))
+    results['incremental'] = bench_pass(fred, fred_series, data_store,
+                                        state_store, sink)
+    sink.close()
+    state_store.close()
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description = "Benchmark FREDflow with a fake FRED client " +
+                      "and an SQLite database stand-in.")
+    parser.add_argument('--sizes', type = int, nargs = '+',
+                        default = [10, 1000, 10000],
+                        help = "catalogue sizes (number of series)")
+    parser.add_argument('--length', type = int, default = 500,
+                        help = "observations per synthetic series")
+    parser.add_argument('--latency', type = float, default = 0.0,
+                        help = "simulated seconds per FRED request")
+    parser.add_argument('--output', default = 'bench_results.json',
+                        help = "JSON file for the results")
+    args = parser.parse_args()
+
+    report = {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'python': platform.python_version(),
+              'pandas': pd.__version__,
+              'numpy': np.__version__,
+              'results': []}
+    for n in args.sizes:
+        work_path = tempfile.mkdtemp(prefix = 'fredflow_bench_')
+        try:
+            print("Benchmarking", n, "series ...")
+            results = bench_catalogue(n, args.length, args.latency, work_path)
+        finally:
+            shutil.rmtree(work_path, ignore_errors = True)
+        print(json.dumps(results, indent = 2))
+        report['results'].append(results)
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent = 2)
+    print("Wrote", args.output)
@@ -0,0 +1,65 @@
+# This module computes the Julian day number and calendar keys
+# for whole arrays of dates at once, matching the Oracle
+# expressions in the UPSERT functions of sql-ddl.txt:
+#   release_jdn     = TO_NUMBER(TO_CHAR(d, 'J'))
+#   cal_week_key    = TO_NUMBER(TO_CHAR(d, 'YYYY') || TO_CHAR(d, 'WW'))
+#   cal_month_key   = TO_NUMBER(TO_CHAR(d, 'YYYY') || TO_CHAR(d, 'MM'))
+#   cal_quarter_key = TO_NUMBER(TO_CHAR(d, 'YYYY') || TO_CHAR(d, 'Q'))
+# Dates are treated as proleptic Gregorian, which matches Oracle
+# for dates after the 1582 calendar reform.
+
+# Import required resources.
+import numpy as np
+
+# Julian day number of 1970-01-01 (the NumPy datetime epoch).
+jdn_epoch = 2440588
+
+# Calendar key column (the primary key) for each granularity;
+# daily series are keyed by the Julian day number.
+key_columns = {'DAILY': 'release_jdn',
+               'WEEKLY': 'cal_week_key',
+               'MONTHLY': 'cal_month_key',
+               'QUARTERLY': 'cal_quarter_key'}
+
+# Returns the dates as a NumPy datetime64[D] array.
+def as_days(dates):
+    return np.asarray(dates).astype('datetime64[D]')
+
+# Returns the Julian day numbers (Oracle 'J') of the dates.
+def julian_day_numbers(dates):
+    return as_days(dates).astype(np.int64) + jdn_epoch
+
+# Returns the calendar years (Oracle 'YYYY') of the dates.
+def years(dates):
+    return as_days(dates).astype('datetime64[Y]').astype(np.int64) + 1970
+
+# Returns the calendar week keys (YYYYWW) of the dates, where
+# Oracle 'WW' week 1 runs from January 1 to January 7.
+def cal_week_keys(dates):
+    days = as_days(dates)
+    day_of_year = (days - days.astype('datetime64[Y]')).astype(np.int64)
+    return years(days) * 100 + day_of_year // 7 + 1
+
+# Returns the calendar month keys (YYYYMM) of the dates.
+def cal_month_keys(dates):
+    days = as_days(dates)
+    month = days.astype('datetime64[M]').astype(np.int64) % 12 + 1
+    return years(days) * 100 + month
+
+# Returns the calendar quarter keys (YYYYQ) of the dates.
+def cal_quarter_keys(dates):
+    days = as_days(dates)
+    month = days.astype('datetime64[M]').astype(np.int64) % 12 + 1
+    return years(days) * 10 + (month - 1) // 3 + 1
+
+# Returns a dictionary of key column name and key array
+# (release_jdn plus any calendar key) for a granularity.
+def calendar_keys(dates, granularity):
+    keys = {'release_jdn': julian_day_numbers(dates)}
+    if granularity == 'WEEKLY':
+        keys['cal_week_key'] = cal_week_keys(dates)
+    elif granularity == 'MONTHLY':
+        keys['cal_month_key'] = cal_month_keys(dates)
+    elif granularity == 'QUARTERLY':
+        keys['cal_quarter_key'] = cal_quarter_keys(dates)
+    return keys
@@ -1,11 +1,14 @@
 # Import required resources.
+# The FRED API client and the database drivers are imported
+# only when they are configured, keeping startup light.
+import collections
 import csv
-from fredapi import Fred
+import os
 from fred import *
-from orcldb import *
 
 def config_fred_api(config_path, verbosity):
     # Read config file for FRED API key.
+    from fredapi import Fred
     if verbosity > 0:
         print("\nConfiguring FRED API ...")
     with open(config_path + 'fredflow_config.csv', 'r') as file:
@@ -19,71 +22,170 @@ def config_fred_api(config_path, verbosity):
 
 
 
-def config_fred_dict(config_path, verbosity):
-    # Read config file for FRED series code and name
-    # and return a dictionary.
-    fred_dict = {}
-    if verbosity > 0:
-        print("\nConfiguring FRED series dictionary ...")
-    with open(config_path + 'fred_series.csv', 'r') as file:
-        csvreader = csv.reader(file)
-        # Skip headers on first line.
-        next(csvreader)
-        for row in csvreader:
-            fred_dict[row[0]] = row[1]
-    return fred_dict
+# One row of config/fred_series.csv with typed fields.
+SeriesConfig = collections.namedtuple('SeriesConfig',
+                                      ['code', 'name', 'granularity',
+                                       'lookback'])
 
+# This is the registry of configured FRED series, read once from
+# config/fred_series.csv and indexed by code, shared by main.py
+# and the loaders.
+class SeriesRegistry:
+    # Static variables.
+    srg_kind = 'SRG'
+    srg_title = 'Series Registry'
 
+    def __init__(self, config_path, verbosity = 0):
+        self.srg_path = config_path + 'fred_series.csv'
+        self.srg_verbosity = int(verbosity)
+        self.srg_entries = {}
+        if self.verbosity() > 0:
+            print("\nConfiguring FRED series registry ...")
+        with open(self.srg_path, 'r') as file:
+            csvreader = csv.reader(file)
+            # Skip headers on first line.
+            next(csvreader)
+            for row in csvreader:
+                if len(row) == 0:
+                    continue
+                self.srg_entries[row[0]] = SeriesConfig(
+                    row[0], # Code
+                    row[1], # Name
+                    row[2], # Granularity
+                    int(row[3])) # Lookback
 
-def config_fred_series(config_path, new_codes,
-                       pickled_series, verbosity):
-    # Read config file for FRED series granularity,
-    # instantiate FREDSeries objects and return a list.
-    new_series = []
-    if verbosity > 0:
-        print("\nConfiguring new FRED series ...")
-    with open(config_path + 'fred_series.csv', 'r') as file:
-        csvreader = csv.reader(file)
-        # Skip headers on first line.
-        next(csvreader)
-        for row in csvreader:
-            if row[0] in new_codes:
-                # Instantiate new series object.
-                new_series.append(FREDSeries(row[0], # Code
-                                             row[1], # Name
-                                             row[2], # Granularity
-                                             row[3])) # Lookback
-    return new_series
+    def __contains__(self, code):
+        return code in self.srg_entries
+
+    def __len__(self):
+        return len(self.srg_entries)
+
+    # Returns the set of configured series codes.
+    def codes(self):
+        return set(self.srg_entries.keys())
+
+    # Compares the configuration with stored series in one pass.
+    # Returns the codes of added series, the codes of stored series
+    # no longer configured and a list of (stored series, changed
+    # field names) for series whose name, granularity or lookback
+    # differ from the configuration.
+    def diff(self, stored_series):
+        stored_codes = set()
+        changed_series = []
+        for fs in stored_series:
+            stored_codes.add(fs.code())
+            entry = self.srg_entries.get(fs.code())
+            if entry is None:
+                continue
+            fields = [field for field, value in
+                      [('name', fs.name()),
+                       ('granularity', fs.granularity()),
+                       ('lookback', fs.lookback())]
+                      if getattr(entry, field) != value]
+            if len(fields) > 0:
+                changed_series.append((fs, fields))
+        added_codes = [code for code in self.srg_entries
+                       if code not in stored_codes]
+        removed_codes = [code for code in stored_codes
+                         if code not in self.srg_entries]
+        return added_codes, removed_codes, changed_series
+
+    # Returns the configuration of a series code (or None).
+    def entry(self, code):
+        return self.srg_entries.get(code)
+
+    # Instantiates FREDSeries objects for the codes (all configured
+    # series by default) in configuration order and returns a list.
+    def instantiate(self, codes = None):
+        return [FREDSeries(entry.code, entry.name, entry.granularity,
+                           entry.lookback)
+                for entry in self.srg_entries.values()
+                if codes is None or entry.code in codes]
+
+    # Returns the kind of object instantiated.
+    def kind(self):
+        return self.srg_kind
 
+    # Returns a dictionary of series code and name.
+    def names(self):
+        return {code: entry.name for code, entry in self.srg_entries.items()}
 
+    # Applies configuration changes to stored series, given as the
+    # list of (stored series, changed field names) from diff(), and
+    # returns a list of the reconfigured series. A series whose
+    # granularity changed is reset so that its history is fetched again.
+    def reconfigure(self, changed_series):
+        reconfigured_series = []
+        for fs, fields in changed_series:
+            entry = self.srg_entries[fs.code()]
+            for field in fields:
+                print("Reconfiguring", fs.code(), field, "from",
+                      getattr(fs, field)(), "to", getattr(entry, field), "...")
+                getattr(fs, field)(getattr(entry, field))
+            if 'granularity' in fields:
+                fs.reset()
+            reconfigured_series.append(fs)
+        if self.verbosity() > 0:
+            print("Reconfigured", len(reconfigured_series),
+                  "stored FRED series.")
+        return reconfigured_series
 
-def reconfig_pickled_series(config_path, pickled_series, verbosity):
-    with open(config_path + 'fred_series.csv', 'r') as file:
+    # Returns the title of the instantiated object.
+    def title(self):
+        return self.srg_title
+
+    # Return and optionally set the verbosity level for the object.
+    def verbosity(self, v = None):
+        if v is not None:
+            self.srg_verbosity = v
+        return self.srg_verbosity
+
+
+
+# One row of config/derived_series.csv with typed fields.
+DerivedConfig = collections.namedtuple('DerivedConfig',
+                                       ['code', 'name', 'source',
+                                        'transform', 'granularity',
+                                        'window'])
+
+def config_derived_series(config_path, verbosity):
+    # Read the optional config file for derived series
+    # and return a list of their configurations.
+    # An empty granularity keeps that of the source and
+    # an empty window defaults to 1.
+    derived_configs = []
+    if not os.path.isfile(config_path + 'derived_series.csv'):
+        return derived_configs
+    if verbosity > 0:
+        print("\nConfiguring derived series ...")
+    with open(config_path + 'derived_series.csv', 'r') as file:
         csvreader = csv.reader(file)
         # Skip headers on first line.
         next(csvreader)
         for row in csvreader:
-            # For existing series,
-            # check for parameter changes like lookback.
-            pkl_pds = None
-            for pds in pickled_series:
-                if pds.code() == row[0]: # Code
-                    pkl_pds = pds
-            if pkl_pds is not None:
-                if pkl_pds.lookback() != int(row[3]): # Lookback
-                    print("Reconfiguring", pkl_pds.code(),
-                          "lookback from", pkl_pds.lookback(),
-                          "to", row[3], "...")
-                    pkl_pds.lookback(int(row[3]))
-                else:
-                    print("No lookback parameter changes for",
-                          pkl_pds.code(), "...")
+            if len(row) == 0:
+                continue
+            try:
+                derived_configs.append(DerivedConfig(
+                    row[0], # Code
+                    row[1], # Name
+                    row[2], # Source
+                    row[3], # Transform
+                    row[4] if len(row) > 4 else '', # Granularity
+                    int(row[5]) if len(row) > 5 and row[5] != '' else 1)) # Window
+            except (IndexError, ValueError):
+                print("WARNING: Derived series row", row,
+                      "is malformed; skipping it.")
+    return derived_configs
 
 
 
 def config_oracle_databases(config_path, verbosity):
     # Read config file for Oracle databases
     # and return a list.
+    # The connection pool and timeout columns are optional
+    # and default to the OracleDB settings.
+    from orcldb import OracleDB
     oracle_db_list = []
     if verbosity > 0:
         print("\nConfiguring Oracle DB ...")
@@ -92,12 +194,41 @@ def config_oracle_databases(config_path, verbosity):
         # Skip headers on first line.
         next(csvreader)
         for row in csvreader:
+            pool_args = {}
+            for i, column in enumerate(['pool_min',
+                                        'pool_max',
+                                        'pool_increment',
+                                        'stmt_cache',
+                                        'timeout'], 6):
+                if len(row) > i and row[i] != '':
+                    pool_args[column] = int(row[i])
             oracle_db_list.append(OracleDB(
                 row[0], # user
                 row[1], # password
                 row[2], # host
                 row[3], # port
                 row[4], # sid
-                row[5] # name
+                row[5], # name
+                **pool_args
             ))
     return oracle_db_list
+
+
+
+def config_sqlite_databases(config_path, verbosity):
+    # Read config file for embedded SQLite databases
+    # and return a list.
+    from sqlitedb import SQLiteDB
+    sqlite_db_list = []
+    if verbosity > 0:
+        print("\nConfiguring SQLite DB ...")
+    with open(config_path + 'sqlite_db.csv', 'r') as file:
+        csvreader = csv.reader(file)
+        # Skip headers on first line.
+        next(csvreader)
+        for row in csvreader:
+            sqlite_db_list.append(SQLiteDB(
+                row[0], # path
+                row[1] # name
+            ))
+    return sqlite_db_list
@@ -0,0 +1,350 @@
+# This module defines the FetchDaemon class that keeps FREDflow
+# resident: the FRED client, the state store and the database
+# connection pools stay open between runs, and a priority queue
+# of next-due times wakes the daemon only for the series that are
+# due. A series is due on the release dates of its FRED release
+# (from the FRED release calendar) or, without a calendar, after
+# the re-check interval of its granularity. The upcoming work and
+# the lag of each series are written to a JSON status file.
+
+# Import required resources.
+import datetime
+import heapq
+import json
+import os
+import signal
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+# Returns a time (seconds since the epoch) as local ISO 8601 text.
+def iso_time(t):
+    return time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(t))
+
+# This is the FRED release calendar: the release of each series
+# and the upcoming dates of each release, looked up through the
+# FRED API (within the fetch scheduler's request budget) and
+# refreshed once a day.
+class ReleaseCalendar:
+    # Static variables.
+    rcl_kind = 'RCL'
+    rcl_title = 'Release Calendar'
+    rcl_url = 'https://api.stlouisfed.org/fred/'
+
+    def __init__(self, api_key, fetch_scheduler = None, refresh_hours = 24,
+                 timeout = 30, verbosity = 0):
+        self.rcl_api_key = str(api_key)
+        self.rcl_scheduler = fetch_scheduler
+        self.rcl_refresh_secs = float(refresh_hours) * 3600
+        self.rcl_timeout = float(timeout)
+        self.rcl_verbosity = int(verbosity)
+        self.rcl_lock = threading.Lock()
+        # Release id by series code (None if unknown).
+        self.rcl_release_ids = {}
+        # (lookup time, sorted release dates) by release id.
+        self.rcl_dates = {}
+
+    # Returns the kind of object instantiated.
+    def kind(self):
+        return self.rcl_kind
+
+    # Returns the first release date of the series after a date,
+    # or None if the series' release calendar is unknown.
+    def next_release(self, code, after):
+        release_id = self.release_id(code)
+        if release_id is None:
+            return None
+        for release_date in self.release_dates(release_id):
+            if release_date > after:
+                return release_date
+        return None
+
+    # Returns the release dates of a release from a month ago on
+    # (so releases missed while stopped are seen), looking them up
+    # again once they are a day old.
+    def release_dates(self, release_id):
+        with self.rcl_lock:
+            looked_up, release_dates = self.rcl_dates.get(release_id,
+                                                          (None, []))
+        if looked_up is not None and \
+                time.time() - looked_up < self.rcl_refresh_secs:
+            return release_dates
+        try:
+            response = self.request(
+                'release/dates', release_id = release_id,
+                realtime_start = (datetime.date.today() -
+                                  datetime.timedelta(days = 31)).isoformat(),
+                include_release_dates_with_no_data = 'true',
+                sort_order = 'asc', limit = 100)
+            release_dates = sorted(
+                datetime.date.fromisoformat(entry['date'])
+                for entry in response['release_dates'])
+        except Exception as e:
+            print(f"Unexpected error looking up the dates of release "
+                  f"{release_id}: {e}")
+        with self.rcl_lock:
+            self.rcl_dates[release_id] = (time.time(), release_dates)
+        return release_dates
+
+    # Returns the id of the FRED release that includes a series,
+    # or None if it cannot be looked up.
+    def release_id(self, code):
+        with self.rcl_lock:
+            if code in self.rcl_release_ids:
+                return self.rcl_release_ids[code]
+        release_id = None
+        try:
+            releases = self.request('series/release',
+                                    series_id = code)['releases']
+            if len(releases) > 0:
+                release_id = releases[0]['id']
+                if self.verbosity() > 1:
+                    print("Series", code, "is part of release",
+                          release_id, "-", releases[0]['name'])
+        except Exception as e:
+            print(f"Unexpected error looking up the release of {code}: {e}")
+        with self.rcl_lock:
+            self.rcl_release_ids[code] = release_id
+        return release_id
+
+    # Sends a FRED API request (taking a token from the fetch
+    # scheduler first) and returns the parsed JSON response.
+    def request(self, path, **parameters):
+        if self.rcl_scheduler is not None:
+            self.rcl_scheduler.acquire()
+        url = self.rcl_url + path + '?' + urllib.parse.urlencode(
+            dict(parameters, api_key = self.rcl_api_key, file_type = 'json'))
+        with urllib.request.urlopen(url, timeout = self.rcl_timeout) \
+                as response:
+            return json.load(response)
+
+    # Returns the title of the instantiated object.
+    def title(self):
+        return self.rcl_title
+
+    # Return and optionally set the verbosity level for the object.
+    def verbosity(self, v = None):
+        if v is not None:
+            self.rcl_verbosity = v
+        return self.rcl_verbosity
+
+# This is the resident scheduler. It runs the due series in
+# batches through the given run_batch function (fetch, persist
+# and load with warm clients), which takes the batch and the
+# series to retry without a release check, and reschedules
+# each series.
+class FetchDaemon:
+    # Static variables.
+    dmn_kind = 'DMN'
+    dmn_title = 'Fetch Daemon'
+
+    def __init__(self, fred_series_list, run_batch, fred_pipeline,
+                 status_path, calendar = None, release_hour = 9,
+                 retry_minutes = 30, max_hours = 168, status_secs = 60,
+                 verbosity = 0):
+        self.dmn_series = {fs.code(): fs for fs in fred_series_list}
+        self.dmn_run_batch = run_batch
+        self.dmn_pipeline = fred_pipeline
+        self.dmn_status_path = str(status_path)
+        self.dmn_calendar = calendar
+        self.dmn_release_hour = int(release_hour)
+        self.dmn_retry_secs = float(retry_minutes) * 60
+        self.dmn_max_secs = float(max_hours) * 3600
+        self.dmn_status_secs = float(status_secs)
+        self.dmn_verbosity = int(verbosity)
+        self.dmn_started = time.time()
+        self.dmn_stop = threading.Event()
+        # Heap of (due time, code); superseded entries are skipped.
+        self.dmn_queue = []
+        # Due time, time of the last check and seconds the last
+        # check started late, by code.
+        self.dmn_due = {}
+        self.dmn_checked = {}
+        self.dmn_lag = {}
+        # Codes of the series whose last run failed.
+        self.dmn_failed = set()
+        self.dmn_runs = 0
+        self.dmn_last_batch = None
+
+    # Returns the codes of the series due at a time, in due order,
+    # and removes them from the queue.
+    def due(self, now):
+        codes = []
+        while len(self.dmn_queue) > 0 and self.dmn_queue[0][0] <= now:
+            due_time, code = heapq.heappop(self.dmn_queue)
+            if self.dmn_due.get(code) != due_time:
+                continue
+            self.dmn_lag[code] = now - due_time
+            del self.dmn_due[code]
+            codes.append(code)
+        return codes
+
+    # Returns the last release date a fetch at a time includes:
+    # the day before if fetched before that day's release hour.
+    def fetched_through(self, fetch_time):
+        fetch_time = datetime.datetime.fromtimestamp(fetch_time)
+        if fetch_time.hour < self.dmn_release_hour:
+            return fetch_time.date() - datetime.timedelta(days = 1)
+        return fetch_time.date()
+
+    # Returns the kind of object instantiated.
+    def kind(self):
+        return self.dmn_kind
+
+    # Returns the next time a series is due: on its next release
+    # date (from the release hour, and then every retry interval
+    # until the release shows up, for the rest of that day) or,
+    # without a calendar, after the re-check interval of its
+    # granularity. Series are checked at least every max_hours.
+    def next_due(self, fred_series, now):
+        last_fetch = fred_series.last_fetch()
+        if last_fetch is None:
+            return now
+        checked = self.dmn_checked.get(fred_series.code(),
+                                       fred_series.last_checked())
+        if checked is None:
+            return now
+        due_time = checked + fred_series.pds_recheck_hours.get(
+            fred_series.granularity(), 0) * 3600
+        if self.dmn_calendar is not None:
+            release_date = self.dmn_calendar.next_release(
+                fred_series.code(), self.fetched_through(last_fetch))
+            while release_date is not None:
+                release_time = datetime.datetime.combine(
+                    release_date,
+                    datetime.time(self.dmn_release_hour)).timestamp()
+                # Look for the next release once the series was
+                # checked on a release day that passed without an
+                # update (a release missed while stopped is due).
+                release_end = datetime.datetime.combine(
+                    release_date + datetime.timedelta(days = 1),
+                    datetime.time()).timestamp()
+                if now < release_end or checked < release_time:
+                    due_time = max(release_time,
+                                   checked + self.dmn_retry_secs)
+                    break
+                release_date = self.dmn_calendar.next_release(
+                    fred_series.code(), release_date)
+        return max(now, min(due_time, checked + self.dmn_max_secs))
+
+    # Runs until stopped (by SIGINT or SIGTERM), waking when
+    # series are due (or to update the status file).
+    def run(self):
+        for signal_number in [signal.SIGINT, signal.SIGTERM]:
+            signal.signal(signal_number, lambda signum, frame: self.stop())
+        now = time.time()
+        for fs in self.dmn_series.values():
+            self.schedule(fs, self.next_due(fs, now))
+        print("Daemon scheduling", len(self.dmn_series), "series ...")
+        while not self.dmn_stop.is_set():
+            codes = self.due(time.time())
+            if len(codes) > 0:
+                self.run_batch(codes)
+            self.write_status()
+            if len(self.dmn_queue) > 0:
+                wait = min(self.dmn_status_secs,
+                           self.dmn_queue[0][0] - time.time())
+            else:
+                wait = self.dmn_status_secs
+            self.dmn_stop.wait(max(0.0, wait))
+        self.write_status()
+        print("Daemon stopped after", self.dmn_runs, "run(s).")
+
+    # Runs a batch of due series and reschedules them; series
+    # that failed are tried again after the retry interval, and
+    # fetched again then even though their release was checked.
+    def run_batch(self, codes):
+        start = time.time()
+        tally = self.dmn_pipeline.tally()
+        if self.verbosity() > 0:
+            print("\nDaemon running", len(codes), "due series at",
+                  iso_time(start), "...")
+        try:
+            self.dmn_run_batch([self.dmn_series[code] for code in codes],
+                               [self.dmn_series[code] for code in codes
+                                if code in self.dmn_failed])
+            failures = self.dmn_pipeline.failures(reset = True)
+        except Exception as e:
+            print(f"Unexpected error running {len(codes)} series: {e}")
+            self.dmn_pipeline.failures(reset = True)
+            failures = set(codes)
+        now = time.time()
+        for code in codes:
+            self.dmn_checked[code] = start
+            if code in failures:
+                self.dmn_failed.add(code)
+                self.schedule(self.dmn_series[code],
+                              now + self.dmn_retry_secs)
+            else:
+                self.dmn_failed.discard(code)
+                self.schedule(self.dmn_series[code],
+                              self.next_due(self.dmn_series[code], now))
+        self.dmn_runs += 1
+        self.dmn_last_batch = {
+            'start': iso_time(start),
+            'secs': round(now - start, 3),
+            'series': len(codes),
+            'fetched': self.dmn_pipeline.tally()['fetched'] - tally['fetched'],
+            'failed': sorted(code for code in codes if code in failures)}
+
+    # Queues a series to be due at a time.
+    def schedule(self, fred_series, due_time):
+        self.dmn_due[fred_series.code()] = due_time
+        heapq.heappush(self.dmn_queue, (due_time, fred_series.code()))
+
+    # Returns the status of the daemon as a dictionary: the
+    # upcoming series (with their due times and next releases),
+    # the number overdue and the lag of the last checks.
+    def status(self, upcoming = 20):
+        now = time.time()
+        queued = sorted((due_time, code)
+                        for code, due_time in self.dmn_due.items())
+        upcoming_series = []
+        for due_time, code in queued[:upcoming]:
+            entry = {'code': code,
+                     'due': iso_time(due_time),
+                     'in_secs': round(due_time - now, 1)}
+            if self.dmn_calendar is not None:
+                fs = self.dmn_series[code]
+                if fs.last_fetch() is not None:
+                    release_date = self.dmn_calendar.next_release(
+                        code, self.fetched_through(fs.last_fetch()))
+                    if release_date is not None:
+                        entry['next_release'] = release_date.isoformat()
+            upcoming_series.append(entry)
+        lags = sorted(((lag, code) for code, lag in self.dmn_lag.items()),
+                      reverse = True)
+        return {'pid': os.getpid(),
+                'started': iso_time(self.dmn_started),
+                'updated': iso_time(now),
+                'runs': self.dmn_runs,
+                'series': len(self.dmn_series),
+                'overdue': sum(1 for due_time, code in queued
+                               if due_time <= now),
+                'last_batch': self.dmn_last_batch,
+                'max_lag_secs': round(lags[0][0], 1) if lags else None,
+                'lag_secs': {code: round(lag, 1) for lag, code in lags[:10]},
+                'upcoming': upcoming_series}
+
+    # Stops the daemon after the batch in progress.
+    def stop(self):
+        self.dmn_stop.set()
+
+    # Returns the title of the instantiated object.
+    def title(self):
+        return self.dmn_title
+
+    # Return and optionally set the verbosity level for the object.
+    def verbosity(self, v = None):
+        if v is not None:
+            self.dmn_verbosity = v
+        return self.dmn_verbosity
+
+    # Writes the status file, replacing it in one step so
+    # readers never see a partial file.
+    def write_status(self):
+        temporary_path = self.dmn_status_path + '.tmp'
+        with open(temporary_path, 'w') as file:
+            json.dump(self.status(), file, indent = 2)
+        os.replace(temporary_path, self.dmn_status_path)
@@ -0,0 +1,185 @@
+# This module defines the DataStore class that keeps the local
+# copy of each FRED series as a pair of flat binary columns:
+# <CODE>.dates (int64 days since 1970-01-01) and
+# <CODE>.values (float64). New observations are written over
+# the columns from the first fetched date onward, so local
+# persistence is proportional to the delta, and reads are
+# zero-copy memory maps. The number of committed observations
+# is kept in <CODE>.length, so an interrupted write cannot pair
+# new dates with old values.
+
+# Import required resources.
+import os
+import numpy as np
+import pandas as pd
+
+# This is the base class for the FREDflow local data store.
+class DataStore:
+    # Static variables.
+    dts_kind = 'DTS'
+    dts_title = 'Data Store'
+    dts_date_type = np.dtype('<i8')
+    dts_value_type = np.dtype('<f8')
+
+    def __init__(self, path, csv_export = False, verbosity = 0):
+        self.dts_path = str(path)
+        self.dts_csv_export = bool(csv_export)
+        self.dts_verbosity = int(verbosity)
+
+    # Writes the Pandas series into both columns of a series after
+    # the given number of observations. Columns are written in place
+    # from that offset, and a column that would get shorter is
+    # rewritten to a temporary file and renamed instead, so memory
+    # maps still held by readers never extend past the end of a
+    # file. The committed length is lowered to keep before any
+    # stored observation is replaced and raised once both columns
+    # are written.
+    def append(self, code, pandas_series, keep):
+        dates = pandas_series.index.values.astype('datetime64[D]') \
+            .astype(self.dts_date_type)
+        values = pandas_series.to_numpy(self.dts_value_type)
+        if keep < self.length(code):
+            self.commit(code, keep)
+        for file_name, column in [(self.dates_file(code), dates),
+                                  (self.values_file(code), values)]:
+            offset = keep * column.itemsize
+            if not os.path.isfile(file_name):
+                with open(file_name, 'wb') as f:
+                    f.write(column.tobytes())
+            elif os.path.getsize(file_name) > offset + column.nbytes:
+                with open(file_name, 'rb') as f:
+                    kept = f.read(offset)
+                temporary_file = file_name + '.tmp'
+                with open(temporary_file, 'wb') as f:
+                    f.write(kept)
+                    f.write(column.tobytes())
+                os.replace(temporary_file, file_name)
+            else:
+                with open(file_name, 'r+b') as f:
+                    f.seek(offset)
+                    f.write(column.tobytes())
+        self.commit(code, keep + len(pandas_series))
+
+    # Returns the memory-mapped (zero-copy, read-only) dates as
+    # datetime64[D] and values as float64 for a series,
+    # or two empty arrays if the series is not stored.
+    def arrays(self, code):
+        self.import_csv(code)
+        length = self.length(code)
+        if length == 0:
+            return np.empty(0, 'datetime64[D]'), \
+                np.empty(0, self.dts_value_type)
+        dates = np.memmap(self.dates_file(code), self.dts_date_type,
+                          'r', shape = (length,))
+        values = np.memmap(self.values_file(code), self.dts_value_type,
+                           'r', shape = (length,))
+        return dates.view('datetime64[D]'), values
+
+    # Records the number of committed observations of a series,
+    # replacing the length file in one step.
+    def commit(self, code, length):
+        temporary_file = self.length_file(code) + '.tmp'
+        with open(temporary_file, 'w') as f:
+            f.write(str(int(length)))
+        os.replace(temporary_file, self.length_file(code))
+
+    # Returns and optionally sets CSV export of each written series.
+    def csv_export(self, ce = None):
+        if ce is not None:
+            self.dts_csv_export = bool(ce)
+        return self.dts_csv_export
+
+    # Returns the CSV file name for a series.
+    def csv_file(self, code):
+        return os.path.join(self.dts_path, code + '.csv')
+
+    # Returns the dates column file name for a series.
+    def dates_file(self, code):
+        return os.path.join(self.dts_path, code + '.dates')
+
+    # Returns True if the series is stored locally
+    # (or can be imported from an earlier CSV file).
+    def exists(self, code):
+        return self.length(code) > 0 or os.path.isfile(self.csv_file(code))
+
+    # Writes the stored series to data/<CODE>.csv.
+    def export_csv(self, code):
+        ds = self.read(code)
+        ds.index.name = "date"
+        ds.name = "value"
+        ds.to_csv(self.csv_file(code))
+
+    # Imports a CSV file written by earlier versions into the
+    # columnar store if the series is not stored yet.
+    def import_csv(self, code):
+        if self.length(code) > 0 or not os.path.isfile(self.csv_file(code)):
+            return
+        if self.verbosity() > 0:
+            print("Importing", self.csv_file(code), "...")
+        ds = pd.read_csv(self.csv_file(code), index_col=0,
+                         parse_dates=True).iloc[:, 0].dropna()
+        self.append(code, ds, 0)
+
+    # Returns the kind of object instantiated.
+    def kind(self):
+        return self.dts_kind
+
+    # Returns the number of observations stored for a series:
+    # the committed length, capped by the length of each column
+    # (series stored before the length file use the shorter one).
+    def length(self, code):
+        if not os.path.isfile(self.dates_file(code)) or \
+                not os.path.isfile(self.values_file(code)):
+            return 0
+        length = min(os.path.getsize(self.dates_file(code)) //
+                     self.dts_date_type.itemsize,
+                     os.path.getsize(self.values_file(code)) //
+                     self.dts_value_type.itemsize)
+        if os.path.isfile(self.length_file(code)):
+            with open(self.length_file(code), 'r') as f:
+                length = min(length, int(f.read()))
+        return length
+
+    # Returns the committed length file name for a series.
+    def length_file(self, code):
+        return os.path.join(self.dts_path, code + '.length')
+
+    # Returns a series as a Pandas series backed by the
+    # memory-mapped values.
+    def read(self, code):
+        dates, values = self.arrays(code)
+        return pd.Series(values, index = pd.DatetimeIndex(dates),
+                         copy = False)
+
+    # Returns the title of the instantiated object.
+    def title(self):
+        return self.dts_title
+
+    # Returns the values column file name for a series.
+    def values_file(self, code):
+        return os.path.join(self.dts_path, code + '.values')
+
+    # Return and optionally set the verbosity level for the object.
+    def verbosity(self, v = None):
+        if v is not None:
+            self.dts_verbosity = v
+        return self.dts_verbosity
+
+    # Writes fetched (delta) observations of a series, replacing
+    # stored observations from the first fetched date onward
+    # (the lookback window) and appending the rest.
+    # Returns the full series as read back from the store.
+    def write(self, code, pandas_series):
+        self.import_csv(code)
+        if len(pandas_series) == 0:
+            return self.read(code)
+        pandas_series = pandas_series.sort_index()
+        dates, values = self.arrays(code)
+        first_date = np.datetime64(pandas_series.index[0], 'D')
+        keep = int(np.searchsorted(dates, first_date))
+        # Release the memory maps before writing the files.
+        del dates, values
+        self.append(code, pandas_series, keep)
+        if self.csv_export():
+            self.export_csv(code)
+        return self.read(code)
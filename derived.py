@@ -0,0 +1,259 @@
+# This module computes derived series declared in
+# config/derived_series.csv (period averages of daily series,
+# period-over-period changes, year-over-year growth and moving
+# averages) from the series they are based on, right after those
+# are fetched and persisted. Only the window affected by new or
+# revised observations is recomputed, and the derived series are
+# stored and loaded like any other series, so dashboards read
+# small precomputed tables.
+
+# Import required resources.
+import numpy as np
+import pandas as pd
+from fred import *
+from instrument import *
+
+# This is the class for a series derived from another
+# (fetched or derived) series.
+class DerivedSeries(FREDSeries):
+    # Static variables.
+    pds_kind = 'DRV'
+    pds_title = 'Derived Series'
+    # Transforms that aggregate the source to the periods of the
+    # derived granularity, and those that keep its dates.
+    drv_aggregates = ['mean', 'sum', 'min', 'max', 'first', 'last']
+    drv_transforms = drv_aggregates + ['change', 'pct_change', 'yoy',
+                                       'moving_average']
+    # Days per period by granularity (added to the source lookback).
+    drv_period_days = {'DAILY': 1,
+                       'WEEKLY': 7,
+                       'MONTHLY': 31,
+                       'QUARTERLY': 92}
+    # Observations per year by granularity for year-over-year growth
+    # (daily series are compared with the same date a year earlier).
+    drv_periods_per_year = {'WEEKLY': 52,
+                            'MONTHLY': 12,
+                            'QUARTERLY': 4}
+
+    def __init__(self, code, name, source, transform, granularity = None,
+                 window = 1, verbosity = 0):
+        if transform not in self.drv_transforms:
+            raise ValueError("Unknown transform " + str(transform) +
+                             " for derived series " + str(code))
+        if not granularity:
+            granularity = source.granularity()
+        if granularity not in self.drv_period_days:
+            raise ValueError("Unknown granularity " + str(granularity) +
+                             " for derived series " + str(code))
+        # Only aggregates change the dates (to one per period), so
+        # other transforms keep the granularity of the source.
+        if transform not in self.drv_aggregates and \
+                granularity != source.granularity():
+            raise ValueError("Transform " + str(transform) + " of " +
+                             "derived series " + str(code) + " needs " +
+                             "the granularity of its source " +
+                             str(source.granularity()))
+        # Rows up to a period before the source lookback may be
+        # recomputed, so they are loaded again too.
+        super().__init__(code, name, granularity,
+                         source.lookback() +
+                         self.drv_period_days[granularity], verbosity)
+        self.drv_source = source
+        self.drv_transform = str(transform)
+        self.drv_window = int(window)
+
+    # Returns the derived series computed from a whole source series.
+    def compute(self, source_series):
+        transform = self.transform()
+        if transform in self.drv_aggregates:
+            return source_series.groupby(
+                self.periods(source_series.index.values)).agg(transform)
+        if transform == 'change':
+            return source_series - source_series.shift(self.window())
+        if transform == 'pct_change':
+            return 100.0 * (source_series /
+                            source_series.shift(self.window()) - 1.0)
+        if transform == 'yoy':
+            periods = self.drv_periods_per_year.get(
+                self.source().granularity())
+            if periods is not None:
+                prior_series = source_series.shift(periods)
+            else:
+                prior_series = pd.Series(
+                    source_series.reindex(source_series.index -
+                                          pd.DateOffset(years = 1))
+                    .to_numpy(), index = source_series.index)
+            return 100.0 * (source_series / prior_series - 1.0)
+        return source_series.rolling(self.window()).mean()
+
+    # Returns the derived series recomputed from the first date
+    # with new or revised source observations (or in full if None).
+    # Aggregates are recomputed from the start of the period holding
+    # the first date, and the other transforms read only as much
+    # earlier source history as they need.
+    def derive(self, source_series, first_date = None):
+        source_series = source_series.dropna()
+        if first_date is not None:
+            first_date = pd.Timestamp(first_date)
+            if self.transform() in self.drv_aggregates:
+                first_date = pd.Timestamp(self.periods(
+                    np.array([first_date.to_datetime64()]))[0])
+                source_series = source_series[first_date:]
+            elif self.transform() == 'yoy' and \
+                    self.source().granularity() not in \
+                    self.drv_periods_per_year:
+                source_series = source_series[first_date -
+                                              pd.DateOffset(years = 1):]
+            else:
+                position = int(source_series.index.searchsorted(first_date))
+                source_series = source_series.iloc[
+                    max(0, position - self.lag()):]
+        derived_series = self.compute(source_series)
+        if first_date is not None:
+            derived_series = derived_series[first_date:]
+        if self.verbosity() > 1:
+            print("Derived", len(derived_series), "value(s) of",
+                  self.code(), "from", self.source().code(), "...")
+        # Leave out the values without enough history (or a zero base).
+        return derived_series.replace([np.inf, -np.inf], np.nan).dropna()
+
+    # Returns the number of earlier source observations a
+    # (non-aggregate) transform needs for each derived value.
+    def lag(self):
+        if self.transform() == 'yoy':
+            return self.drv_periods_per_year.get(
+                self.source().granularity(), 0)
+        if self.transform() == 'moving_average':
+            return self.window() - 1
+        return self.window()
+
+    # Returns the first day of the period of the derived
+    # granularity holding each date (weeks start on Monday).
+    def periods(self, dates):
+        days = np.asarray(dates).astype('datetime64[D]')
+        if self.granularity() == 'WEEKLY':
+            day_numbers = days.astype(np.int64)
+            # 1970-01-01 was a Thursday.
+            return (day_numbers - (day_numbers + 3) % 7) \
+                .astype('datetime64[D]')
+        if self.granularity() == 'MONTHLY':
+            return days.astype('datetime64[M]').astype('datetime64[D]')
+        if self.granularity() == 'QUARTERLY':
+            months = days.astype('datetime64[M]').astype(np.int64)
+            return (months - months % 3).astype('datetime64[M]') \
+                .astype('datetime64[D]')
+        return days
+
+    # Returns the series the derived series is computed from.
+    def source(self):
+        return self.drv_source
+
+    # Returns the transform (such as mean or yoy).
+    def transform(self):
+        return self.drv_transform
+
+    # Returns the window of the transform (periods or observations).
+    def window(self):
+        return self.drv_window
+
+# This is the engine that keeps the derived series current:
+# after a series is persisted, the series derived from it (and
+# from those, in turn) are recomputed over the affected window
+# and written to the local data store.
+class DerivedEngine:
+    # Static variables.
+    dre_kind = 'DRE'
+    dre_title = 'Derived Series Engine'
+
+    def __init__(self, derived_configs, fred_series_list, data_store,
+                 verbosity = 0, instrument = null_instrument):
+        self.dre_data_store = data_store
+        self.dre_verbosity = int(verbosity)
+        self.dre_instrument = instrument
+        # Derived series by code, in dependency order, and the
+        # derived series of each source code.
+        self.dre_series = {}
+        self.dre_dependents = {}
+        sources = {fs.code(): fs for fs in fred_series_list}
+        pending = list(derived_configs)
+        while len(pending) > 0:
+            unresolved = [entry for entry in pending
+                          if entry.source not in sources]
+            if len(unresolved) == len(pending):
+                break
+            for entry in pending:
+                if entry.source not in sources:
+                    continue
+                try:
+                    dfs = DerivedSeries(entry.code, entry.name,
+                                        sources[entry.source],
+                                        entry.transform, entry.granularity,
+                                        entry.window, verbosity)
+                except ValueError as e:
+                    print("WARNING: Derived series", entry.code,
+                          "is misconfigured (" + str(e) + "); skipping it.")
+                    continue
+                sources[dfs.code()] = dfs
+                self.dre_series[dfs.code()] = dfs
+                self.dre_dependents.setdefault(entry.source, []).append(dfs)
+            pending = unresolved
+        for entry in pending:
+            print("WARNING: Source", entry.source, "of derived series",
+                  entry.code, "is not configured; skipping it.")
+
+    # Returns the derived series depending (directly or not) on
+    # any of the series, in dependency order.
+    def dependents(self, fred_series_list):
+        codes = {fs.code() for fs in fred_series_list}
+        dependents = []
+        for dfs in self.dre_series.values():
+            if dfs.source().code() in codes:
+                codes.add(dfs.code())
+                dependents.append(dfs)
+        return dependents
+
+    # Returns the kind of object instantiated.
+    def kind(self):
+        return self.dre_kind
+
+    # Recomputes the series derived from a persisted series over
+    # the window from the first new or revised date (in full for
+    # derived series not stored yet), writes them to the data store
+    # and returns a list of (derived series, full Pandas series).
+    def run(self, fred_series, pandas_series, first_date = None):
+        derived = []
+        for dfs in self.dre_dependents.get(fred_series.code(), []):
+            try:
+                with self.dre_instrument.timer(dfs.code(),
+                                               'transform') as timer:
+                    if self.dre_data_store.exists(dfs.code()):
+                        derived_series = dfs.derive(pandas_series, first_date)
+                    else:
+                        derived_series = dfs.derive(pandas_series)
+                    timer.rows = len(derived_series)
+                if len(derived_series) == 0:
+                    continue
+                derived_first_date = derived_series.index.min()
+                derived_series = self.dre_data_store.write(dfs.code(),
+                                                           derived_series)
+            except Exception as e:
+                print(f"Unexpected error deriving {dfs.code()} "
+                      f"from {fred_series.code()}: {e}")
+                continue
+            derived.append((dfs, derived_series))
+            derived += self.run(dfs, derived_series, derived_first_date)
+        return derived
+
+    # Returns the list of all derived series in dependency order.
+    def series(self):
+        return list(self.dre_series.values())
+
+    # Returns the title of the instantiated object.
+    def title(self):
+        return self.dre_title
+
+    # Return and optionally set the verbosity level for the object.
+    def verbosity(self, v = None):
+        if v is not None:
+            self.dre_verbosity = v
+        return self.dre_verbosity
@@ -12,6 +12,11 @@ class FREDSeries:
     # Static variables.
     pds_kind = 'PDS'
     pds_title = 'Pandas Series'
+    # Minimum hours between checks for new releases by granularity.
+    pds_recheck_hours = {'DAILY': 6,
+                         'WEEKLY': 12,
+                         'MONTHLY': 24,
+                         'QUARTERLY': 24}
 
     def __init__(self, code, name, granularity, lookback = 0, verbosity = 0):
         self.pds_code = str(code)
@@ -21,18 +26,80 @@ class FREDSeries:
         self.pds_verbosity = int(verbosity)
         self.pds_first_fetch = None
         self.pds_last_fetch = None
+        self.pds_last_checked = None
         self.pds_fetch_tally = 0
+        self.pds_last_observed = None
+        self.pds_last_updated = None
+        self.pds_release_updated = None
+        self.pds_release_checked = None
+        self.pds_fetched_observed = None
+        self.pds_last_vintage = None
+
+    # Checks the FRED series metadata and returns True if the
+    # series has a new release (its last_updated timestamp moved)
+    # or has never been fetched. The timestamp is only kept
+    # once the release is committed (fetched and loaded).
+    # The time of the check is kept for due(), for a new release
+    # also only once it is committed (so a failed release stays due).
+    def changed(self, fred):
+        if self.verbosity() > 0:
+            print("Checking", self.name(), "for new releases ...")
+        fred_info = fred.get_series_info(self.code())
+        self.pds_release_checked = time.time()
+        self.pds_release_updated = str(fred_info['last_updated'])
+        if self.verbosity() > 1:
+            print("Last updated:", self.last_updated(),
+                  "Release updated:", self.pds_release_updated)
+        if self.last_updated() is None or \
+                self.last_updated() != self.pds_release_updated:
+            return True
+        self.pds_last_checked = self.pds_release_checked
+        return False
 
     # Returns the code for the FRED series indicator.
     def code(self):
         return self.pds_code
 
+    # Keeps the FRED last_updated timestamp and check time of the
+    # release last checked and the last date fetched, once the
+    # release is fetched, persisted and loaded into every target
+    # database, so changed() returns False until the next release
+    # (and True again if a load failed) and a retry requests the
+    # same window (answered from the response cache).
+    def commit_release(self):
+        if getattr(self, 'pds_release_updated', None) is not None:
+            self.pds_last_updated = self.pds_release_updated
+            self.pds_last_checked = self.pds_release_checked
+        if getattr(self, 'pds_fetched_observed', None) is not None:
+            self.pds_last_observed = self.pds_fetched_observed
+
+    # Returns True if the minimum re-check interval for the
+    # granularity has passed since the last check for a new release.
+    def due(self):
+        if self.last_checked() is None:
+            return True
+        recheck_hours = self.pds_recheck_hours.get(self.granularity(), 0)
+        return time.time() - self.last_checked() >= recheck_hours * 3600
+
     # Fetches the FRED data and returns the Pandas series.
-    def fetch(self, fred):
-        if self.verbosity() > 0:
-            print("Fetching", self.name(), "data ...")
-        # Fetch the entire data series
-        fred_series = fred.get_series(self.code())
+    # After the first fetch only observations from the last
+    # observed date minus the lookback window are requested,
+    # unless a full fetch is asked for. The last date fetched
+    # becomes the last observed date when the release is committed.
+    def fetch(self, fred, full = False):
+        observation_start = self.observation_start()
+        if full or observation_start is None:
+            if self.verbosity() > 0:
+                print("Fetching", self.name(), "data ...")
+            # Fetch the entire data series
+            fred_series = fred.get_series(self.code())
+        else:
+            if self.verbosity() > 0:
+                print("Fetching", self.name(), "data from",
+                      observation_start.strftime('%Y-%m-%d'), "...")
+            # Fetch only the recent (delta) observations.
+            fred_series = fred.get_series(self.code(),
+                                          observation_start = observation_start)
         if self.verbosity() > 1:
             print("Fetched", fred_series.size, "values.")
         # Filter out any NaN values
@@ -46,12 +113,47 @@ class FREDSeries:
         self.pds_last_fetch = time.time()
         self.pds_fetch_tally += 1
         if fred_series_no_nan.size > 0:
+            self.pds_fetched_observed = fred_series_no_nan.index.max()
             return fred_series_no_nan
         else:
             return None
 
-    # Returns the granularity of the FRED series (DAILY, MONTHLY or QUARTERLY).
-    def granularity(self):
+    # Fetches the real-time (ALFRED) observations released since the
+    # last captured vintage (inclusive), or all vintages on the first
+    # capture, and returns a data frame of date, vintage and value
+    # sorted by vintage and date. Observations still valid at the
+    # start of the request carry its start date as their vintage.
+    def fetch_vintages(self, fred):
+        import pandas as pd
+        if self.last_vintage() is None:
+            if self.verbosity() > 0:
+                print("Fetching", self.name(), "vintages ...")
+            fred_releases = fred.get_series_all_releases(self.code())
+        else:
+            if self.verbosity() > 0:
+                print("Fetching", self.name(), "vintages from",
+                      self.last_vintage().strftime('%Y-%m-%d'), "...")
+            fred_releases = fred.get_series_all_releases(
+                self.code(),
+                realtime_start = self.last_vintage().strftime('%Y-%m-%d'))
+        if len(fred_releases) == 0:
+            return pd.DataFrame({'date': pd.DatetimeIndex([]),
+                                 'vintage': pd.DatetimeIndex([]),
+                                 'value': []})
+        fred_releases = pd.DataFrame({
+            'date': pd.to_datetime(fred_releases['date']),
+            'vintage': pd.to_datetime(fred_releases['realtime_start']),
+            'value': fred_releases['value'].astype(float)})
+        if self.verbosity() > 1:
+            print("Fetched", len(fred_releases), "real-time values.")
+        return fred_releases.sort_values(['vintage', 'date'],
+                                         ignore_index = True)
+
+    # Returns and optionally sets the granularity of the FRED series
+    # (DAILY, WEEKLY, MONTHLY or QUARTERLY).
+    def granularity(self, g = None):
+        if g is not None:
+            self.pds_granularity = str(g)
         return self.pds_granularity
 
     # Returns the kind of object instantiated.
@@ -65,10 +167,78 @@ class FREDSeries:
             self.pds_lookback = lb
         return self.pds_lookback
 
-    # Return the more descriptive name of the FRED series.
-    def name(self):
+    # Returns the time of the most recent check for a new release
+    # (seconds since the epoch) that found no release or one since
+    # committed, or None if there is none yet.
+    def last_checked(self):
+        # Series pickled before release check times lack the attribute.
+        return getattr(self, 'pds_last_checked', None)
+
+    # Returns the time of the most recent fetch (seconds since
+    # the epoch), or None if the series has not been fetched yet.
+    def last_fetch(self):
+        return self.pds_last_fetch
+
+    # Returns and optionally sets the most recent vintage (real-time
+    # release date) captured, or None if vintages were never captured.
+    def last_vintage(self, lv = None):
+        if lv is not None:
+            self.pds_last_vintage = lv
+        # Series pickled before vintage capture lack the attribute.
+        return getattr(self, 'pds_last_vintage', None)
+
+    # Returns the date of the most recent observation fetched
+    # in a committed release, or None if there is none yet.
+    def last_observed(self):
+        # Series pickled before incremental fetches lack the attribute.
+        return getattr(self, 'pds_last_observed', None)
+
+    # Returns the FRED last_updated timestamp of the release
+    # that was last fetched, or None if unknown.
+    def last_updated(self):
+        # Series pickled before conditional fetches lack the attribute.
+        return getattr(self, 'pds_last_updated', None)
+
+    # Return and optionally set the more descriptive name of the FRED series.
+    def name(self, n = None):
+        if n is not None:
+            self.pds_name = str(n)
         return self.pds_name
 
+    # Returns the first date to request in an incremental fetch,
+    # the last observed date minus the lookback window,
+    # or None if a full fetch is required.
+    def observation_start(self):
+        if self.last_observed() is None:
+            return None
+        return self.last_observed() - datetime.timedelta(days = self.lookback())
+
+    # Clears the last observed date and release timestamp so that
+    # the next fetch requests the entire data series.
+    def reset(self):
+        self.pds_last_observed = None
+        self.pds_fetched_observed = None
+        self.pds_last_updated = None
+
+    # Restores the fetch state saved by state(), typically
+    # when loading the series from the state store.
+    def restore(self, state):
+        self.pds_first_fetch = state['first_fetch']
+        self.pds_last_fetch = state['last_fetch']
+        self.pds_last_checked = state.get('last_checked')
+        self.pds_fetch_tally = int(state['fetch_tally'])
+        if state['last_observed'] is not None:
+            self.pds_last_observed = \
+                datetime.datetime.fromisoformat(state['last_observed'])
+        else:
+            self.pds_last_observed = None
+        self.pds_last_updated = state['last_updated']
+        if state.get('last_vintage') is not None:
+            self.pds_last_vintage = \
+                datetime.datetime.fromisoformat(state['last_vintage'])
+        else:
+            self.pds_last_vintage = None
+
     # Show some basic information about the FRED series,
     # typically used for debugging.
     def show(self):
@@ -80,9 +250,35 @@ class FREDSeries:
               "Verbosity:", self.verbosity())
         print("First Fetch:", self.pds_first_fetch,
               "Last Fetch:", self.pds_last_fetch,
+              "Last Checked:", self.last_checked(),
               "Fetch Tally:", self.pds_fetch_tally,
+              "Last Observed:", self.last_observed(),
+              "Last Updated:", self.last_updated(),
               "Wait:", self.wait())
 
+    # Returns the state of the series as a dictionary
+    # (used by the state store).
+    def state(self):
+        if self.last_observed() is not None:
+            last_observed = self.last_observed().strftime('%Y-%m-%d')
+        else:
+            last_observed = None
+        if self.last_vintage() is not None:
+            last_vintage = self.last_vintage().strftime('%Y-%m-%d')
+        else:
+            last_vintage = None
+        return {'code': self.code(),
+                'name': self.name(),
+                'granularity': self.granularity(),
+                'lookback': self.lookback(),
+                'first_fetch': self.pds_first_fetch,
+                'last_fetch': self.pds_last_fetch,
+                'last_checked': self.last_checked(),
+                'fetch_tally': self.pds_fetch_tally,
+                'last_observed': last_observed,
+                'last_updated': self.last_updated(),
+                'last_vintage': last_vintage}
+
     # Return the more descriptive title for the instantiated object.
     def title(self):
         return self.pds_title
@@ -0,0 +1,254 @@
+# This module defines the FredCache class, an on-disk response
+# cache around the FRED API client (fredapi.Fred) used by
+# FREDSeries.fetch. Fetched series are kept, keyed by series code
+# and request parameters, as compact binary (date, value) rows in
+# a single SQLite file, so re-runs and retried loads within the
+# time to live of a series' granularity send no HTTP requests.
+# The cache is bounded in size and evicts the least recently used
+# responses first. A cached response is stale as soon as the FRED
+# metadata of its series reports a newer release.
+
+# Import required resources.
+import sqlite3
+import threading
+import time
+import numpy as np
+import pandas as pd
+from fred import *
+
+# This is the base class for the FREDflow response cache.
+class FredCache:
+    # Static variables.
+    frc_kind = 'FRC'
+    frc_title = 'FRED Cache'
+    # Observation date as days since 1970-01-01.
+    frc_row_type = np.dtype([('date', '<i8'), ('value', '<f8')])
+    # Hours a cached response stays fresh by granularity,
+    # matching the re-check intervals for new releases.
+    frc_ttl_hours = dict(FREDSeries.pds_recheck_hours)
+
+    def __init__(self, fred, path, granularities = None,
+                 max_bytes = 256 * 1024 * 1024, refresh = False,
+                 verbosity = 0):
+        self.frc_fred = fred
+        self.frc_path = str(path)
+        self.frc_granularities = dict(granularities or {})
+        self.frc_max_bytes = int(max_bytes)
+        self.frc_refresh = bool(refresh)
+        self.frc_verbosity = int(verbosity)
+        self.frc_limiter = None
+        # FRED last_updated timestamps seen in this run by code.
+        self.frc_releases = {}
+        self.frc_hits = 0
+        self.frc_misses = 0
+        self.frc_lock = threading.Lock()
+        self.frc_connection = sqlite3.connect(self.frc_path,
+                                              check_same_thread = False,
+                                              timeout = 30)
+        with self.frc_lock:
+            self.frc_connection.execute("PRAGMA journal_mode = WAL")
+            self.frc_connection.execute("PRAGMA synchronous = NORMAL")
+            self.frc_connection.execute(
+                "CREATE TABLE IF NOT EXISTS fred_responses (" +
+                "request TEXT PRIMARY KEY, " +
+                "code TEXT NOT NULL, " +
+                "release_updated TEXT, " +
+                "created REAL NOT NULL, " +
+                "accessed REAL NOT NULL, " +
+                "bytes INTEGER NOT NULL, " +
+                "rows BLOB NOT NULL)")
+            self.frc_connection.execute(
+                "CREATE INDEX IF NOT EXISTS fred_responses_accessed " +
+                "ON fred_responses (accessed)")
+            self.frc_connection.commit()
+
+    # Other FRED API requests (such as the real-time releases)
+    # are passed on to the client uncached.
+    def __getattr__(self, name):
+        if name.startswith('frc_'):
+            raise AttributeError(name)
+        attribute = getattr(self.frc_fred, name)
+        if not callable(attribute):
+            return attribute
+        def request(*args, **kwargs):
+            self.limit()
+            return attribute(*args, **kwargs)
+        return request
+
+    # Deletes every cached response.
+    def clear(self):
+        with self.frc_lock:
+            with self.frc_connection:
+                self.frc_connection.execute("DELETE FROM fred_responses")
+
+    # Closes the cache.
+    def close(self):
+        with self.frc_lock:
+            self.frc_connection.close()
+
+    # Deletes the least recently used responses until the cache
+    # fits in its size bound.
+    # Returns the number of responses evicted.
+    def evict(self):
+        with self.frc_lock:
+            total_bytes = self.frc_connection.execute(
+                "SELECT COALESCE(SUM(bytes), 0) FROM fred_responses") \
+                .fetchone()[0]
+            if total_bytes <= self.frc_max_bytes:
+                return 0
+            evicted = []
+            for request, size in self.frc_connection.execute(
+                    "SELECT request, bytes FROM fred_responses " +
+                    "ORDER BY accessed"):
+                if total_bytes <= self.frc_max_bytes:
+                    break
+                evicted.append((request,))
+                total_bytes -= size
+            with self.frc_connection:
+                self.frc_connection.executemany(
+                    "DELETE FROM fred_responses WHERE request = ?", evicted)
+        if self.verbosity() > 1:
+            print("Evicted", len(evicted), "cached FRED response(s).")
+        return len(evicted)
+
+    # Returns a fetched series from the cache when fresh, or
+    # requests it from FRED (within the rate limit) and caches it.
+    def get_series(self, series_id, observation_start = None,
+                   observation_end = None, **kwargs):
+        request = self.request(series_id,
+                               dict(kwargs,
+                                    observation_start = observation_start,
+                                    observation_end = observation_end))
+        if not self.refresh():
+            pandas_series = self.lookup(series_id, request)
+            if pandas_series is not None:
+                return pandas_series
+        self.limit()
+        with self.frc_lock:
+            self.frc_misses += 1
+        pandas_series = self.frc_fred.get_series(
+            series_id, observation_start = observation_start,
+            observation_end = observation_end, **kwargs)
+        self.store(series_id, request, pandas_series)
+        return pandas_series
+
+    # Returns the FRED metadata of a series (never cached, since it
+    # reveals new releases) and keeps its last_updated timestamp
+    # to tell stale responses apart.
+    def get_series_info(self, series_id):
+        self.limit()
+        fred_info = self.frc_fred.get_series_info(series_id)
+        with self.frc_lock:
+            self.frc_releases[series_id] = str(fred_info['last_updated'])
+        return fred_info
+
+    # Returns and optionally updates the granularity of each
+    # series code, used for the time to live of its responses.
+    def granularities(self, g = None):
+        if g is not None:
+            self.frc_granularities.update(g)
+        return self.frc_granularities
+
+    # Returns the number of requests answered from the cache.
+    def hits(self):
+        return self.frc_hits
+
+    # Returns the kind of object instantiated.
+    def kind(self):
+        return self.frc_kind
+
+    # Sets the function called before each request sent to FRED,
+    # such as the fetch scheduler's rate limit, so cached
+    # responses do not use up the request budget.
+    def limiter(self, l):
+        self.frc_limiter = l
+
+    # Calls the limiter (if any) before a request is sent.
+    def limit(self):
+        if self.frc_limiter is not None:
+            self.frc_limiter()
+
+    # Returns a cached series that is fresh and of the latest
+    # release seen, or None.
+    def lookup(self, series_id, request):
+        now = time.time()
+        with self.frc_lock:
+            row = self.frc_connection.execute(
+                "SELECT release_updated, created, rows " +
+                "FROM fred_responses WHERE request = ?",
+                (request,)).fetchone()
+            release_updated = self.frc_releases.get(series_id)
+            if row is None or \
+                    now - row[1] > self.ttl_hours(series_id) * 3600 or \
+                    (release_updated is not None and
+                     row[0] != release_updated):
+                return None
+            with self.frc_connection:
+                self.frc_connection.execute(
+                    "UPDATE fred_responses SET accessed = ? " +
+                    "WHERE request = ?", (now, request))
+            self.frc_hits += 1
+        rows = np.frombuffer(row[2], self.frc_row_type)
+        if self.verbosity() > 0:
+            print("Using cached", series_id, "data ...")
+        return pd.Series(rows['value'],
+                         index = pd.DatetimeIndex(
+                             rows['date'].astype('datetime64[D]')))
+
+    # Returns the number of requests sent to FRED.
+    def misses(self):
+        return self.frc_misses
+
+    # Returns and optionally sets whether every request is sent
+    # to FRED (refreshing the cache) instead of answered from it.
+    def refresh(self, r = None):
+        if r is not None:
+            self.frc_refresh = bool(r)
+        return self.frc_refresh
+
+    # Returns the cache key of a request: the series code and
+    # the parameters that are set, in name order.
+    def request(self, series_id, parameters):
+        request = str(series_id)
+        for name in sorted(parameters):
+            value = parameters[name]
+            if value is None:
+                continue
+            if hasattr(value, 'strftime'):
+                value = value.strftime('%Y-%m-%d')
+            request += '&' + name + '=' + str(value)
+        return request
+
+    # Stores a fetched series (with the latest release seen)
+    # and evicts older responses if the cache is full.
+    def store(self, series_id, request, pandas_series):
+        rows = np.empty(len(pandas_series), self.frc_row_type)
+        rows['date'] = pandas_series.index.values.astype('datetime64[D]') \
+            .astype(np.int64)
+        rows['value'] = pandas_series.to_numpy(np.float64)
+        now = time.time()
+        with self.frc_lock:
+            with self.frc_connection:
+                self.frc_connection.execute(
+                    "INSERT OR REPLACE INTO fred_responses " +
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (request, series_id, self.frc_releases.get(series_id),
+                     now, now, rows.nbytes, rows.tobytes()))
+        self.evict()
+
+    # Returns the title of the instantiated object.
+    def title(self):
+        return self.frc_title
+
+    # Returns the hours a cached response of a series stays
+    # fresh, by its granularity (the shortest if unknown).
+    def ttl_hours(self, series_id):
+        return self.frc_ttl_hours.get(
+            self.frc_granularities.get(series_id),
+            min(self.frc_ttl_hours.values()))
+
+    # Return and optionally set the verbosity level for the object.
+    def verbosity(self, v = None):
+        if v is not None:
+            self.frc_verbosity = v
+        return self.frc_verbosity
@@ -0,0 +1,209 @@
+# This module defines the Instrument class that records, for each
+# series and target database, the time spent in each workflow stage
+# (fetch, transform, persist, bookmark, upsert) along with rows,
+# round trips and commits, and writes a JSON summary for each run.
+# A disabled instrument returns immediately, so the hooks can
+# stay in the hot loop.
+
+# Import required resources.
+import json
+import threading
+import time
+
+# Workflow stages that are timed.
+instrument_stages = ['fetch', 'transform', 'persist', 'bookmark', 'upsert']
+
+# Timing columns of the fredflow_logs table (see sql-ddl.txt).
+instrument_columns = [stage + '_secs' for stage in instrument_stages] + \
+    ['rows_per_sec', 'round_trips', 'commits']
+
+# This is a timer for one stage of one series (and target),
+# used as a context manager. Rows, round trips and commits
+# can be added before it exits.
+class StageTimer:
+    def __init__(self, instrument, code, stage, target = None):
+        self.st_instrument = instrument
+        self.st_code = code
+        self.st_stage = stage
+        self.st_target = target
+        self.st_start = None
+        self.rows = 0
+        self.round_trips = 0
+        self.commits = 0
+
+    def __enter__(self):
+        self.st_start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.st_instrument.record(self.st_code, self.st_stage,
+                                  time.perf_counter() - self.st_start,
+                                  self.st_target, self.rows,
+                                  self.round_trips, self.commits)
+        return False
+
+    # Returns the seconds since the timer started.
+    def elapsed(self):
+        return time.perf_counter() - self.st_start
+
+# This is a timer that records nothing, returned by a
+# disabled instrument (a new one each time, since callers
+# set its rows, round trips and commits from many threads).
+class NullTimer:
+    def __init__(self):
+        self.rows = 0
+        self.round_trips = 0
+        self.commits = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def elapsed(self):
+        return 0.0
+
+# This is the base class for FREDflow instrumentation.
+class Instrument:
+    # Static variables.
+    ins_kind = 'INS'
+    ins_title = 'Instrument'
+
+    def __init__(self, enabled = True, verbosity = 0, log_timings = False):
+        self.ins_enabled = bool(enabled)
+        self.ins_verbosity = int(verbosity)
+        self.ins_log_timings = bool(log_timings)
+        self.ins_start = time.time()
+        self.ins_lock = threading.Lock()
+        # Keyed by (code, target, stage), and the same records
+        # keyed by (target, stage) for each code.
+        self.ins_records = {}
+        self.ins_codes = {}
+
+    # Returns and optionally sets whether timings are recorded.
+    def enabled(self, e = None):
+        if e is not None:
+            self.ins_enabled = bool(e)
+        return self.ins_enabled
+
+    # Returns the kind of object instantiated.
+    def kind(self):
+        return self.ins_kind
+
+    # Records the seconds, rows, round trips and commits of one
+    # stage for a series (and target database).
+    def record(self, code, stage, secs, target = None, rows = 0,
+               round_trips = 0, commits = 0):
+        if not self.ins_enabled:
+            return
+        with self.ins_lock:
+            entry = self.ins_records.get((code, target, stage))
+            if entry is None:
+                entry = {'secs': 0.0, 'rows': 0, 'round_trips': 0,
+                         'commits': 0, 'calls': 0}
+                self.ins_records[(code, target, stage)] = entry
+                self.ins_codes.setdefault(code, {})[(target, stage)] = entry
+            entry['secs'] += secs
+            entry['rows'] += rows
+            entry['round_trips'] += round_trips
+            entry['commits'] += commits
+            entry['calls'] += 1
+
+    # Returns the fredflow_logs timing columns for a series load
+    # in progress on a target (timed by the upsert timer),
+    # or None when disabled or not logging timings.
+    def log_columns(self, code, target, timer):
+        if not self.ins_enabled or not self.ins_log_timings:
+            return None
+        timings = self.series(code, target)
+        timings['upsert'] = timer.elapsed()
+        columns = {stage + '_secs': round(timings.get(stage, 0.0), 3)
+                   for stage in instrument_stages}
+        if timings['upsert'] > 0:
+            columns['rows_per_sec'] = round(timer.rows / timings['upsert'], 1)
+        else:
+            columns['rows_per_sec'] = None
+        columns['round_trips'] = timer.round_trips
+        columns['commits'] = timer.commits
+        return columns
+
+    # Returns and optionally sets whether the timings are written
+    # to the fredflow_logs timing columns (see sql-ddl.txt).
+    def log_timings(self, lt = None):
+        if lt is not None:
+            self.ins_log_timings = bool(lt)
+        return self.ins_log_timings
+
+    # Returns the seconds per stage recorded for a series, including
+    # the stages that are not specific to a target database.
+    def series(self, code, target = None):
+        timings = {}
+        with self.ins_lock:
+            for (rec_target, stage), entry in \
+                    self.ins_codes.get(code, {}).items():
+                if rec_target in (None, target):
+                    timings[stage] = timings.get(stage, 0.0) + entry['secs']
+        return timings
+
+    # Clears the records and restarts the clock, so a long-running
+    # caller (the daemon) can write a summary for each batch.
+    def reset(self):
+        with self.ins_lock:
+            self.ins_start = time.time()
+            self.ins_records = {}
+            self.ins_codes = {}
+
+    # Returns a summary of the run: totals per stage (with rows per
+    # second) and the per-series, per-target stage records.
+    def summary(self):
+        stages = {}
+        series = []
+        with self.ins_lock:
+            for (code, target, stage), entry in \
+                    sorted(self.ins_records.items(),
+                           key = lambda item: tuple(map(str, item[0]))):
+                total = stages.setdefault(
+                    stage, {'secs': 0.0, 'rows': 0, 'round_trips': 0,
+                            'commits': 0, 'calls': 0})
+                for name in total:
+                    total[name] += entry[name]
+                series.append(dict(entry, code = code, target = target,
+                                   stage = stage))
+        for total in stages.values():
+            if total['secs'] > 0 and total['rows'] > 0:
+                total['rows_per_sec'] = total['rows'] / total['secs']
+        return {'start': time.strftime('%Y-%m-%dT%H:%M:%S',
+                                       time.localtime(self.ins_start)),
+                'elapsed_secs': time.time() - self.ins_start,
+                'stages': stages,
+                'series': series}
+
+    # Returns a timer (context manager) for one stage of a series,
+    # or a no-op timer when disabled.
+    def timer(self, code, stage, target = None):
+        if not self.ins_enabled:
+            return NullTimer()
+        return StageTimer(self, code, stage, target)
+
+    # Returns the title of the instantiated object.
+    def title(self):
+        return self.ins_title
+
+    # Return and optionally set the verbosity level for the object.
+    def verbosity(self, v = None):
+        if v is not None:
+            self.ins_verbosity = v
+        return self.ins_verbosity
+
+    # Writes the run summary as JSON, if enabled.
+    def write(self, path):
+        if not self.ins_enabled:
+            return
+        with open(path, 'w') as file:
+            json.dump(self.summary(), file, indent = 2, default = str)
+        if self.verbosity() > 0:
+            print("Wrote run timings to", path, "...")
+
+# A disabled instrument used by default.
+null_instrument = Instrument(False)
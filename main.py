@@ -12,137 +12,588 @@
 # Anish Babu Gogineni (agogineni@usf.edu)
 #
 # Copyright 2025 - Present by University of South Florida (USF)
+#
+# Usage: python main.py [run | fetch | daemon | load | reconcile | status]
+#                       [--verbosity N]
 
 # Import required resources.
-import pandas as pd
-import pickle
+# Pandas, the FRED API client and the database drivers are
+# imported by the commands (and stages) that use them, so small
+# runs such as status checks start quickly.
+import argparse
+import json
 import os
+import socket
+import threading
+import time
 from config import *
-from fred import *
+from instrument import *
+from sink import *
+from state import *
 
 # Set basic parameters like debug verbosity level.
 verbosity = 3
-sleep_secs = 6
+# Concurrent fetch workers and FRED API requests per minute
+# (FRED allows roughly 120 requests per minute).
+fetch_workers = 4
+fetch_rpm = 100
+# Pipeline stage workers (load workers are per target database),
+# bounded queue size between stages and the seconds a target's
+# full load queue may block before that target skips a series.
+persist_workers = 1
+load_workers = 1
+queue_size = 8
+load_timeout = 300
+# Leave histories longer than this many rows for empty tables
+# to backfill.py (0 loads every history inline).
+backfill_rows = 5000
 config_path = 'config/'
 data_path = 'data/'
+# Also export each fetched series to data/<CODE>.csv.
+csv_export = False
+state_path = 'state/'
+# Pickled series from earlier versions are migrated to the state store.
 pickle_path = 'pickle/'
-skip_files = {'.gitkeep', '.gitignore'}
 oracle_db_enabled = True
+# Also load into the embedded SQLite databases in config/sqlite_db.csv.
+sqlite_db_enabled = False
 db_push_enabled = True
+# Fetch the entire history of every series instead of only
+# the observations since the last fetch (minus the lookback).
+fetch_full = False
+# Skip series whose FRED last_updated timestamp has not moved
+# (checked at most once per granularity re-check interval).
+fetch_conditional = True
+# Keep fetched series in an on-disk cache under the state path, answering
+# repeated requests within the re-check interval of their granularity
+# (unless a newer release is seen) without HTTP traffic, bounded to
+# fetch_cache_mb megabytes. Set fetch_refresh (or run with --refresh)
+# to send every request to FRED and refresh the cache.
+fetch_cache_enabled = True
+fetch_cache_mb = 256
+fetch_refresh = False
+# Use set-based bulk UPSERTs (False falls back to row-by-row functions).
+db_bulk_load = True
+# Compute Julian day numbers and calendar keys in Python for bulk UPSERTs
+# and optionally check them against Oracle's own TO_CHAR results at startup.
+db_client_keys = True
+db_check_keys = False
+# Time each stage per series and database and write a JSON run
+# summary to the state path (keeping the last instrument_keep),
+# optionally (db_log_timings) also storing the timings in the
+# fredflow_logs timing columns (see the ALTER in sql-ddl.txt).
+instrument_enabled = False
+instrument_keep = 20
+db_log_timings = False
+# Ping the enabled databases in parallel before loading, waiting at
+# most ping_timeout seconds, and skip those that do not answer.
+db_ping_enabled = True
+ping_timeout = 5
+# Capture the real-time (ALFRED) vintages of each fetched series and keep
+# the values that changed as revisions in data/<CODE>.revisions and the
+# fredflow_revisions table (see sql-ddl.txt).
+vintage_enabled = False
+# Share the catalogue between several runners (on one or more hosts):
+# each runner claims batches of shard_batch series through the
+# fredflow_leases table in the first enabled database (or in a local
+# SQLite stand-in under the state path), releases them when done and
+# skips series done by any runner within shard_round_secs. Leases of
+# crashed runners expire after shard_lease_secs.
+shard_enabled = False
+shard_batch = 50
+shard_lease_secs = 900
+shard_round_secs = 3600
+shard_lease_sqlite = False
+# Compute the derived series declared in config/derived_series.csv
+# (averages, changes, growth rates and moving averages) after their
+# source series are fetched, and load them like fetched series.
+# Create their tables first (see sql-ddl.txt).
+derived_enabled = False
+# Daemon mode (python main.py daemon) stays resident with warm FRED
+# clients and database connections and checks each series when due:
+# on the release dates of its FRED release from daemon_release_hour,
+# again every daemon_retry_minutes until the release shows up that
+# day, or (without a release calendar) after the re-check interval
+# of its granularity, and at least every daemon_max_hours. Upcoming
+# work and lag are written to the state path every daemon_status_secs.
+daemon_calendar = True
+daemon_release_hour = 9
+daemon_retry_minutes = 30
+daemon_max_hours = 168
+daemon_status_secs = 60
+# Compare the local data with each database by year (or month)
+# bucket checksums, comparing reconcile_workers series at once.
+reconcile_bucket = 'year'
+reconcile_workers = 4
 # Temporarily omit some series such as ['DFF']
 skip_list = []
 
-if verbosity > 0:
-    print("\nInitializing FREDflow ...")
-# Initialise FRED API key.
-fred = config_fred_api(config_path, verbosity)
-# Create a dictionary of FRED series with code and name.
-fred_dict = config_fred_dict(config_path, verbosity)
-fred_codes = set(fred_dict.keys())
-if verbosity > 1:
-    print(fred_dict)
-    print(fred_codes)
-    print(skip_list)
-
-# Read pickled FRED series objects that keep state.
-if verbosity > 0:
-    print("\nLoading pickled FRED series ...")
-pickled_series = []
-pickled_codes = set()
-files = os.listdir(pickle_path)
-for file in files:
-    if file not in skip_files:
-        if os.path.isfile(os.path.join(pickle_path, file)):
-            with open(os.path.join(pickle_path, file), 'rb') as f:
-                pfs = pickle.load(f)
-                pickled_series.append(pfs)
-                pickled_codes.add(pfs.code())
-if verbosity > 1:
-    print(pickled_codes)
-    print(pickled_series)
-
-if verbosity > 0:
-    print("\nReconfiguring pickled FRED series ...")
-reconfig_pickled_series(config_path, pickled_series, verbosity)
-
-# Instantiate new FRED series objects.
-if verbosity > 0:
-    print("\nInstantiating new FRED series ...")
-    if len(fred_codes - pickled_codes) > 0:
-        print(fred_codes - pickled_codes)
-    else:
-        print("No new FRED series.")
-# Instantiate any newly added series after loading pickled series.
-if len(fred_codes - pickled_codes) > 0:
-    new_series = config_fred_series(config_path,
-                                    fred_codes - pickled_codes,
-                                    pickled_series,
-                                    verbosity)
-    fred_series = pickled_series + new_series
-else:
-    fred_series = pickled_series
-if verbosity > 1:
-    for fs in fred_series:
-        fs.show()
-
-# Establish database connections, if enabled.
+
+# Reads the FRED series catalogue, loads and reconfigures the
+# stored series state and instantiates newly added series.
+# Returns the list of FRED series to process (minus the skip list).
+def load_fred_series(state_store):
+    # Read the FRED series catalogue once into a registry by code.
+    series_registry = SeriesRegistry(config_path, verbosity)
+    fred_codes = series_registry.codes()
+    if verbosity > 1:
+        print(series_registry.names())
+        print(skip_list)
+
+    # Load the FRED series state,
+    # migrating any pickled series from earlier versions first.
+    if verbosity > 0:
+        print("\nLoading FRED series state ...")
+    state_store.migrate(pickle_path)
+    stored_series = state_store.load()
+
+    # Compare the catalogue with the stored series in one pass.
+    added_codes, removed_codes, changed_series = \
+        series_registry.diff(stored_series)
+    if verbosity > 0:
+        print("\nRegistry changes:", len(added_codes), "added,",
+              len(removed_codes), "removed,", len(changed_series), "changed.")
+        if len(removed_codes) > 0:
+            print("No longer configured (state kept):", removed_codes)
+    stored_series = [sfs for sfs in stored_series if sfs.code() in fred_codes]
+    if verbosity > 1:
+        print([sfs.code() for sfs in stored_series])
+
+    if verbosity > 0:
+        print("\nReconfiguring stored FRED series ...")
+    state_store.save(series_registry.reconfigure(changed_series))
+
+    # Instantiate any newly added series after loading stored series.
+    if verbosity > 0:
+        print("\nInstantiating new FRED series ...")
+        if len(added_codes) > 0:
+            print(added_codes)
+        else:
+            print("No new FRED series.")
+    fred_series = stored_series + \
+        series_registry.instantiate(set(added_codes))
+    if verbosity > 1:
+        for fs in fred_series:
+            fs.show()
+    # Skip some series for development work.
+    return [fs for fs in fred_series if fs.code() not in skip_list]
+
+# Establishes the enabled database connections and returns
+# the databases that answer a ping (the targets of those that
+# do not are added to skipped_list, if given).
 # The FRED data could be downloaded for computations
 # and not persistent storage.
-if oracle_db_enabled:
-    oracle_db_list = config_oracle_databases(config_path, verbosity)
-    if verbosity > 2:
+def config_sinks(instrument, skipped_list = None):
+    if oracle_db_enabled:
+        oracle_db_list = config_oracle_databases(config_path, verbosity)
         for odb in oracle_db_list:
-            odb.show()
-else:
-    oracle_db_list = []
-if verbosity > 1:
-    for odb in oracle_db_list:
-        if odb.ping():
-            print("Database server", odb.host(), "up and running ...")
-        else:
-            print("Database server", odb.host(), "down and unreachable ...")
-
-# Fetch the data from the FRED API and
-# push to one or more databases.
-print("\nFetching FRED series ...")
-for fs in fred_series:
-    # Skip some series for development work.
-    if fs.code() in skip_list:
-        break
-    try:
-        ds = fs.fetch(fred)
-    except Exception as e:
-        print(f"Unexpected error: {e}")
-        ds = None
-    if ds is not None:
+            odb.bulk(db_bulk_load)
+            odb.client_keys(db_client_keys)
         if verbosity > 2:
-            print("\nFRED Series:", fs.name(), "-", fs.code())
-            print("Length:", len(ds))
-            print("Head:")
-            print(ds.head())
-            print("Tail:")
-            print(ds.tail())
-        # Pickle the FRED series for persistence.
-        with open('pickle/' + fs.code() + '.pkl', 'wb') as pkl_file:
-            pickle.dump(fs, pkl_file)
-        # Write series data to CSV file
-        # but add some header information first.
-        ds.index.name = "date"
-        ds.name = "value"
-        ds.to_csv(data_path + fs.code() + '.csv')
-        # Push via UPSERT operations to the specified database.
-        # Push to specified Oracle databases.
-        if db_push_enabled:
             for odb in oracle_db_list:
-                # Process only the required data using a bookmark.
-                bmark = odb.bookmark(fs)
-                if bmark is not None:
-                    adjusted_bmark = bmark - pd.Timedelta(days=fs.lookback())
-                    print("Bookmarks:", bmark, adjusted_bmark,
-                          "\nPandas Series Length:", len(ds[adjusted_bmark:]))
-                    # Process the data series if there are any rows.
-                    if len(ds[adjusted_bmark:]) > 0:
-                        odb.upsert(fs, ds[adjusted_bmark:])
-                else:
-                    odb.upsert(fs, ds)
-    time.sleep(sleep_secs)
+                odb.show()
+    else:
+        oracle_db_list = []
+    # Embedded SQLite databases need no server and share the
+    # table layout of the Oracle databases.
+    if sqlite_db_enabled:
+        sqlite_db_list = config_sqlite_databases(config_path, verbosity)
+    else:
+        sqlite_db_list = []
+    sink_list = oracle_db_list + sqlite_db_list
+    for sink in sink_list:
+        sink.instrument(instrument)
+    if db_ping_enabled:
+        responses = ping_sinks(sink_list, ping_timeout, verbosity)
+        for sink in sink_list:
+            if not responses[sink.target()]:
+                print("Skipping database", sink.target(), "for this run.")
+                sink.close()
+                if skipped_list is not None:
+                    skipped_list.append(sink.target())
+        sink_list = [sink for sink in sink_list if responses[sink.target()]]
+    if db_check_keys:
+        for odb in oracle_db_list:
+            if odb not in sink_list:
+                continue
+            key_mismatches = odb.check_keys()
+            if len(key_mismatches) > 0:
+                print("WARNING: Calendar keys differ from", odb.host(),
+                      "for", len(key_mismatches), "date(s), such as",
+                      key_mismatches[:5], "- disabling client keys.")
+                odb.client_keys(False)
+            elif verbosity > 0:
+                print("Calendar keys match", odb.host(), "...")
+    return sink_list
+
+# Returns the engine computing the derived series of the
+# FRED series (or None when disabled).
+def config_derived(fred_series, data_store, instrument = null_instrument):
+    if not derived_enabled:
+        return None
+    from derived import DerivedEngine
+    return DerivedEngine(config_derived_series(config_path, verbosity),
+                         fred_series, data_store, verbosity, instrument)
+
+# Writes the run summary of an enabled instrument to the state
+# path and deletes all but the last instrument_keep summaries.
+def write_timings(instrument):
+    if not instrument.enabled():
+        return
+    instrument.write(state_path + 'fredflow_run_' +
+                     time.strftime('%Y%m%d_%H%M%S') + '.json')
+    summary_files = sorted(file for file in os.listdir(state_path)
+                           if file.startswith('fredflow_run_') and
+                           file.endswith('.json'))
+    for file in summary_files[:max(0, len(summary_files) - instrument_keep)]:
+        try:
+            os.remove(os.path.join(state_path, file))
+        except OSError as e:
+            print(f"Unexpected error deleting {file}: {e}")
+
+# Runs a batch of FRED series through the pipeline,
+# fetching only series with new releases, and captures the
+# vintages of those series (and of series never captured).
+# Unless check_due is False (the daemon decides when series
+# are due), series within their re-check interval are skipped.
+# Series in retry_list (that failed before) are fetched again
+# without checking for a new release.
+def run_batch(fetch_list, fetch_scheduler, fred_pipeline,
+              vintage_capture = None, check_due = True, retry_list = None):
+    batch_list = fetch_list
+    if fetch_conditional and not fetch_full:
+        print("\nChecking FRED series for new releases ...")
+        retry_codes = {fs.code() for fs in retry_list or []}
+        check_list = [fs for fs in fetch_list
+                      if fs.code() not in retry_codes and
+                      (fs.due() or not check_due)]
+        changed_list = fetch_scheduler.changed(check_list)
+        # Keep the check times of series without a new release.
+        changed_codes = {fs.code() for fs in changed_list}
+        fred_pipeline.save([fs for fs in check_list
+                            if fs.code() not in changed_codes])
+        fetch_list = changed_list + \
+            [fs for fs in fetch_list if fs.code() in retry_codes]
+    fred_pipeline.run(fetch_list)
+    if vintage_capture is not None:
+        print("\nCapturing FRED series vintages ...")
+        fetch_codes = {fs.code() for fs in fetch_list}
+        vintage_capture.run([fs for fs in batch_list
+                             if fs.code() in fetch_codes or
+                             fs.last_vintage() is None])
+
+# Renews the leases of a claimed batch every third of the lease
+# time until the batch is done, warning if any lease was lost.
+def renew_leases(lease_db, codes, worker, batch_done):
+    while not batch_done.wait(shard_lease_secs / 3):
+        try:
+            renewed = lease_db.renew(codes, worker, shard_lease_secs)
+        except Exception as e:
+            print(f"Unexpected error renewing the leases of {worker}: {e}")
+            continue
+        if renewed < len(codes):
+            print("WARNING: Worker", worker, "lost",
+                  len(codes) - renewed, "lease(s) of its batch.")
+
+# Runs the FRED series in batches claimed through the lease
+# table, so several runners can share the catalogue.
+# The leases of a batch are renewed every third of the lease
+# time while it runs, so long batches are not claimed twice.
+# An empty claim is retried while claimable series remain.
+# Failed series are released for other runners to retry.
+def run_shards(fetch_list, fetch_scheduler, fred_pipeline, sink_list,
+               vintage_capture = None):
+    from sqlitedb import SQLiteDB
+    worker = socket.gethostname() + ':' + str(os.getpid())
+    if shard_lease_sqlite or len(sink_list) == 0:
+        lease_db = SQLiteDB(state_path + 'fredflow_leases.db', 'leases',
+                            verbosity)
+    else:
+        lease_db = sink_list[0]
+    for sink in sink_list:
+        sink.worker(worker)
+    fetch_dict = {fs.code(): fs for fs in fetch_list}
+    attempted = set()
+    empty_claims = 0
+    while True:
+        remaining = [code for code in fetch_dict if code not in attempted]
+        claimed = lease_db.claim(remaining, worker, shard_batch,
+                                 shard_lease_secs, shard_round_secs)
+        if len(claimed) == 0:
+            # Another runner's claim may hold the claimable rows
+            # locked for a moment, so try again while any remain.
+            empty_claims += 1
+            if empty_claims > 10 or \
+                    len(lease_db.claimable(remaining,
+                                           shard_round_secs)) == 0:
+                break
+            time.sleep(1)
+            continue
+        empty_claims = 0
+        attempted.update(claimed)
+        batch_done = threading.Event()
+        renewer = threading.Thread(target = renew_leases,
+                                   args = (lease_db, claimed, worker,
+                                           batch_done))
+        renewer.start()
+        try:
+            run_batch([fetch_dict[code] for code in claimed],
+                      fetch_scheduler, fred_pipeline, vintage_capture)
+        finally:
+            batch_done.set()
+            renewer.join()
+            failures = fred_pipeline.failures()
+            lease_db.release([code for code in claimed
+                              if code not in failures], worker)
+            lease_db.release([code for code in claimed
+                              if code in failures], worker, False)
+    print("Worker", worker, "processed", len(attempted), "series.")
+    if lease_db not in sink_list:
+        lease_db.close()
+
+# Fetches the data from the FRED API and, unless fetch_only,
+# pushes it to one or more databases, once or (as a daemon)
+# whenever series are due.
+def command_run(fetch_only = False, daemon = False):
+    from datastore import DataStore
+    from pipeline import Pipeline
+    from scheduler import FetchScheduler
+    if verbosity > 0:
+        print("\nInitializing FREDflow ...")
+    instrument = Instrument(instrument_enabled, verbosity, db_log_timings)
+    # Initialise FRED API key.
+    fred = config_fred_api(config_path, verbosity)
+    state_store = StateStore(state_path + 'fredflow_state.db', verbosity)
+    fetch_list = load_fred_series(state_store)
+    skipped_list = []
+    if db_push_enabled and not fetch_only:
+        sink_list = config_sinks(instrument, skipped_list)
+    else:
+        sink_list = []
+
+    print("\nFetching FRED series ...")
+    # Fall back to a full fetch when asked or when the local data is missing.
+    data_store = DataStore(data_path, csv_export, verbosity)
+    for fs in fetch_list:
+        if fetch_full or not data_store.exists(fs.code()):
+            fs.reset()
+    if fetch_cache_enabled:
+        from fredcache import FredCache
+        fred = FredCache(fred, state_path + 'fredflow_cache.db',
+                         {fs.code(): fs.granularity() for fs in fetch_list},
+                         fetch_cache_mb * 1024 * 1024, fetch_refresh,
+                         verbosity)
+    fetch_scheduler = FetchScheduler(fred, fetch_workers, fetch_rpm,
+                                     verbosity = verbosity)
+    # Run the fetch, persist and load stages as a pipeline. New
+    # releases count as done only once every database has them,
+    # so fetch-only runs and runs that skip a database leave them
+    # to be fetched again.
+    fred_pipeline = Pipeline(fetch_scheduler, sink_list,
+                             data_store, state_store,
+                             persist_workers, load_workers,
+                             queue_size, load_timeout, backfill_rows,
+                             verbosity, instrument,
+                             config_derived(fetch_list, data_store,
+                                            instrument),
+                             len(skipped_list) == 0 and
+                             (not db_push_enabled or not fetch_only))
+    if vintage_enabled:
+        from vintage import VintageCapture, VintageStore
+        vintage_capture = VintageCapture(fetch_scheduler,
+                                         VintageStore(data_path, verbosity),
+                                         state_store, sink_list, verbosity)
+    else:
+        vintage_capture = None
+    if daemon:
+        from daemon import FetchDaemon, ReleaseCalendar
+        # Cached responses cannot tell a new release apart
+        # without the release checks.
+        if fetch_cache_enabled and not fetch_conditional:
+            fred.refresh(True)
+        if daemon_calendar:
+            release_calendar = ReleaseCalendar(fred.api_key, fetch_scheduler,
+                                               verbosity = verbosity)
+        else:
+            release_calendar = None
+        # Each batch writes its own timings (and logs per-batch
+        # timings in fredflow_logs).
+        def run_daemon_batch(batch_list, retry_list):
+            run_batch(batch_list, fetch_scheduler, fred_pipeline,
+                      vintage_capture, False, retry_list)
+            write_timings(instrument)
+            instrument.reset()
+        FetchDaemon(fetch_list, run_daemon_batch, fred_pipeline,
+                    state_path + 'fredflow_daemon.json',
+                    release_calendar, daemon_release_hour,
+                    daemon_retry_minutes, daemon_max_hours,
+                    daemon_status_secs, verbosity).run()
+    elif shard_enabled:
+        run_shards(fetch_list, fetch_scheduler, fred_pipeline, sink_list,
+                   vintage_capture)
+    else:
+        run_batch(fetch_list, fetch_scheduler, fred_pipeline,
+                  vintage_capture)
+    if not daemon:
+        write_timings(instrument)
+    if fetch_cache_enabled:
+        if verbosity > 0:
+            print("FRED cache:", fred.hits(), "hit(s),", fred.misses(),
+                  "request(s) sent.")
+        fred.close()
+
+    # Release the database connections and state store.
+    for sink in sink_list:
+        sink.close()
+    state_store.close()
+
+# Loads the local data of every series into the enabled
+# databases without contacting the FRED API.
+def command_load():
+    from datastore import DataStore
+    from pipeline import Pipeline
+    instrument = Instrument(instrument_enabled, verbosity, db_log_timings)
+    state_store = StateStore(state_path + 'fredflow_state.db', verbosity)
+    fred_series = load_fred_series(state_store)
+    sink_list = config_sinks(instrument)
+    print("\nLoading local FRED series data ...")
+    data_store = DataStore(data_path, csv_export, verbosity)
+    derived_engine = config_derived(fred_series, data_store)
+    if derived_engine is not None:
+        fred_series = fred_series + derived_engine.series()
+    fred_pipeline = Pipeline(None, sink_list, data_store, state_store,
+                             persist_workers, load_workers,
+                             queue_size, load_timeout, backfill_rows,
+                             verbosity, instrument)
+    fred_pipeline.load(fred_series)
+    write_timings(instrument)
+    for sink in sink_list:
+        sink.close()
+    state_store.close()
+
+# Compares the local data of the series (or the given codes)
+# with each enabled database by bucket checksums and, unless
+# check_only, loads the buckets that differ again.
+def command_reconcile(codes = None, bucket = reconcile_bucket,
+                      check_only = False):
+    from datastore import DataStore
+    from reconcile import Reconcile
+    state_store = StateStore(state_path + 'fredflow_state.db', verbosity)
+    fred_series = load_fred_series(state_store)
+    state_store.close()
+    data_store = DataStore(data_path, verbosity = verbosity)
+    derived_engine = config_derived(fred_series, data_store)
+    if derived_engine is not None:
+        fred_series = fred_series + derived_engine.series()
+    if codes:
+        fred_series = [fs for fs in fred_series if fs.code() in codes]
+    fred_series = [fs for fs in fred_series if data_store.exists(fs.code())]
+    sink_list = config_sinks(null_instrument)
+    print("\nReconciling local FRED series data ...")
+    for sink in sink_list:
+        start = time.monotonic()
+        results = Reconcile(sink, data_store, bucket, not check_only,
+                            reconcile_workers, verbosity).run(fred_series)
+        print("Reconciled", len(results), "series with", sink.target() +
+              ":", sum(r[1] for r in results.values()), "of",
+              sum(r[0] for r in results.values()), "bucket(s) differed,",
+              sum(r[2] for r in results.values()), "row(s) reloaded in",
+              round(time.monotonic() - start, 1), "second(s).")
+        sink.close()
+
+# Shows the configured and stored series, those due for a
+# new release check and the most recent fetch, without
+# changing any state, and optionally pings the databases.
+def command_status(ping = False):
+    series_registry = SeriesRegistry(config_path)
+    state_store = StateStore(state_path + 'fredflow_state.db')
+    stored_series = state_store.load()
+    state_store.close()
+    added_codes, removed_codes, changed_series = \
+        series_registry.diff(stored_series)
+    stored_series = [sfs for sfs in stored_series
+                     if sfs.code() in series_registry]
+    last_fetches = [sfs.last_fetch() for sfs in stored_series
+                    if sfs.last_fetch() is not None]
+    print("Configured series:", len(series_registry))
+    print("Stored series:", len(stored_series),
+          "(" + str(len(removed_codes)), "no longer configured)")
+    print("New series:", len(added_codes))
+    print("Reconfigured series:", len(changed_series))
+    print("Due for a release check:",
+          sum(1 for sfs in stored_series if sfs.due()) + len(added_codes))
+    if len(last_fetches) > 0:
+        print("Last fetch:", time.strftime('%Y-%m-%d %H:%M:%S',
+                                           time.localtime(max(last_fetches))))
+    else:
+        print("Last fetch: never")
+    daemon_status_path = state_path + 'fredflow_daemon.json'
+    if os.path.isfile(daemon_status_path):
+        with open(daemon_status_path, 'r') as file:
+            daemon_status = json.load(file)
+        print("Daemon (pid " + str(daemon_status['pid']) + ") updated:",
+              daemon_status['updated'], "- runs:", daemon_status['runs'],
+              "- overdue:", daemon_status['overdue'],
+              "- max lag (secs):", daemon_status['max_lag_secs'])
+        for entry in daemon_status['upcoming'][:5]:
+            print("  Next:", entry['code'], "due", entry['due'],
+                  "(release " + entry.get('next_release', 'unknown') + ")")
+    if ping:
+        sink_list = []
+        if oracle_db_enabled:
+            sink_list += config_oracle_databases(config_path, 0)
+        if sqlite_db_enabled:
+            sink_list += config_sqlite_databases(config_path, 0)
+        ping_sinks(sink_list, ping_timeout, 1)
+        for sink in sink_list:
+            sink.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description = "Fetch FRED series and load them into the " +
+                      "configured databases.")
+    parser.add_argument('--verbosity', type = int, default = None,
+                        help = "override the verbosity set in main.py")
+    commands = parser.add_subparsers(dest = 'command')
+    run_parser = commands.add_parser('run',
+                                     help = "fetch and load (the default)")
+    fetch_parser = commands.add_parser('fetch',
+                                       help = "fetch and store locally only")
+    daemon_parser = commands.add_parser(
+        'daemon', help = "stay resident and fetch and load series when due")
+    for command_parser in [parser, run_parser, fetch_parser, daemon_parser]:
+        command_parser.add_argument('--refresh', action = 'store_true',
+                                    default = argparse.SUPPRESS,
+                                    help = "send every request to FRED " +
+                                           "instead of the cache")
+    commands.add_parser('load',
+                        help = "load the local data into the databases")
+    reconcile_parser = commands.add_parser(
+        'reconcile', help = "compare the local data with the databases " +
+                            "and reload the buckets that differ")
+    reconcile_parser.add_argument('codes', nargs = '*',
+                                  help = "series codes (default: all)")
+    reconcile_parser.add_argument('--bucket', choices = ['year', 'month'],
+                                  default = reconcile_bucket,
+                                  help = "checksum bucket")
+    reconcile_parser.add_argument('--check-only', action = 'store_true',
+                                  help = "report the differences only")
+    status_parser = commands.add_parser(
+        'status', help = "show the series state without fetching")
+    status_parser.add_argument('--ping', action = 'store_true',
+                               help = "also ping the enabled databases")
+    args = parser.parse_args()
+    if args.verbosity is not None:
+        verbosity = args.verbosity
+    if getattr(args, 'refresh', False):
+        fetch_refresh = True
+
+    if args.command == 'status':
+        command_status(args.ping)
+    elif args.command == 'reconcile':
+        command_reconcile(set(args.codes), args.bucket, args.check_only)
+    elif args.command == 'load':
+        command_load()
+    else:
+        command_run(fetch_only = args.command == 'fetch',
+                    daemon = args.command == 'daemon')
@@ -1,13 +1,95 @@
 import oracledb
+import threading
+import numpy as np
+from calkeys import *
+from sink import *
+
+# UPSERT function, key column and Oracle key expression
+# (matching the functions in sql-ddl.txt) for each granularity.
+upsert_granularities = {
+    'DAILY': ('UPSERT_DAY_FRED_SERIES', 'release_jdn',
+              "TO_NUMBER(TO_CHAR(s.release_date, 'J'))"),
+    'WEEKLY': ('UPSERT_WEK_FRED_SERIES', 'cal_week_key',
+               "TO_NUMBER(TO_CHAR(s.release_date, 'YYYY') || "
+               "TO_CHAR(s.release_date, 'WW'))"),
+    'MONTHLY': ('UPSERT_MON_FRED_SERIES', 'cal_month_key',
+                "TO_NUMBER(TO_CHAR(s.release_date, 'YYYY') || "
+                "TO_CHAR(s.release_date, 'MM'))"),
+    'QUARTERLY': ('UPSERT_QTR_FRED_SERIES', 'cal_quarter_key',
+                  "TO_NUMBER(TO_CHAR(s.release_date, 'YYYY') || "
+                  "TO_CHAR(s.release_date, 'Q'))")
+}
+
+# Returns a MERGE statement for a FRED series that binds
+# a date string and value per row and computes the
+# Julian day number and calendar key like the UPSERT functions.
+# With client keys, the release date, value, Julian day number
+# and calendar key are all bound (computed by calkeys.py)
+# and the MERGE is keyed on the table's primary key.
+def merge_statement(fred_series, client_keys = False):
+    key_column, key_expr = \
+        upsert_granularities[fred_series.granularity()][1:]
+    jdn_expr = "TO_NUMBER(TO_CHAR(s.release_date, 'J'))"
+    if client_keys:
+        source_columns = ":1 AS release_date, :2 AS data_value, " + \
+            ":3 AS release_jdn"
+        jdn_expr = "s.release_jdn"
+        if key_column != 'release_jdn':
+            source_columns += ", :4 AS " + key_column
+            key_expr = "s." + key_column
+        else:
+            key_expr = jdn_expr
+    else:
+        source_columns = "TO_DATE(:1, 'YYYY-MM-DD') AS release_date, " + \
+            ":2 AS data_value"
+    if key_column == 'release_jdn':
+        insert_columns = "release_date, data_value, release_jdn"
+        insert_values = "s.release_date, s.data_value, " + jdn_expr
+    else:
+        insert_columns = "release_date, data_value, release_jdn, " + \
+            key_column
+        insert_values = "s.release_date, s.data_value, " + jdn_expr + \
+            ", " + key_expr
+    sql_stmt = \
+        "MERGE INTO " + fred_series.code() + " t " + \
+        "USING (SELECT " + source_columns + " FROM dual) s " + \
+        "ON (t." + key_column + " = " + key_expr + ") " + \
+        "WHEN MATCHED THEN UPDATE SET " + \
+        "t.data_value = s.data_value, " + \
+        "t.last_updated = SYSTIMESTAMP " + \
+        "WHEN NOT MATCHED THEN INSERT (" + insert_columns + ") " + \
+        "VALUES (" + insert_values + ")"
+    return sql_stmt
+
+# Returns an INSERT statement for a FRED series that binds the
+# release date, value, Julian day number and any calendar key,
+# optionally as a direct-path (APPEND_VALUES) insert.
+def insert_statement(fred_series, direct_path = False):
+    key_column = upsert_granularities[fred_series.granularity()][1]
+    columns = ['release_date', 'data_value', 'release_jdn']
+    if key_column != 'release_jdn':
+        columns.append(key_column)
+    if direct_path:
+        hint = "/*+ APPEND_VALUES */ "
+    else:
+        hint = ""
+    sql_stmt = \
+        "INSERT " + hint + "INTO " + fred_series.code() + \
+        " (" + ", ".join(columns) + ") VALUES (" + \
+        ", ".join(":" + str(i + 1) for i in range(len(columns))) + ")"
+    return sql_stmt
 
 # This is the base class for an Oracle database
 # that includes connection information and methods.
-class OracleDB:
+class OracleDB(Sink):
     # Static variables.
     odb_kind = 'ODB'
     odb_title = 'Oracle DB'
 
-    def __init__(self, user, password, host, port, sid, name, verbosity = 0):
+    def __init__(self, user, password, host, port, sid, name, verbosity = 0,
+                 bulk = True, batch_size = 5000, client_keys = True,
+                 pool_min = 1, pool_max = 4, pool_increment = 1,
+                 stmt_cache = 40, timeout = 120):
         self.odb_user = str(user)
         self.odb_password = str(password)
         self.odb_host = str(host)
@@ -15,19 +97,47 @@ class OracleDB:
         self.odb_sid = str(sid)
         self.odb_name = str(name)
         self.odb_verbosity = int(verbosity)
+        self.odb_bulk = bool(bulk)
+        self.odb_batch_size = int(batch_size)
+        self.odb_client_keys = bool(client_keys)
+        self.odb_pool_min = int(pool_min)
+        self.odb_pool_max = int(pool_max)
+        self.odb_pool_increment = int(pool_increment)
+        self.odb_stmt_cache = int(stmt_cache)
+        self.odb_timeout = int(timeout)
+        self.odb_pool = None
+        self.odb_pool_lock = threading.Lock()
+        self.odb_bookmarks = {}
+        self.odb_bookmark_lock = threading.Lock()
+        # Codes of the series whose table was not found.
+        self.odb_missing = set()
+        self.odb_leases = set()
+        # Column names of the FREDflow log (looked up on first use).
+        self.odb_log_columns = None
+
+    # Returns and optionally sets the number of rows
+    # bound per round trip in bulk UPSERT mode.
+    def batch_size(self, bs = None):
+        if bs is not None:
+            self.odb_batch_size = int(bs)
+        return self.odb_batch_size
 
     # Returns the bookmark data for a given FRED series,
     # providing a place to begin UPSERTs for new data.
+    # Bookmarks cached by a bulk lookup are used when available.
+    # Raises an error if the bulk lookup found no table for the
+    # series, so its load fails instead of counting as done.
     def bookmark(self, fred_series):
+        with self.odb_bookmark_lock:
+            if fred_series.code() in self.odb_missing:
+                raise RuntimeError("Table " + fred_series.code() +
+                                   " not found in " + self.target())
+            if fred_series.code() in self.odb_bookmarks:
+                return self.odb_bookmarks[fred_series.code()]
         if self.verbosity() > 0:
             print("Fetching", fred_series.code(), "DB bookmark ...")
         max_release_date = None
-        with oracledb.connect(
-                user=self.odb_user,
-                password=self.odb_password,
-                host=self.odb_host,
-                port=self.odb_port,
-                service_name=self.odb_name) as connection:
+        with self.connection() as connection:
             # SELECT the maximum release data as a bookmark.
             sql_stmt = \
                 "SELECT MAX(release_date) FROM " + fred_series.code()
@@ -39,14 +149,207 @@ class OracleDB:
                     max_release_date = row  # Unpack the tuple into variables.
         return max_release_date[0]
 
-    # Establishes and returns an Oracle database connection.
+    # Looks up the bookmarks for many FRED series with one
+    # UNION ALL query per chunk of series and caches them for
+    # the run. Series without a table get a None bookmark
+    # (not cached, so a table created later is found).
+    # Returns a dictionary of code and maximum release date.
+    def bookmarks(self, fred_series_list, chunk_size = 200):
+        with self.odb_bookmark_lock:
+            codes = [fs.code() for fs in fred_series_list
+                     if fs.code() not in self.odb_bookmarks]
+            if len(codes) > 0:
+                if self.verbosity() > 0:
+                    print("Fetching", len(codes), "DB bookmark(s) from",
+                          self.host(), "...")
+                with self.connection() as connection:
+                    with connection.cursor() as cursor:
+                        # Find which series tables exist in one query.
+                        cursor.execute("SELECT table_name FROM user_tables")
+                        table_names = {row[0] for row in cursor}
+                        for code in codes:
+                            if code.upper() not in table_names:
+                                self.odb_missing.add(code)
+                            else:
+                                self.odb_missing.discard(code)
+                        codes = [code for code in codes
+                                 if code.upper() in table_names]
+                        # SELECT the maximum release dates as bookmarks.
+                        for i in range(0, len(codes), chunk_size):
+                            sql_stmt = " UNION ALL ".join(
+                                "SELECT '" + code + "', MAX(release_date) " +
+                                "FROM " + code
+                                for code in codes[i:i + chunk_size])
+                            cursor.execute(sql_stmt)
+                            for code, max_release_date in cursor:
+                                self.odb_bookmarks[code] = max_release_date
+            return {fs.code(): self.odb_bookmarks.get(fs.code())
+                    for fs in fred_series_list}
+
+    # Returns and optionally sets the bulk UPSERT mode.
+    # When False, rows are loaded one at a time using
+    # the UPSERT functions.
+    def bulk(self, b = None):
+        if b is not None:
+            self.odb_bulk = bool(b)
+        return self.odb_bulk
+
+    # Compares the Julian day numbers and calendar keys computed
+    # by calkeys.py with those computed by Oracle (as in the UPSERT
+    # functions) for every day in a date range, in one query.
+    # Returns a list of the dates that do not match.
+    def check_keys(self, start_date = '1900-01-01', end_date = '2100-12-31'):
+        days = np.arange(start_date, np.datetime64(end_date) + 1,
+                         dtype = 'datetime64[D]')
+        sql_stmt = \
+            "SELECT TO_NUMBER(TO_CHAR(d, 'J')), " + \
+            "TO_NUMBER(TO_CHAR(d, 'YYYY') || TO_CHAR(d, 'WW')), " + \
+            "TO_NUMBER(TO_CHAR(d, 'YYYY') || TO_CHAR(d, 'MM')), " + \
+            "TO_NUMBER(TO_CHAR(d, 'YYYY') || TO_CHAR(d, 'Q')) " + \
+            "FROM (SELECT TO_DATE(:1, 'YYYY-MM-DD') + LEVEL - 1 AS d " + \
+            "FROM dual CONNECT BY LEVEL <= :2) ORDER BY d"
+        with self.connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.arraysize = 10000
+                cursor.execute(sql_stmt, [str(days[0]), len(days)])
+                oracle_keys = np.array(cursor.fetchall(), dtype = np.int64)
+        client_keys = np.column_stack([julian_day_numbers(days),
+                                       cal_week_keys(days),
+                                       cal_month_keys(days),
+                                       cal_quarter_keys(days)])
+        mismatches = np.any(oracle_keys != client_keys, axis = 1)
+        return [str(day) for day in days[mismatches]]
+
+    # Returns the decimal places of the stored values (the scale of
+    # the data_value column) and a dictionary of bucket and
+    # (count, sum, hash) of the values scaled to integers,
+    # with one GROUP BY query.
+    def checksums(self, fred_series, bucket = 'year'):
+        bucket_format = {'year': 'YYYY', 'month': 'YYYY-MM'}[bucket]
+        if self.verbosity() > 1:
+            print("Fetching", fred_series.code(), "DB checksums ...")
+        sql_stmt = \
+            "SELECT bucket, decimals, COUNT(*), SUM(scaled_value), " + \
+            "SUM(MOD(MOD(scaled_value, :modulus) * " + \
+            "MOD(release_jdn * :multiplier + 1, :modulus), :modulus)) " + \
+            "FROM (SELECT TO_CHAR(t.release_date, '" + bucket_format + \
+            "') AS bucket, c.decimals, t.release_jdn, " + \
+            "ROUND(t.data_value * POWER(10, c.decimals)) AS scaled_value " + \
+            "FROM " + fred_series.code() + " t, " + \
+            "(SELECT NVL(MAX(data_scale), :decimals) AS decimals " + \
+            "FROM user_tab_columns WHERE table_name = :table_name " + \
+            "AND column_name = 'DATA_VALUE') c) " + \
+            "GROUP BY bucket, decimals"
+        # Named binds, as a repeated positional bind needs
+        # its own value outside PL/SQL.
+        sql_binds = {'modulus': checksum_modulus,
+                     'multiplier': checksum_multiplier,
+                     'decimals': checksum_decimals,
+                     'table_name': fred_series.code().upper()}
+        decimals = checksum_decimals
+        bucket_checksums = {}
+        with self.connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(sql_stmt, sql_binds)
+                for row in cursor:
+                    decimals = int(row[1])
+                    bucket_checksums[row[0]] = tuple(int(value)
+                                                     for value in row[2:])
+        return decimals, bucket_checksums
+
+    # Claims up to limit of the series codes for a worker through
+    # the fredflow_leases table. Claimable rows are locked with
+    # SKIP LOCKED, so runners claiming at the same time get disjoint
+    # series without waiting on each other (one may get none while
+    # another's claim holds the rows; see claimable).
+    # Lease times use the database clock, so runner clocks may differ.
+    # Returns the list of claimed codes.
+    def claim(self, codes, worker, limit, lease_secs = 900,
+              round_secs = 3600):
+        candidates = set(codes)
+        claimed = []
+        with self.connection() as connection:
+            with connection.cursor() as cursor:
+                # Add lease rows for series not seen before.
+                new_codes = candidates - self.odb_leases
+                if len(new_codes) > 0:
+                    cursor.executemany(
+                        "MERGE INTO fredflow_leases l " +
+                        "USING (SELECT :1 AS fred_series FROM dual) s " +
+                        "ON (l.fred_series = s.fred_series) " +
+                        "WHEN NOT MATCHED THEN INSERT (fred_series) " +
+                        "VALUES (s.fred_series)",
+                        [(code,) for code in new_codes])
+                    connection.commit()
+                    self.odb_leases |= new_codes
+                cursor.arraysize = limit
+                cursor.execute(
+                    "SELECT fred_series FROM fredflow_leases " +
+                    "WHERE (lease_expiry IS NULL " +
+                    "OR lease_expiry < SYSTIMESTAMP) " +
+                    "AND (released_tstamp IS NULL " +
+                    "OR released_tstamp < SYSTIMESTAMP - " +
+                    "NUMTODSINTERVAL(:1, 'SECOND')) " +
+                    "FOR UPDATE SKIP LOCKED",
+                    [round_secs])
+                for row in cursor:
+                    if row[0] in candidates:
+                        claimed.append(row[0])
+                        if len(claimed) >= limit:
+                            break
+                cursor.executemany(
+                    "UPDATE fredflow_leases SET " +
+                    "worker = :1, " +
+                    "lease_expiry = SYSTIMESTAMP + " +
+                    "NUMTODSINTERVAL(:2, 'SECOND') " +
+                    "WHERE fred_series = :3",
+                    [(worker, lease_secs, code) for code in claimed])
+            # The commit also unlocks rows fetched but not claimed.
+            connection.commit()
+        if self.verbosity() > 0:
+            print("Worker", worker, "claimed", len(claimed), "series ...")
+        return claimed
+
+    # Returns the series codes that could be claimed right now
+    # (without locking their rows).
+    def claimable(self, codes, round_secs = 3600):
+        candidates = set(codes)
+        with self.connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.arraysize = 1000
+                cursor.execute(
+                    "SELECT fred_series FROM fredflow_leases " +
+                    "WHERE (lease_expiry IS NULL " +
+                    "OR lease_expiry < SYSTIMESTAMP) " +
+                    "AND (released_tstamp IS NULL " +
+                    "OR released_tstamp < SYSTIMESTAMP - " +
+                    "NUMTODSINTERVAL(:1, 'SECOND'))",
+                    [round_secs])
+                return [row[0] for row in cursor if row[0] in candidates]
+
+    # Returns and optionally sets the client-side key mode for
+    # bulk UPSERTs. When True, the Julian day number and calendar
+    # keys are computed in Python and bound with the data.
+    def client_keys(self, ck = None):
+        if ck is not None:
+            self.odb_client_keys = bool(ck)
+        return self.odb_client_keys
+
+    # Closes the connection pool, if one has been created.
+    def close(self):
+        with self.odb_pool_lock:
+            if self.odb_pool is not None:
+                self.odb_pool.close(force = True)
+                self.odb_pool = None
+
+    # Borrows and returns an Oracle database connection from the pool.
+    # The connection goes back to the pool when closed
+    # (or at the end of a with block).
+    # Each round trip is limited by the timeout so that a slow
+    # server only holds up its own load worker.
     def connection(self):
-        oracle_conn = oracledb.connect(
-            user = self.odb_user,
-            password = self.odb_password,
-            host = self.odb_host,
-            port =  self.odb_port,
-            service_name  = self.odb_name)
+        oracle_conn = self.pool().acquire()
+        oracle_conn.call_timeout = self.odb_timeout * 1000
         return oracle_conn
 
     # Returns a row count for the specified FRED series
@@ -55,12 +358,7 @@ class OracleDB:
         if self.verbosity() > 0:
             print("Fetching", fred_series.code(), "DB row count ...")
         row_count = None
-        with oracledb.connect(
-                user=self.odb_user,
-                password=self.odb_password,
-                host=self.odb_host,
-                port=self.odb_port,
-                service_name=self.odb_name) as connection:
+        with self.connection() as connection:
             # SELECT COUNT(*) te get a row count.
             sql_stmt = \
                 "SELECT COUNT(*) FROM " + fred_series.code()
@@ -76,6 +374,39 @@ class OracleDB:
     def host(self):
         return self.odb_host
 
+    # Inserts a chunk of a FRED series (typically a date range
+    # of its history during a backfill) on its own pooled session
+    # and commits it. Any rows already in the chunk's date range
+    # are deleted first, so a chunk can be safely re-run.
+    # A direct-path insert is committed after each batch, as the
+    # table cannot be modified again in the same transaction.
+    # Returns the number of rows inserted.
+    def insert_chunk(self, fred_series, pandas_series, direct_path = False):
+        if len(pandas_series) == 0:
+            return 0
+        keys = calendar_keys(pandas_series.index.values,
+                             fred_series.granularity())
+        sql_data = list(zip(pandas_series.index.to_pydatetime(),
+                            pandas_series.astype(float).tolist(),
+                            *[key.tolist() for key in keys.values()]))
+        sql_stmt1 = \
+            "DELETE FROM " + fred_series.code() + " " + \
+            "WHERE release_date BETWEEN :1 AND :2"
+        sql_stmt2 = insert_statement(fred_series, direct_path)
+        with self.connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(sql_stmt1, [sql_data[0][0], sql_data[-1][0]])
+                for i in range(0, len(sql_data), self.batch_size()):
+                    cursor.executemany(sql_stmt2,
+                                       sql_data[i:i + self.batch_size()])
+                    if direct_path:
+                        connection.commit()
+            connection.commit()
+        # The cached bookmark (if any) may now be stale.
+        with self.odb_bookmark_lock:
+            self.odb_bookmarks.pop(fred_series.code(), None)
+        return len(sql_data)
+
     # Returns the kind of object instantiated.
     def kind(self):
         return self.odb_kind
@@ -91,12 +422,7 @@ class OracleDB:
         if self.verbosity() > 0:
             print("Pinging database server", self.host(), "...")
         response = False
-        with oracledb.connect(
-                user=self.odb_user,
-                password=self.odb_password,
-                host=self.odb_host,
-                port=self.odb_port,
-                service_name=self.odb_name) as connection:
+        with self.connection() as connection:
             # Use a classic Oracle DBMS test query.
             sql_stmt = "SELECT * FROM dual"
             with connection.cursor() as cursor:
@@ -110,6 +436,30 @@ class OracleDB:
                         response = True
         return response
 
+    # Returns the connection pool for the database, creating it
+    # on first use. Pooled sessions keep their statement caches
+    # warm across series.
+    def pool(self):
+        with self.odb_pool_lock:
+            if self.odb_pool is None:
+                if self.verbosity() > 0:
+                    print("Creating connection pool for",
+                          self.host(), "...")
+                self.odb_pool = oracledb.create_pool(
+                    user = self.odb_user,
+                    password = self.odb_password,
+                    host = self.odb_host,
+                    port = self.odb_port,
+                    service_name = self.odb_name,
+                    min = self.odb_pool_min,
+                    max = self.odb_pool_max,
+                    increment = self.odb_pool_increment,
+                    stmtcachesize = self.odb_stmt_cache,
+                    tcp_connect_timeout = self.odb_timeout,
+                    wait_timeout = self.odb_timeout * 1000,
+                    getmode = oracledb.POOL_GETMODE_TIMEDWAIT)
+        return self.odb_pool
+
     # Returns the port number being used for the database connection.
     def port(self):
         return self.odb_port
@@ -120,15 +470,70 @@ class OracleDB:
               "Code:", self.kind(),
               "User", self.user(),
               "Verbosity:", self.verbosity())
+        print("Bulk:", self.bulk(),
+              "Batch Size:", self.batch_size(),
+              "Client Keys:", self.client_keys(),
+              "Pool Min:", self.odb_pool_min,
+              "Pool Max:", self.odb_pool_max,
+              "Pool Increment:", self.odb_pool_increment,
+              "Statement Cache:", self.odb_stmt_cache,
+              "Timeout:", self.odb_timeout)
         print("Host:", self.host(),
               "Port:", self.port(),
               "SID:", self.sid(),
               "Name:", self.name())
 
+    # Releases the leases of a worker on series codes, marking
+    # them done for the round if completed.
+    def release(self, codes, worker, completed = True):
+        if len(codes) == 0:
+            return
+        if completed:
+            sql_stmt = \
+                "UPDATE fredflow_leases SET " + \
+                "lease_expiry = NULL, " + \
+                "released_tstamp = SYSTIMESTAMP " + \
+                "WHERE fred_series = :1 AND worker = :2"
+        else:
+            sql_stmt = \
+                "UPDATE fredflow_leases SET " + \
+                "lease_expiry = NULL " + \
+                "WHERE fred_series = :1 AND worker = :2"
+        with self.connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.executemany(sql_stmt,
+                                   [(code, worker) for code in codes])
+            connection.commit()
+
+    # Extends the leases a worker still holds on series codes to
+    # lease_secs from now. Returns the number of leases renewed.
+    def renew(self, codes, worker, lease_secs = 900):
+        if len(codes) == 0:
+            return 0
+        sql_stmt = \
+            "UPDATE fredflow_leases SET " + \
+            "lease_expiry = SYSTIMESTAMP + NUMTODSINTERVAL(:1, 'SECOND') " + \
+            "WHERE fred_series = :2 AND worker = :3 " + \
+            "AND lease_expiry IS NOT NULL"
+        with self.connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.executemany(sql_stmt,
+                                   [(lease_secs, code, worker)
+                                    for code in codes],
+                                   arraydmlrowcounts = True)
+                renewed = sum(cursor.getarraydmlrowcounts())
+            connection.commit()
+        return renewed
+
     # Returns the SID (system identifier) being used for the database connection.
     def sid(self):
         return self.odb_sid
 
+    # Returns the target database as host:port/name,
+    # used to report per-target results.
+    def target(self):
+        return self.host() + ':' + str(self.port()) + '/' + self.name()
+
     # Returns  the title of the instantiated object.
     def title(self):
         return self.odb_title
@@ -136,80 +541,247 @@ class OracleDB:
     # Takes a FRED series and fetched Pandas series for
     # updating the data table for the series (via UPSERT operations).
     # The FREDflow log is also updated.
+    # Bulk mode (the default) binds the series as arrays and
+    # runs a set-based MERGE in large batches, while the
+    # row-by-row UPSERT functions remain available as a fallback.
     def upsert(self, fred_series, pandas_series):
         if self.verbosity() > 0:
-            print("Loading", len(pds_series), "row(s) of",
+            print("Loading", len(pandas_series), "row(s) of",
                   fred_series.code(), "via UPSERT operations ...")
-        with oracledb.connect(
-                user=self.odb_user,
-                password=self.odb_password,
-                host=self.odb_host,
-                port=self.odb_port,
-                service_name=self.odb_name) as connection:
+        if fred_series.granularity() not in upsert_granularities:
+            print("WARNING: Granularity of ",
+                  fred_series.code(),
+                  " unknown.")
+            return 0
+        timer = self.instrument().timer(fred_series.code(), 'upsert',
+                                        self.target())
+        with timer, self.connection() as connection:
             # INSERT into FREDflow log with start time.
-            sql_stmt1 = \
-                "INSERT INTO fredflow_logs (fred_series, row_tally) " + \
-                "VALUES (:1, :2)"
-            sql_data1 = [fred_series.code(), 0]
+            self.log_start(connection, fred_series)
+            try:
+                if self.bulk():
+                    row_tally = self.upsert_bulk(connection,
+                                                 fred_series,
+                                                 pandas_series)
+                    # One executemany per batch and one commit.
+                    timer.round_trips = 2 + \
+                        -(-len(pandas_series) // self.batch_size()) + 1
+                    timer.commits = 2
+                else:
+                    row_tally = self.upsert_rows(connection,
+                                                 fred_series,
+                                                 pandas_series)
+                    # One call per row and one commit per success.
+                    timer.round_trips = 2 + len(pandas_series) + row_tally
+                    timer.commits = 1 + row_tally
+            except Exception as e:
+                # Record the failure in the FREDflow log if the
+                # database is still reachable, then re-raise.
+                try:
+                    connection.rollback()
+                    self.log_stop(connection, fred_series, 0,
+                                  'FAILED', str(e))
+                except Exception:
+                    pass
+                raise
+            # UPDATE FREDflow log with stop time (and the timings,
+            # counting the log UPDATE and its commit).
+            timer.rows = row_tally
+            timer.round_trips += 2
+            timer.commits += 1
+            self.log_stop(connection, fred_series, row_tally,
+                          columns = self.instrument().log_columns(
+                              fred_series.code(), self.target(), timer))
+        # Keep any cached bookmark current for the rest of the run.
+        with self.odb_bookmark_lock:
+            if fred_series.code() in self.odb_bookmarks and \
+                    len(pandas_series) > 0:
+                max_release_date = pandas_series.index.max().to_pydatetime()
+                if self.odb_bookmarks[fred_series.code()] is None or \
+                        self.odb_bookmarks[fred_series.code()] < \
+                        max_release_date:
+                    self.odb_bookmarks[fred_series.code()] = max_release_date
+        return row_tally
+
+    # Updates (or inserts) revision deltas of a FRED series in the
+    # fredflow_revisions table with a MERGE over batches of bound
+    # rows and a single commit. Missing (NaN) values are stored as NULL.
+    # Returns the number of rows merged.
+    def upsert_revisions(self, fred_series, revisions):
+        if len(revisions) == 0:
+            return 0
+        sql_stmt = \
+            "MERGE INTO fredflow_revisions t " + \
+            "USING (SELECT :1 AS fred_series, :2 AS release_date, " + \
+            ":3 AS vintage_date, :4 AS data_value FROM dual) s " + \
+            "ON (t.fred_series = s.fred_series " + \
+            "AND t.release_date = s.release_date " + \
+            "AND t.vintage_date = s.vintage_date) " + \
+            "WHEN MATCHED THEN UPDATE SET t.data_value = s.data_value " + \
+            "WHEN NOT MATCHED THEN INSERT " + \
+            "(fred_series, release_date, vintage_date, data_value) " + \
+            "VALUES (s.fred_series, s.release_date, s.vintage_date, " + \
+            "s.data_value)"
+        sql_data = list(zip([fred_series.code()] * len(revisions),
+                            revisions['date'].dt.to_pydatetime(),
+                            revisions['vintage'].dt.to_pydatetime(),
+                            revisions['value'].astype(object)
+                            .where(revisions['value'].notna(), None)))
+        with self.connection() as connection:
             with connection.cursor() as cursor:
-                cursor.execute(sql_stmt1, sql_data1)
-                connection.commit()
-            # Process the pandas series row-by-row.
-            row_tally = 0
-            for pds_tstamp, pds_val in pandas_series.items():
-                # Convert timestamp to a date string - hardened code.
-                pds_date = pds_tstamp.strftime('%Y-%m-%d')  # Guaranteed YYYY-MM-DD
+                for i in range(0, len(sql_data), self.batch_size()):
+                    cursor.executemany(sql_stmt,
+                                       sql_data[i:i + self.batch_size()])
+            connection.commit()
+        return len(sql_data)
+
+    # Loads the pandas series with a single MERGE statement
+    # executed over batches of bound arrays and
+    # a single commit for the whole series.
+    # Returns the number of rows merged.
+    def upsert_bulk(self, connection, fred_series, pandas_series):
+        sql_stmt = merge_statement(fred_series, self.client_keys())
+        with self.instrument().timer(fred_series.code(), 'transform',
+                                     self.target()) as timer:
+            if self.client_keys():
+                # Bind the whole series as (date, value, keys) rows
+                # with the keys computed for all rows at once.
+                keys = calendar_keys(pandas_series.index.values,
+                                     fred_series.granularity())
+                sql_data = list(zip(pandas_series.index.to_pydatetime(),
+                                    pandas_series.astype(float).tolist(),
+                                    *[key.tolist() for key in keys.values()]))
+            else:
+                # Bind the whole series as (date string, value) rows.
+                sql_data = list(zip(pandas_series.index.strftime('%Y-%m-%d'),
+                                    pandas_series.astype(float).tolist()))
+            timer.rows = len(sql_data)
+        row_tally = 0
+        with connection.cursor() as cursor:
+            for i in range(0, len(sql_data), self.batch_size()):
+                batch = sql_data[i:i + self.batch_size()]
+                cursor.executemany(sql_stmt, batch,
+                                   batcherrors = True,
+                                   arraydmlrowcounts = True)
+                row_tally += sum(cursor.getarraydmlrowcounts())
+                for error in cursor.getbatcherrors():
+                    print("WARNING: UPSERT for ",
+                          fred_series.code(), " failed on ",
+                          batch[error.offset][0], ":", error.message)
+                if self.verbosity() > 1:
+                    print("Merged", min(i + len(batch), len(sql_data)),
+                          "of", len(sql_data), "row(s) of",
+                          fred_series.code(), "...")
+        connection.commit()
+        return row_tally
+
+    # Loads the pandas series row-by-row using the
+    # UPSERT functions defined in sql-ddl.txt.
+    # Returns the number of rows processed.
+    def upsert_rows(self, connection, fred_series, pandas_series):
+        upsert_func = upsert_granularities[fred_series.granularity()][0]
+        # Process the pandas series row-by-row.
+        row_tally = 0
+        for pds_tstamp, pds_val in pandas_series.items():
+            # Convert timestamp to a date string - hardened code.
+            pds_date = pds_tstamp.strftime('%Y-%m-%d')  # Guaranteed YYYY-MM-DD
+            if self.verbosity() > 2:
                 print(f"Date: {pds_date}, Type: {type(pds_tstamp)}, "
                       f"Value: {pds_val}")
-                sql_parameters = [fred_series.code(), pds_date, pds_val]
-                with connection.cursor() as cursor:
-                    ret_val = 0
-                    if fred_series.granularity() == 'QUARTERLY':
-                        ret_val = cursor.callfunc(
-                            "UPSERT_QTR_FRED_SERIES",
-                            int,
-                            sql_parameters
-                    )
-                    elif fred_series.granularity() == 'MONTHLY':
-                        ret_val = cursor.callfunc(
-                            "UPSERT_MON_FRED_SERIES",
-                            int,
-                            sql_parameters
-                    )
-                    elif fred_series.granularity() == 'WEEKLY':
-                        ret_val = cursor.callfunc(
-                            "UPSERT_WEK_FRED_SERIES",
-                            int,
-                            sql_parameters
-                    )
-                    elif fred_series.granularity() == 'DAILY':
-                        ret_val = cursor.callfunc(
-                            "UPSERT_DAY_FRED_SERIES",
-                            int,
-                            sql_parameters
-                    )
-                    else:
-                        print("WARNING: Granularity of ",
-                              fred_series.code(),
-                              " unknown.")
-                    # Check return value and commit if successful.
-                    if ret_val > 0:
-                        row_tally += 1
-                        connection.commit()
-                    else:
-                        print("WARNING: UPSERT for ",
-                              fred_series.code(), " failed.")
-            # UPDATE FREDflow log with stop time.
-            sql_stmt2 = \
-                "UPDATE fredflow_logs SET " + \
-                "row_tally = :1, "  + \
-                "stop_tstamp = SYSTIMESTAMP " + \
-                "WHERE fred_series = :2 " + \
-                "AND stop_tstamp IS NULL"
-            sql_data2 = [row_tally, fred_series.code()]
+            sql_parameters = [fred_series.code(), pds_date, pds_val]
             with connection.cursor() as cursor:
-                cursor.execute(sql_stmt2, sql_data2)
-                connection.commit()
+                ret_val = cursor.callfunc(
+                    upsert_func,
+                    int,
+                    sql_parameters
+                )
+                # Check return value and commit if successful.
+                if ret_val > 0:
+                    row_tally += 1
+                    connection.commit()
+                else:
+                    print("WARNING: UPSERT for ",
+                          fred_series.code(), " failed.")
+        return row_tally
+
+    # Returns the set of (lower case) column names of the FREDflow
+    # log, looked up once, so logs created before the target, status,
+    # timing or worker columns were added keep working.
+    def log_columns(self, connection):
+        with self.odb_bookmark_lock:
+            if self.odb_log_columns is not None:
+                return self.odb_log_columns
+        sql_stmt = \
+            "SELECT LOWER(column_name) FROM user_tab_columns " + \
+            "WHERE table_name = 'FREDFLOW_LOGS'"
+        with connection.cursor() as cursor:
+            cursor.execute(sql_stmt)
+            log_columns = {row[0] for row in cursor}
+        with self.odb_bookmark_lock:
+            self.odb_log_columns = log_columns
+        if 'status' not in log_columns:
+            print("WARNING: fredflow_logs on", self.host(), "lacks the " +
+                  "target and status columns (see sql-ddl.txt).")
+        return log_columns
+
+    # INSERTs a FREDflow log entry with the start time, target,
+    # status and (in a sharded run) worker, leaving out the columns
+    # the log does not have.
+    def log_start(self, connection, fred_series):
+        sql_columns = {'fred_series': fred_series.code(),
+                       'row_tally': 0,
+                       'target': self.target(),
+                       'status': 'RUNNING'}
+        if self.worker() is not None:
+            sql_columns['worker'] = self.worker()
+        log_columns = self.log_columns(connection)
+        sql_columns = {column: value
+                       for column, value in sql_columns.items()
+                       if column in log_columns}
+        sql_stmt = \
+            "INSERT INTO fredflow_logs (" + \
+            ", ".join(sql_columns) + ") VALUES (" + \
+            ", ".join(":" + str(i + 1) for i in range(len(sql_columns))) + \
+            ")"
+        with connection.cursor() as cursor:
+            cursor.execute(sql_stmt, list(sql_columns.values()))
+            connection.commit()
+
+    # UPDATEs the open FREDflow log entry of the series for this
+    # target with the row tally, status (SUCCESS or FAILED) and stop time,
+    # plus any timing columns (see instrument.py), leaving out
+    # the columns the log does not have.
+    def log_stop(self, connection, fred_series, row_tally,
+                 status = 'SUCCESS', message = None, columns = None):
+        if message is not None:
+            message = message[:4000]
+        sql_columns = {'row_tally': row_tally,
+                       'status': status,
+                       'message': message}
+        if columns is not None:
+            sql_columns.update(columns)
+        log_columns = self.log_columns(connection)
+        sql_columns = {column: value
+                       for column, value in sql_columns.items()
+                       if column in log_columns}
+        sql_stmt = \
+            "UPDATE fredflow_logs SET " + \
+            "".join(column + " = :" + str(i + 1) + ", "
+                    for i, column in enumerate(sql_columns)) + \
+            "stop_tstamp = SYSTIMESTAMP " + \
+            "WHERE fred_series = :" + str(len(sql_columns) + 1) + " " + \
+            "AND stop_tstamp IS NULL"
+        sql_data = list(sql_columns.values()) + [fred_series.code()]
+        # Leave the open entries of other targets and workers alone.
+        if 'target' in log_columns:
+            sql_stmt += " AND target = :" + str(len(sql_data) + 1)
+            sql_data.append(self.target())
+        if self.worker() is not None and 'worker' in log_columns:
+            sql_stmt += " AND worker = :" + str(len(sql_data) + 1)
+            sql_data.append(self.worker())
+        with connection.cursor() as cursor:
+            cursor.execute(sql_stmt, sql_data)
+            connection.commit()
 
     # Returns the user being used for the database connection.
     def user(self):
@@ -0,0 +1,347 @@
+# This module defines a staged pipeline that overlaps fetching
+# FRED series over HTTP, persisting them locally and loading them
+# into the target databases. Bounded queues between the stages
+# keep memory use capped by the queue depth.
+
+# Import required resources.
+import queue
+import threading
+import pandas as pd
+from instrument import *
+
+# Marks the end of the work flowing into a stage.
+end_of_stage = None
+
+# Writes fetched (delta) observations to the local data store
+# and saves the FRED series state.
+# Returns the full Pandas series.
+def persist_series(fred_series, pandas_series, data_store, state_store,
+                   verbosity = 0):
+    # The data store replaces the lookback window and appends
+    # new observations.
+    pandas_series = data_store.write(fred_series.code(), pandas_series)
+    if verbosity > 2:
+        print("\nFRED Series:", fred_series.name(), "-", fred_series.code())
+        print("Length:", len(pandas_series))
+        print("Head:")
+        print(pandas_series.head())
+        print("Tail:")
+        print(pandas_series.tail())
+    # Save the FRED series state once its data is persisted.
+    state_store.save(fred_series)
+    return pandas_series
+
+# Pushes a Pandas series via UPSERT operations to a database,
+# processing only the required data using a bookmark.
+# Histories longer than backfill_rows (if set) are left for
+# backfill.py when the table is still empty.
+# Returns the number of rows loaded, or None if deferred.
+def load_series(odb, fred_series, pandas_series, verbosity = 0,
+                backfill_rows = 0):
+    with odb.instrument().timer(fred_series.code(), 'bookmark',
+                                odb.target()):
+        bmark = odb.bookmark(fred_series)
+    if bmark is not None:
+        adjusted_bmark = bmark - pd.Timedelta(days=fred_series.lookback())
+        if verbosity > 1:
+            print("Bookmarks:", bmark, adjusted_bmark,
+                  "\nPandas Series Length:",
+                  len(pandas_series[adjusted_bmark:]))
+        # Process the data series if there are any rows.
+        if len(pandas_series[adjusted_bmark:]) > 0:
+            return odb.upsert(fred_series, pandas_series[adjusted_bmark:])
+        return 0
+    if backfill_rows > 0 and len(pandas_series) > backfill_rows:
+        print("Deferring", len(pandas_series), "row(s) of",
+              fred_series.code(), "for", odb.target(),
+              "to backfill.py ...")
+        return None
+    return odb.upsert(fred_series, pandas_series)
+
+# This is the pipeline that runs the fetch, persist and load
+# stages on their own threads connected by bounded queues,
+# so series N+1 downloads while series N loads.
+# Each target database has its own load queue and workers,
+# so a fetched series is pushed to all targets at once and
+# a slow or unreachable target only holds up itself.
+class Pipeline:
+    def __init__(self, fetch_scheduler, sink_list, data_store,
+                 state_store, persist_workers = 1, load_workers = 1,
+                 queue_size = 8, load_timeout = 300, backfill_rows = 0,
+                 verbosity = 0, instrument = null_instrument,
+                 derived_engine = None, complete = True):
+        self.ppl_scheduler = fetch_scheduler
+        self.ppl_databases = list(sink_list)
+        self.ppl_data_store = data_store
+        self.ppl_state_store = state_store
+        self.ppl_persist_workers = int(persist_workers)
+        self.ppl_load_workers = int(load_workers)
+        self.ppl_queue_size = int(queue_size)
+        self.ppl_load_timeout = float(load_timeout)
+        self.ppl_backfill_rows = int(backfill_rows)
+        self.ppl_verbosity = int(verbosity)
+        self.ppl_instrument = instrument
+        self.ppl_derived = derived_engine
+        # Whether every configured target database takes part
+        # (none was skipped), so releases can be committed.
+        self.ppl_complete = bool(complete)
+        self.ppl_tally = {'fetched': 0, 'persisted': 0, 'derived': 0,
+                          'loaded': 0, 'deferred': 0, 'failed': 0}
+        self.ppl_targets = {odb.target(): {'loaded': 0, 'deferred': 0,
+                                           'failed': 0}
+                            for odb in self.ppl_databases}
+        self.ppl_failures = set()
+        # Loads outstanding (plus one while queuing) and whether
+        # all succeeded so far, by code of the fetched series.
+        self.ppl_pending = {}
+        self.ppl_lock = threading.Lock()
+
+    # Adds to one of the pipeline tallies and optionally
+    # to the tally of a target database (thread-safe).
+    # The codes of failed series are also kept.
+    def count(self, tally, n = 1, target = None, code = None):
+        with self.ppl_lock:
+            self.ppl_tally[tally] += n
+            if tally == 'failed' and code is not None:
+                self.ppl_failures.add(code)
+            if target is not None:
+                self.ppl_targets[target][tally] += n
+
+    # Computes the series derived from a persisted series over the
+    # window from the first fetched date and queues them for every
+    # target database like fetched series (as part of its release).
+    def derive(self, fred_series, pandas_series, first_date, load_queues):
+        for dfs, dds in self.ppl_derived.run(fred_series, pandas_series,
+                                             first_date):
+            self.count('derived')
+            self.queue_loads(dfs, dds, load_queues, fred_series)
+
+    # Fetch stage: runs the rate-limited scheduler and
+    # queues each fetched series for persistence. The scheduler
+    # keeps no more fetches in flight than the queue can take.
+    def fetch_stage(self, fred_series_list, persist_queue):
+        try:
+            for fs, ds, latency in self.ppl_scheduler.run(
+                    fred_series_list, backlog = self.ppl_queue_size):
+                if ds is None:
+                    self.count('failed', code = fs.code())
+                    continue
+                self.count('fetched')
+                self.ppl_instrument.record(fs.code(), 'fetch', latency,
+                                           rows = len(ds))
+                persist_queue.put((fs, ds))
+        finally:
+            for i in range(self.ppl_persist_workers):
+                persist_queue.put(end_of_stage)
+
+    # Persist stage: writes the local data and series state,
+    # queues each full series for every target database and
+    # then computes the series derived from it. The release is
+    # committed once all of those loads are done (see settle).
+    def persist_stage(self, persist_queue, load_queues):
+        while True:
+            item = persist_queue.get()
+            if item is end_of_stage:
+                break
+            fs, ds = item
+            first_date = ds.index.min()
+            try:
+                with self.ppl_instrument.timer(fs.code(), 'persist') as timer:
+                    timer.rows = len(ds)
+                    ds = persist_series(fs, ds, self.ppl_data_store,
+                                        self.ppl_state_store,
+                                        self.verbosity())
+                self.count('persisted')
+            except Exception as e:
+                print(f"Unexpected error persisting {fs.code()}: {e}")
+                self.count('failed', code = fs.code())
+                continue
+            self.hold(fs)
+            self.queue_loads(fs, ds, load_queues, fs)
+            if self.ppl_derived is not None:
+                self.derive(fs, ds, first_date, load_queues)
+            self.settle(fs, True)
+
+    # Load stage: pushes each series to one target database.
+    # The bookmarks for all series are looked up in bulk first
+    # (once per target) so that no per-series query is needed;
+    # their time is recorded against all series ('*').
+    def load_stage(self, odb, load_queue, fred_series_list):
+        try:
+            with odb.instrument().timer('*', 'bookmark', odb.target()):
+                odb.bookmarks(fred_series_list)
+        except Exception as e:
+            print(f"Unexpected error fetching bookmarks "
+                  f"from {odb.target()}: {e}")
+        while True:
+            item = load_queue.get()
+            if item is end_of_stage:
+                break
+            fs, ds, release = item
+            try:
+                if load_series(odb, fs, ds, self.verbosity(),
+                               self.ppl_backfill_rows) is None:
+                    self.count('deferred', target = odb.target())
+                else:
+                    self.count('loaded', target = odb.target())
+                self.settle(release, True)
+            except Exception as e:
+                print(f"Unexpected error loading {fs.code()} "
+                      f"into {odb.target()}: {e}")
+                self.count('failed', target = odb.target(), code = fs.code())
+                self.settle(release, False)
+
+    # Adds an outstanding load to the release of a fetched series.
+    def hold(self, fred_series):
+        with self.ppl_lock:
+            pending = self.ppl_pending.setdefault(fred_series.code(),
+                                                  [0, True])
+            pending[0] += 1
+
+    # Returns the tallies of fetched, persisted, derived, loaded,
+    # deferred (to backfill.py) and failed work so far.
+    def tally(self):
+        with self.ppl_lock:
+            return dict(self.ppl_tally)
+
+    # Returns the loaded, deferred and failed tallies for each target database.
+    def targets(self):
+        with self.ppl_lock:
+            return {target: dict(tally)
+                    for target, tally in self.ppl_targets.items()}
+
+    # Returns the set of codes of the series that failed in any
+    # stage (or for any target) so far, optionally clearing it
+    # (so a long-running caller sees the failures of each run).
+    def failures(self, reset = False):
+        with self.ppl_lock:
+            failures = set(self.ppl_failures)
+            if reset:
+                self.ppl_failures.clear()
+        return failures
+
+    # Loads the series already in the local data store into the
+    # target databases without fetching (a load-only run) and
+    # returns the tallies of loaded, deferred and failed work.
+    def load(self, fred_series_list):
+        load_queues, load_threads = self.start_loads(fred_series_list)
+        for fs in fred_series_list:
+            if not self.ppl_data_store.exists(fs.code()):
+                continue
+            self.queue_loads(fs, self.ppl_data_store.read(fs.code()),
+                             load_queues)
+        self.stop_loads(load_queues, load_threads)
+        return dict(self.ppl_tally)
+
+    # Queues a full series for every target database, as part of
+    # the release of a fetched series (if any).
+    # A target whose queue stays full past the load timeout
+    # misses the series rather than stalling the others.
+    def queue_loads(self, fred_series, pandas_series, load_queues,
+                    release = None):
+        for odb, load_queue in load_queues:
+            if release is not None:
+                self.hold(release)
+            try:
+                load_queue.put((fred_series, pandas_series, release),
+                               timeout = self.ppl_load_timeout)
+            except queue.Full:
+                print(f"Timed out queuing {fred_series.code()} "
+                      f"for {odb.target()}.")
+                self.count('failed', target = odb.target(),
+                           code = fred_series.code())
+                self.settle(release, False)
+
+    # Runs the pipeline over the FRED series and returns the
+    # tallies of fetched, persisted, derived, loaded, deferred
+    # and failed work.
+    def run(self, fred_series_list):
+        persist_queue = queue.Queue(self.ppl_queue_size)
+        if self.ppl_derived is not None:
+            load_queues, load_threads = self.start_loads(
+                fred_series_list +
+                self.ppl_derived.dependents(fred_series_list))
+        else:
+            load_queues, load_threads = self.start_loads(fred_series_list)
+        persist_threads = [threading.Thread(target = self.persist_stage,
+                                            args = (persist_queue,
+                                                    load_queues))
+                           for i in range(self.ppl_persist_workers)]
+        for thread in persist_threads:
+            thread.start()
+        self.fetch_stage(fred_series_list, persist_queue)
+        for thread in persist_threads:
+            thread.join()
+        self.stop_loads(load_queues, load_threads)
+        return dict(self.ppl_tally)
+
+    # Saves the state of series that were checked for a new
+    # release but are not fetched, so their check time counts
+    # towards the re-check interval of the next run.
+    def save(self, fred_series_list):
+        if len(fred_series_list) == 0:
+            return
+        try:
+            self.ppl_state_store.save(fred_series_list)
+        except Exception as e:
+            print(f"Unexpected error saving {len(fred_series_list)} "
+                  f"checked series: {e}")
+
+    # Settles an outstanding load of the release of a fetched
+    # series (a failed load of a derived series also counts as a
+    # failure of its source). Once all are settled, the release is
+    # committed (and the state saved) only if every load succeeded
+    # and no target was skipped, so the series is fetched and
+    # loaded again otherwise.
+    def settle(self, fred_series, succeeded):
+        if fred_series is None:
+            return
+        with self.ppl_lock:
+            pending = self.ppl_pending[fred_series.code()]
+            pending[0] -= 1
+            pending[1] = pending[1] and succeeded
+            if not succeeded:
+                self.ppl_failures.add(fred_series.code())
+            if pending[0] > 0:
+                return
+            del self.ppl_pending[fred_series.code()]
+        if not pending[1] or not self.ppl_complete:
+            return
+        fred_series.commit_release()
+        try:
+            self.ppl_state_store.save(fred_series)
+        except Exception as e:
+            print(f"Unexpected error saving {fred_series.code()}: {e}")
+
+    # Starts the load workers of every target database and
+    # returns their queues and threads.
+    def start_loads(self, fred_series_list):
+        load_queues = [(odb, queue.Queue(self.ppl_queue_size))
+                       for odb in self.ppl_databases]
+        load_threads = [threading.Thread(target = self.load_stage,
+                                         args = (odb, load_queue,
+                                                 fred_series_list))
+                        for odb, load_queue in load_queues
+                        for i in range(self.ppl_load_workers)]
+        for thread in load_threads:
+            thread.start()
+        return load_queues, load_threads
+
+    # Signals the end of the work to the load workers, waits
+    # for them to finish and reports the tallies.
+    def stop_loads(self, load_queues, load_threads):
+        for odb, load_queue in load_queues:
+            for i in range(self.ppl_load_workers):
+                load_queue.put(end_of_stage)
+        for thread in load_threads:
+            thread.join()
+        if self.verbosity() > 0:
+            print("Pipeline tallies:", self.ppl_tally)
+            for target, tally in self.targets().items():
+                print("Target", target, "tallies:", tally)
+
+    # Return and optionally set the verbosity level for the object.
+    def verbosity(self, v = None):
+        if v is not None:
+            self.ppl_verbosity = v
+        return self.ppl_verbosity
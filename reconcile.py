@@ -0,0 +1,142 @@
+# This module reconciles the local data of FRED series with a
+# target database without pulling every row: both sides compute
+# a count, a sum and a hash of the values for each year (or month)
+# bucket, the database in one query per series, and only the
+# buckets that differ are loaded again through the regular UPSERT.
+#
+# The values are compared as integers scaled to the decimal places
+# the database keeps (Oracle NUMBER(12,1) rounds GDP to one decimal),
+# and the hash adds up each scaled value times a weight derived
+# from its Julian day number, modulo checksum_modulus (see sink.py),
+# so a value moved to another date changes the hash.
+
+# Import required resources.
+import concurrent.futures
+import numpy as np
+from calkeys import *
+from sink import *
+
+# Returns the bucket keys ('YYYY' or 'YYYY-MM') of the dates.
+def bucket_keys(dates, bucket = 'year'):
+    unit = {'year': 'datetime64[Y]', 'month': 'datetime64[M]'}[bucket]
+    return np.datetime_as_string(as_days(dates).astype(unit))
+
+# Returns a dictionary of bucket key and (count, sum, hash) of the
+# values of a Pandas series scaled to the decimal places, computed
+# like Sink.checksums. Missing (NaN) values are left out.
+def series_checksums(pandas_series, decimals, bucket = 'year'):
+    pandas_series = pandas_series.dropna()
+    if len(pandas_series) == 0:
+        return {}
+    dates = as_days(pandas_series.index.values)
+    values = pandas_series.to_numpy(np.float64)
+    scaled = values * 10.0 ** decimals
+    # Round half away from zero, like Oracle ROUND. Values within
+    # floating point error of a half are rounded from their decimal
+    # form instead (see scaled_value).
+    fractions = np.abs(scaled) % 1.0
+    halves = np.flatnonzero(np.abs(fractions - 0.5) <=
+                            np.abs(scaled) * 1e-12 + 1e-9)
+    scaled = np.trunc(scaled + np.copysign(0.5, scaled)).astype(np.int64)
+    for i in halves:
+        scaled[i] = scaled_value(values[i], decimals)
+    weights = (julian_day_numbers(dates) * checksum_multiplier + 1) % \
+        checksum_modulus
+    hashes = np.fmod(np.fmod(scaled, checksum_modulus) * weights,
+                     checksum_modulus)
+    # The dates are sorted, so each bucket is a contiguous run.
+    keys, starts, counts = np.unique(bucket_keys(dates, bucket),
+                                     return_index = True,
+                                     return_counts = True)
+    sums = np.add.reduceat(scaled, starts)
+    hash_sums = np.add.reduceat(hashes, starts)
+    return {key: (int(count), int(total), int(hash_sum))
+            for key, count, total, hash_sum in
+            zip(keys.tolist(), counts, sums, hash_sums)}
+
+# This is the reconciliation of the local data with one
+# target database (any sink).
+class Reconcile:
+    # Static variables.
+    rcn_kind = 'RCN'
+    rcn_title = 'Reconcile'
+
+    def __init__(self, sink, data_store, bucket = 'year', repair = True,
+                 workers = 4, verbosity = 0):
+        self.rcn_sink = sink
+        self.rcn_data_store = data_store
+        self.rcn_bucket = str(bucket)
+        self.rcn_repair = bool(repair)
+        self.rcn_workers = int(workers)
+        self.rcn_verbosity = int(verbosity)
+
+    # Compares the local and database checksums of a series and,
+    # if repairing, loads the local rows of the buckets that differ.
+    # Returns a tuple of buckets compared, buckets that differ,
+    # rows loaded and buckets with rows only in the database
+    # (which an UPSERT cannot remove).
+    def compare(self, fred_series, loaded = True):
+        pandas_series = self.rcn_data_store.read(fred_series.code()).dropna()
+        if loaded:
+            decimals, db_checksums = self.rcn_sink.checksums(fred_series,
+                                                             self.rcn_bucket)
+        else:
+            decimals, db_checksums = checksum_decimals, {}
+        local_checksums = series_checksums(pandas_series, decimals,
+                                           self.rcn_bucket)
+        differ = sorted(key for key in local_checksums
+                        if db_checksums.get(key) != local_checksums[key])
+        db_only = [key for key in db_checksums
+                   if key not in local_checksums or
+                   db_checksums[key][0] > local_checksums[key][0]]
+        if self.verbosity() > 1 or \
+                (self.verbosity() > 0 and len(differ) > 0):
+            print(fred_series.code(), "on", self.rcn_sink.target() + ":",
+                  len(differ), "of", len(local_checksums),
+                  "bucket(s) differ", differ[:5])
+        if len(db_only) > 0:
+            print("WARNING:", fred_series.code(), "on",
+                  self.rcn_sink.target(), "has rows missing locally in",
+                  len(db_only), "bucket(s), such as", sorted(db_only)[:5])
+        row_tally = 0
+        if self.rcn_repair and len(differ) > 0:
+            keys = bucket_keys(pandas_series.index.values, self.rcn_bucket)
+            row_tally = self.rcn_sink.upsert(
+                fred_series, pandas_series[np.isin(keys, differ)])
+        return len(local_checksums), len(differ), row_tally, len(db_only)
+
+    # Returns the kind of object instantiated.
+    def kind(self):
+        return self.rcn_kind
+
+    # Reconciles the series (with local data) on the target,
+    # comparing several series at once.
+    # Returns a dictionary of code and the tuple from compare.
+    def run(self, fred_series_list):
+        target = self.rcn_sink.target()
+        # Series without rows in the database differ in every bucket.
+        bookmarks = self.rcn_sink.bookmarks(fred_series_list)
+        results = {}
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers = self.rcn_workers) as executor:
+            futures = {executor.submit(self.compare, fs,
+                                       bookmarks[fs.code()] is not None): fs
+                       for fs in fred_series_list}
+            for future in concurrent.futures.as_completed(futures):
+                fs = futures[future]
+                try:
+                    results[fs.code()] = future.result()
+                except Exception as e:
+                    print(f"Unexpected error reconciling {fs.code()} "
+                          f"on {target}: {e}")
+        return results
+
+    # Returns the title of the instantiated object.
+    def title(self):
+        return self.rcn_title
+
+    # Return and optionally set the verbosity level for the object.
+    def verbosity(self, v = None):
+        if v is not None:
+            self.rcn_verbosity = v
+        return self.rcn_verbosity
@@ -0,0 +1,178 @@
+# This module defines a rate-limited scheduler that fetches
+# FRED series concurrently within the FRED API request budget.
+# Transient failures (HTTP 429 and 5xx) are retried with backoff.
+
+# Import required resources.
+import concurrent.futures
+import random
+import threading
+import time
+import urllib.error
+
+# Messages returned by the FRED API (and surfaced by fredapi as
+# ValueError text) that signal a transient, retryable failure.
+retry_messages = ('too many requests', 'rate limit',
+                  'internal server error', 'bad gateway',
+                  'service unavailable', 'gateway timeout')
+
+# Returns True if an exception raised while fetching looks like
+# an HTTP 429 or 5xx response that is worth retrying.
+def retryable(e):
+    if isinstance(e, urllib.error.HTTPError):
+        return e.code == 429 or 500 <= e.code < 600
+    message = str(e).lower()
+    for retry_message in retry_messages:
+        if retry_message in message:
+            return True
+    return False
+
+# This is a thread-safe token bucket that allows a fixed number
+# of requests per minute with a configurable burst capacity.
+class TokenBucket:
+    def __init__(self, rate_per_minute, capacity = None):
+        self.tb_rate = float(rate_per_minute) / 60.0
+        if capacity is None:
+            capacity = max(1, int(rate_per_minute) // 10)
+        self.tb_capacity = float(capacity)
+        self.tb_tokens = float(capacity)
+        self.tb_updated = time.monotonic()
+        self.tb_lock = threading.Lock()
+
+    # Blocks until a token is available and takes it.
+    # Returns the number of seconds spent waiting.
+    def acquire(self):
+        waited = 0.0
+        while True:
+            with self.tb_lock:
+                now = time.monotonic()
+                self.tb_tokens = min(self.tb_capacity,
+                                     self.tb_tokens +
+                                     (now - self.tb_updated) * self.tb_rate)
+                self.tb_updated = now
+                if self.tb_tokens >= 1.0:
+                    self.tb_tokens -= 1.0
+                    return waited
+                delay = (1.0 - self.tb_tokens) / self.tb_rate
+            time.sleep(delay)
+            waited += delay
+
+    # Drains the bucket so that all workers pause,
+    # typically after the API signals a rate limit.
+    def drain(self):
+        with self.tb_lock:
+            self.tb_tokens = 0.0
+            self.tb_updated = time.monotonic()
+
+    # Returns the number of requests allowed per minute.
+    def rate(self):
+        return self.tb_rate * 60.0
+
+# This is the fetch scheduler that runs FREDSeries.fetch calls
+# on a bounded worker pool within a requests-per-minute budget.
+class FetchScheduler:
+    def __init__(self, fred, workers = 4, rate_per_minute = 100,
+                 max_retries = 5, backoff_secs = 2.0, verbosity = 0):
+        self.fsch_fred = fred
+        self.fsch_workers = int(workers)
+        self.fsch_bucket = TokenBucket(rate_per_minute)
+        self.fsch_max_retries = int(max_retries)
+        self.fsch_backoff_secs = float(backoff_secs)
+        self.fsch_verbosity = int(verbosity)
+        # A caching client (see fredcache.py) takes a token only
+        # for the requests it sends, so cache hits are not limited.
+        self.fsch_client_limited = hasattr(fred, 'limiter')
+        if self.fsch_client_limited:
+            fred.limiter(self.fsch_bucket.acquire)
+
+    # Takes a token for a request sent outside the FRED client
+    # (such as a release calendar lookup), within the same budget.
+    # Returns the number of seconds spent waiting.
+    def acquire(self):
+        return self.fsch_bucket.acquire()
+
+    # Calls a FRED API request for a single series, retrying
+    # transient failures with exponential backoff.
+    # Returns the request result and the latency in seconds.
+    def call(self, fred_series, request):
+        start = time.monotonic()
+        attempt = 0
+        while True:
+            if not self.fsch_client_limited:
+                self.fsch_bucket.acquire()
+            try:
+                result = request(self.fsch_fred)
+                return result, time.monotonic() - start
+            except Exception as e:
+                if not retryable(e) or attempt >= self.fsch_max_retries:
+                    raise
+                # Pause every worker and back off with jitter.
+                self.fsch_bucket.drain()
+                delay = self.fsch_backoff_secs * (2 ** attempt) * \
+                    (1.0 + random.random())
+                attempt += 1
+                if self.verbosity() > 0:
+                    print("Retrying", fred_series.code(),
+                          "in", round(delay, 1), "second(s) after:", e)
+                time.sleep(delay)
+
+    # Checks the FRED series metadata concurrently and returns
+    # the list of series with new releases. Series whose check
+    # fails are included so they are fetched as usual.
+    def changed(self, fred_series_list):
+        changed_list = []
+        for fs, result, latency in self.run(fred_series_list,
+                                            lambda fs: fs.changed):
+            if result is None or result:
+                changed_list.append(fs)
+            elif self.verbosity() > 0:
+                print("No new release for", fs.code(), "...")
+        return changed_list
+
+    # Fetches a single series, retrying transient failures with
+    # exponential backoff. Returns the fetched Pandas series
+    # (or None) and the latency in seconds.
+    def fetch(self, fred_series):
+        return self.call(fred_series, fred_series.fetch)
+
+    # Runs a FRED API request (by default the fetch) for each
+    # series concurrently and yields
+    # (FRED series, result or None, latency seconds)
+    # tuples in completion order. Errors are reported
+    # and yield None so one series cannot stall the rest.
+    # The request maps a series to a callable taking the Fred client.
+    # At most the number of workers plus backlog requests are
+    # submitted at once (refilled as results are consumed), so a
+    # slow consumer caps the results held in memory.
+    def run(self, fred_series_list, request = None, backlog = 0):
+        if request is None:
+            request = lambda fs: fs.fetch
+        fred_series_iter = iter(fred_series_list)
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers = self.fsch_workers) as executor:
+            futures = {}
+            while True:
+                for fs in fred_series_iter:
+                    futures[executor.submit(self.call, fs, request(fs))] = fs
+                    if len(futures) >= self.fsch_workers + int(backlog):
+                        break
+                if len(futures) == 0:
+                    break
+                done, not_done = concurrent.futures.wait(
+                    futures, return_when = concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    fs = futures.pop(future)
+                    try:
+                        result, latency = future.result()
+                    except Exception as e:
+                        print(f"Unexpected error requesting {fs.code()}: {e}")
+                        result, latency = None, None
+                    if self.verbosity() > 0 and latency is not None:
+                        print("Requested", fs.code(), "in",
+                              round(latency, 3), "second(s).")
+                    yield fs, result, latency
+
+    # Return and optionally set the verbosity level for the object.
+    def verbosity(self, v = None):
+        if v is not None:
+            self.fsch_verbosity = v
+        return self.fsch_verbosity
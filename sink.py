@@ -0,0 +1,176 @@
+# This module defines the Sink class, the interface shared by
+# all load targets (OracleDB, SQLiteDB) used by the pipeline,
+# backfill and other FREDflow workflows.
+# Every sink keeps one table per FRED series with the layout and
+# key semantics of sql-ddl.txt, plus the fredflow_logs table.
+
+# Import required resources.
+import decimal
+import threading
+import time
+from instrument import *
+
+# Modulus and multiplier of the per-bucket value hash of checksums:
+# the sum of MOD(MOD(scaled value, modulus) * weight, modulus) with
+# weight = MOD(release_jdn * multiplier + 1, modulus).
+checksum_modulus = 2147483647
+checksum_multiplier = 69069
+# Decimal places of the compared values where the table
+# does not fix them (SQLite, or Oracle NUMBER without a scale).
+checksum_decimals = 4
+
+# Returns a value scaled to an integer at the decimal places,
+# rounding its shortest decimal form half away from zero like
+# Oracle ROUND on a NUMBER (binary floating point would round
+# 1.005 at 2 places down to 100). Missing values stay None.
+def scaled_value(value, decimals):
+    if value is None:
+        return None
+    return int(decimal.Decimal(repr(float(value))).scaleb(int(decimals))
+               .quantize(decimal.Decimal(1), decimal.ROUND_HALF_UP))
+
+# This is the base class for a FREDflow load target.
+class Sink:
+    # Static variables.
+    snk_kind = 'SNK'
+    snk_title = 'Sink'
+    snk_instrument = null_instrument
+    snk_worker = None
+
+    # Returns the bookmark (maximum release date) for a given
+    # FRED series, or None if the series has not been loaded.
+    def bookmark(self, fred_series):
+        raise NotImplementedError
+
+    # Returns a dictionary of code and bookmark for many series.
+    # Sinks that can do better than one query per series override it.
+    def bookmarks(self, fred_series_list):
+        return {fs.code(): self.bookmark(fs) for fs in fred_series_list}
+
+    # Returns a list of dates whose calendar keys, as computed by
+    # the sink itself, differ from calkeys.py.
+    # Sinks that take the keys from calkeys.py have nothing to check.
+    def check_keys(self, start_date = '1900-01-01', end_date = '2100-12-31'):
+        return []
+
+    # Returns the decimal places of the stored values and a
+    # dictionary of bucket ('YYYY' or 'YYYY-MM' for a year or month
+    # bucket) and (count, sum, hash) of the values scaled to integers
+    # at those decimal places, with one query (see reconcile.py).
+    def checksums(self, fred_series, bucket = 'year'):
+        raise NotImplementedError
+
+    # Claims up to limit of the series codes for a worker through
+    # the fredflow_leases table, skipping series leased by another
+    # worker (until the lease expires) and series released as done
+    # within the last round_secs seconds.
+    # Returns the list of claimed codes.
+    def claim(self, codes, worker, limit, lease_secs = 900,
+              round_secs = 3600):
+        raise NotImplementedError
+
+    # Returns the series codes that could be claimed right now:
+    # not leased by any worker (or with an expired lease) and not
+    # released as done within the last round_secs seconds.
+    def claimable(self, codes, round_secs = 3600):
+        raise NotImplementedError
+
+    # Releases any connections held by the sink.
+    def close(self):
+        pass
+
+    # Returns a row count for the specified FRED series.
+    def count(self, fred_series):
+        raise NotImplementedError
+
+    # Inserts a chunk of a FRED series (during a backfill),
+    # replacing any rows in its date range, and commits it.
+    # Returns the number of rows inserted.
+    def insert_chunk(self, fred_series, pandas_series, direct_path = False):
+        raise NotImplementedError
+
+    # Returns and optionally sets the instrument recording the
+    # transform and upsert timings of the sink.
+    def instrument(self, i = None):
+        if i is not None:
+            self.snk_instrument = i
+        return self.snk_instrument
+
+    # Returns the kind of object instantiated.
+    def kind(self):
+        return self.snk_kind
+
+    # Returns True if the sink is up and running.
+    def ping(self):
+        raise NotImplementedError
+
+    # Releases the leases of a worker on series codes, marking
+    # them done for the round if completed (otherwise another
+    # worker may claim them straight away).
+    def release(self, codes, worker, completed = True):
+        raise NotImplementedError
+
+    # Extends the leases a worker still holds on series codes to
+    # lease_secs from now, while it is still working on them.
+    # Returns the number of leases renewed.
+    def renew(self, codes, worker, lease_secs = 900):
+        raise NotImplementedError
+
+    # Returns a string identifying the sink in reports and logs.
+    def target(self):
+        raise NotImplementedError
+
+    # Returns the title of the instantiated object.
+    def title(self):
+        return self.snk_title
+
+    # Updates (or inserts) the rows of a Pandas series in the
+    # table for the FRED series and the FREDflow log.
+    # Returns the number of rows processed.
+    def upsert(self, fred_series, pandas_series):
+        raise NotImplementedError
+
+    # Updates (or inserts) revision deltas (a data frame of date,
+    # vintage and value) of a FRED series in the fredflow_revisions
+    # table. Returns the number of rows processed.
+    def upsert_revisions(self, fred_series, revisions):
+        raise NotImplementedError
+
+    # Returns and optionally sets the worker recorded in the
+    # FREDflow log for the loads of a sharded run (or None).
+    def worker(self, w = None):
+        if w is not None:
+            self.snk_worker = str(w)
+        return self.snk_worker
+
+# Pings the sinks in parallel, waiting at most timeout seconds
+# overall, so a slow or unreachable server does not hold up startup.
+# Pings run on daemon threads, so one that hangs is abandoned.
+# Returns a dictionary of target and True if the sink is up.
+def ping_sinks(sink_list, timeout = 5, verbosity = 0):
+    results = {}
+    def ping(sink):
+        try:
+            results[sink.target()] = (bool(sink.ping()), None)
+        except Exception as e:
+            results[sink.target()] = (False, str(e))
+    threads = [threading.Thread(target = ping, args = (sink,), daemon = True)
+               for sink in sink_list]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + timeout
+    for thread in threads:
+        thread.join(max(0.0, deadline - time.monotonic()))
+    responses = {}
+    for sink in sink_list:
+        response, reason = results.get(sink.target(), (False, "timed out"))
+        responses[sink.target()] = response
+        if response:
+            if verbosity > 0:
+                print("Database", sink.target(), "up and running ...")
+        elif reason is not None:
+            print("Database", sink.target(), "down and unreachable (" +
+                  reason + ") ...")
+        else:
+            print("Database", sink.target(), "down and unreachable ...")
+    return responses
@@ -0,0 +1,459 @@
+# This module defines the SQLiteDB class, an embedded load target
+# with the table layout and key semantics of sql-ddl.txt.
+# It lets students and CI run the full pipeline at local-disk
+# speed without an Oracle server and serves as a reference
+# backend for performance comparisons.
+
+# Import required resources.
+import datetime
+import sqlite3
+import threading
+import time
+from calkeys import *
+from sink import *
+
+# This is the base class for an SQLite database.
+class SQLiteDB(Sink):
+    # Static variables.
+    sdb_kind = 'SDB'
+    sdb_title = 'SQLite DB'
+
+    def __init__(self, path, name = 'local', verbosity = 0):
+        self.sdb_path = str(path)
+        self.sdb_name = str(name)
+        self.sdb_verbosity = int(verbosity)
+        self.sdb_lock = threading.RLock()
+        self.sdb_connection = None
+        self.sdb_bookmarks = {}
+        self.sdb_leases = set()
+
+    # Returns the bookmark data for a given FRED series,
+    # providing a place to begin UPSERTs for new data.
+    def bookmark(self, fred_series):
+        with self.sdb_lock:
+            if fred_series.code() in self.sdb_bookmarks:
+                return self.sdb_bookmarks[fred_series.code()]
+            if self.verbosity() > 0:
+                print("Fetching", fred_series.code(), "DB bookmark ...")
+            if not self.exists(fred_series):
+                return None
+            row = self.connection().execute(
+                "SELECT MAX(release_date) FROM " +
+                fred_series.code()).fetchone()
+        return self.to_datetime(row[0])
+
+    # Looks up the bookmarks for many FRED series with one
+    # UNION ALL query and caches them for the run.
+    # Returns a dictionary of code and maximum release date.
+    def bookmarks(self, fred_series_list):
+        with self.sdb_lock:
+            codes = [fs.code() for fs in fred_series_list
+                     if fs.code() not in self.sdb_bookmarks]
+            table_names = self.tables()
+            for code in codes:
+                if code.upper() not in table_names:
+                    self.sdb_bookmarks[code] = None
+            codes = [code for code in codes if code.upper() in table_names]
+            # SQLite limits compound SELECTs to 500 terms.
+            for i in range(0, len(codes), 400):
+                sql_stmt = " UNION ALL ".join(
+                    "SELECT '" + code + "', MAX(release_date) FROM " + code
+                    for code in codes[i:i + 400])
+                for code, max_release_date in \
+                        self.connection().execute(sql_stmt):
+                    self.sdb_bookmarks[code] = \
+                        self.to_datetime(max_release_date)
+            return {fs.code(): self.sdb_bookmarks[fs.code()]
+                    for fs in fred_series_list}
+
+    # Returns the decimal places of the compared values and a
+    # dictionary of bucket and (count, sum, hash) of the values
+    # scaled to integers, with one GROUP BY query.
+    def checksums(self, fred_series, bucket = 'year'):
+        bucket_length = {'year': 4, 'month': 7}[bucket]
+        sql_stmt = \
+            "SELECT bucket, COUNT(*), SUM(scaled_value), " + \
+            "SUM(((scaled_value % ?) * ((release_jdn * ? + 1) % ?)) % ?) " + \
+            "FROM (SELECT SUBSTR(release_date, 1, " + \
+            str(bucket_length) + ") AS bucket, release_jdn, " + \
+            "scaled_value(data_value, ?) " + \
+            "AS scaled_value FROM " + fred_series.code() + ") " + \
+            "GROUP BY bucket"
+        with self.sdb_lock:
+            if not self.exists(fred_series):
+                return checksum_decimals, {}
+            rows = self.connection().execute(
+                sql_stmt, [checksum_modulus, checksum_multiplier,
+                           checksum_modulus, checksum_modulus,
+                           checksum_decimals]).fetchall()
+        return checksum_decimals, {row[0]: tuple(row[1:]) for row in rows}
+
+    # Claims up to limit of the series codes for a worker in one
+    # write transaction, so several runners sharing the database
+    # file cannot claim the same series.
+    # Returns the list of claimed codes.
+    def claim(self, codes, worker, limit, lease_secs = 900,
+              round_secs = 3600):
+        candidates = set(codes)
+        claimed = []
+        with self.sdb_lock:
+            connection = self.connection()
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                # Add lease rows for series not seen before.
+                connection.executemany(
+                    "INSERT OR IGNORE INTO fredflow_leases (fred_series) " +
+                    "VALUES (?)",
+                    [(code,) for code in candidates - self.sdb_leases])
+                now = time.time()
+                cursor = connection.execute(
+                    "SELECT fred_series FROM fredflow_leases " +
+                    "WHERE (lease_expiry IS NULL OR lease_expiry < ?) " +
+                    "AND (released_tstamp IS NULL OR released_tstamp < ?)",
+                    [now, now - round_secs])
+                for row in cursor:
+                    if row[0] in candidates:
+                        claimed.append(row[0])
+                        if len(claimed) >= limit:
+                            break
+                cursor.close()
+                connection.executemany(
+                    "UPDATE fredflow_leases SET " +
+                    "worker = ?, lease_expiry = ? WHERE fred_series = ?",
+                    [(worker, now + lease_secs, code) for code in claimed])
+                connection.commit()
+                self.sdb_leases |= candidates
+            except Exception:
+                connection.rollback()
+                raise
+        if self.verbosity() > 0:
+            print("Worker", worker, "claimed", len(claimed), "series ...")
+        return claimed
+
+    # Returns the series codes that could be claimed right now.
+    def claimable(self, codes, round_secs = 3600):
+        candidates = set(codes)
+        now = time.time()
+        with self.sdb_lock:
+            rows = self.connection().execute(
+                "SELECT fred_series FROM fredflow_leases " +
+                "WHERE (lease_expiry IS NULL OR lease_expiry < ?) " +
+                "AND (released_tstamp IS NULL OR released_tstamp < ?)",
+                [now, now - round_secs]).fetchall()
+        return [row[0] for row in rows if row[0] in candidates]
+
+    # Closes the database connection.
+    def close(self):
+        with self.sdb_lock:
+            if self.sdb_connection is not None:
+                self.sdb_connection.close()
+                self.sdb_connection = None
+
+    # Returns the database connection, opening it (and creating
+    # the FREDflow log) on first use.
+    def connection(self):
+        with self.sdb_lock:
+            if self.sdb_connection is None:
+                self.sdb_connection = sqlite3.connect(
+                    self.sdb_path, check_same_thread = False,
+                    timeout = 30)
+                self.sdb_connection.execute("PRAGMA journal_mode = WAL")
+                self.sdb_connection.execute("PRAGMA synchronous = NORMAL")
+                # Scale checksum values like Oracle ROUND (see sink.py).
+                self.sdb_connection.create_function(
+                    'scaled_value', 2, scaled_value, deterministic = True)
+                self.sdb_connection.execute(
+                    "CREATE TABLE IF NOT EXISTS fredflow_logs (" +
+                    "fred_series TEXT NOT NULL, " +
+                    "row_tally INTEGER NOT NULL DEFAULT 0, " +
+                    "target TEXT, " +
+                    "status TEXT, " +
+                    "message TEXT, " +
+                    "start_tstamp TEXT NOT NULL " +
+                    "DEFAULT (STRFTIME('%Y-%m-%d %H:%M:%f', 'now')), " +
+                    "stop_tstamp TEXT)")
+                # Add the timing and worker columns to logs
+                # created without them.
+                log_columns = {row[1] for row in self.sdb_connection.execute(
+                    "PRAGMA table_info(fredflow_logs)")}
+                for column in instrument_columns + ['worker']:
+                    if column not in log_columns:
+                        self.sdb_connection.execute(
+                            "ALTER TABLE fredflow_logs ADD COLUMN " +
+                            column + (" TEXT" if column == 'worker'
+                                      else " REAL"))
+                self.sdb_connection.execute(
+                    "CREATE TABLE IF NOT EXISTS fredflow_leases (" +
+                    "fred_series TEXT PRIMARY KEY, " +
+                    "worker TEXT, " +
+                    "lease_expiry REAL, " +
+                    "released_tstamp REAL)")
+                self.sdb_connection.execute(
+                    "CREATE TABLE IF NOT EXISTS fredflow_revisions (" +
+                    "fred_series TEXT NOT NULL, " +
+                    "release_date TEXT NOT NULL, " +
+                    "vintage_date TEXT NOT NULL, " +
+                    "data_value REAL, " +
+                    "PRIMARY KEY (fred_series, release_date, vintage_date))")
+                self.sdb_connection.commit()
+            return self.sdb_connection
+
+    # Returns a row count for the specified FRED series.
+    def count(self, fred_series):
+        with self.sdb_lock:
+            if not self.exists(fred_series):
+                return 0
+            row = self.connection().execute(
+                "SELECT COUNT(*) FROM " + fred_series.code()).fetchone()
+        return row[0]
+
+    # Creates the table for a FRED series if it does not exist,
+    # following the layout in sql-ddl.txt.
+    def create(self, fred_series):
+        key_column = key_columns[fred_series.granularity()]
+        columns = "release_date TEXT NOT NULL, " + \
+            "data_value REAL NOT NULL, " + \
+            "release_jdn INTEGER NOT NULL, "
+        if key_column != 'release_jdn':
+            columns += key_column + " INTEGER NOT NULL, "
+        with self.sdb_lock:
+            self.connection().execute(
+                "CREATE TABLE IF NOT EXISTS " + fred_series.code() + " (" +
+                columns +
+                "first_created TEXT NOT NULL " +
+                "DEFAULT (STRFTIME('%Y-%m-%d %H:%M:%f', 'now')), " +
+                "last_updated TEXT, " +
+                "CONSTRAINT " + fred_series.code() + "_pk " +
+                "PRIMARY KEY (" + key_column + "))")
+
+    # Returns True if the table for a FRED series exists.
+    def exists(self, fred_series):
+        return fred_series.code().upper() in self.tables()
+
+    # Inserts a chunk of a FRED series (during a backfill),
+    # replacing any rows in its date range, and commits it.
+    # Returns the number of rows inserted.
+    def insert_chunk(self, fred_series, pandas_series, direct_path = False):
+        if len(pandas_series) == 0:
+            return 0
+        sql_data = self.rows(fred_series, pandas_series)
+        with self.sdb_lock:
+            self.create(fred_series)
+            connection = self.connection()
+            with connection:
+                connection.execute(
+                    "DELETE FROM " + fred_series.code() + " " +
+                    "WHERE release_date BETWEEN ? AND ?",
+                    [sql_data[0][0], sql_data[-1][0]])
+                connection.executemany(self.upsert_statement(fred_series),
+                                       sql_data)
+            # The cached bookmark (if any) may now be stale.
+            self.sdb_bookmarks.pop(fred_series.code(), None)
+        return len(sql_data)
+
+    # Returns the kind of object instantiated.
+    def kind(self):
+        return self.sdb_kind
+
+    # Returns the name of the database.
+    def name(self):
+        return self.sdb_name
+
+    # Returns the path of the database file.
+    def path(self):
+        return self.sdb_path
+
+    # Checks that the database can be queried.
+    def ping(self):
+        if self.verbosity() > 0:
+            print("Pinging database", self.path(), "...")
+        with self.sdb_lock:
+            row = self.connection().execute("SELECT 1").fetchone()
+        return row[0] == 1
+
+    # Returns the (date, value, Julian day number[, calendar key])
+    # rows for a Pandas series, with the keys computed at once.
+    def rows(self, fred_series, pandas_series):
+        keys = calendar_keys(pandas_series.index.values,
+                             fred_series.granularity())
+        return list(zip(pandas_series.index.strftime('%Y-%m-%d'),
+                        pandas_series.astype(float).tolist(),
+                        *[key.tolist() for key in keys.values()]))
+
+    # Shows back information about the database.
+    def show(self):
+        print("Name:", self.title(),
+              "Code:", self.kind(),
+              "Verbosity:", self.verbosity())
+        print("Path:", self.path(),
+              "Name:", self.name())
+
+    # Releases the leases of a worker on series codes, marking
+    # them done for the round if completed.
+    def release(self, codes, worker, completed = True):
+        if completed:
+            released = time.time()
+        else:
+            released = None
+        with self.sdb_lock:
+            connection = self.connection()
+            with connection:
+                connection.executemany(
+                    "UPDATE fredflow_leases SET lease_expiry = NULL, " +
+                    "released_tstamp = COALESCE(?, released_tstamp) " +
+                    "WHERE fred_series = ? AND worker = ?",
+                    [(released, code, worker) for code in codes])
+
+    # Extends the leases a worker still holds on series codes to
+    # lease_secs from now. Returns the number of leases renewed.
+    def renew(self, codes, worker, lease_secs = 900):
+        with self.sdb_lock:
+            connection = self.connection()
+            with connection:
+                cursor = connection.executemany(
+                    "UPDATE fredflow_leases SET lease_expiry = ? " +
+                    "WHERE fred_series = ? AND worker = ? " +
+                    "AND lease_expiry IS NOT NULL",
+                    [(time.time() + lease_secs, code, worker)
+                     for code in codes])
+                return cursor.rowcount
+
+    # Returns the set of (upper case) table names in the database.
+    def tables(self):
+        with self.sdb_lock:
+            return {row[0].upper() for row in self.connection().execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+    # Returns the target database as sqlite:path,
+    # used to report per-target results.
+    def target(self):
+        return 'sqlite:' + self.path()
+
+    # Returns  the title of the instantiated object.
+    def title(self):
+        return self.sdb_title
+
+    # Converts a stored YYYY-MM-DD date to a datetime (or None).
+    def to_datetime(self, release_date):
+        if release_date is None:
+            return None
+        return datetime.datetime.strptime(release_date, '%Y-%m-%d')
+
+    # Takes a FRED series and fetched Pandas series for
+    # updating the data table for the series (via UPSERT operations)
+    # in a single transaction. The FREDflow log is also updated.
+    def upsert(self, fred_series, pandas_series):
+        if self.verbosity() > 0:
+            print("Loading", len(pandas_series), "row(s) of",
+                  fred_series.code(), "via UPSERT operations ...")
+        if fred_series.granularity() not in key_columns:
+            print("WARNING: Granularity of ",
+                  fred_series.code(),
+                  " unknown.")
+            return 0
+        timer = self.instrument().timer(fred_series.code(), 'upsert',
+                                        self.target())
+        with timer:
+            with self.instrument().timer(fred_series.code(), 'transform',
+                                         self.target()) as transform_timer:
+                sql_data = self.rows(fred_series, pandas_series)
+                transform_timer.rows = len(sql_data)
+            with self.sdb_lock:
+                self.create(fred_series)
+                connection = self.connection()
+                # INSERT into FREDflow log with start time.
+                with connection:
+                    connection.execute(
+                        "INSERT INTO fredflow_logs " +
+                        "(fred_series, row_tally, target, status, worker) " +
+                        "VALUES (?, ?, ?, ?, ?)",
+                        [fred_series.code(), 0, self.target(), 'RUNNING',
+                         self.worker()])
+                try:
+                    with connection:
+                        cursor = connection.executemany(
+                            self.upsert_statement(fred_series), sql_data)
+                        row_tally = cursor.rowcount
+                    status, message = 'SUCCESS', None
+                except Exception as e:
+                    row_tally, status, message = 0, 'FAILED', str(e)
+                # CREATE, log INSERT, UPSERTs and log UPDATE,
+                # with a commit after each of the last three.
+                timer.rows = row_tally
+                timer.round_trips = 4
+                timer.commits = 3
+                columns = {'row_tally': row_tally,
+                           'status': status,
+                           'message': message}
+                log_columns = self.instrument().log_columns(
+                    fred_series.code(), self.target(), timer)
+                if log_columns is not None:
+                    columns.update(log_columns)
+                # UPDATE FREDflow log with stop time.
+                with connection:
+                    connection.execute(
+                        "UPDATE fredflow_logs SET " +
+                        "".join(column + " = ?, " for column in columns) +
+                        "stop_tstamp = STRFTIME('%Y-%m-%d %H:%M:%f', 'now') " +
+                        "WHERE fred_series = ? AND stop_tstamp IS NULL " +
+                        "AND target = ? AND worker IS ?",
+                        list(columns.values()) + [fred_series.code(),
+                                                  self.target(),
+                                                  self.worker()])
+                if status == 'FAILED':
+                    raise RuntimeError(message)
+                # Keep any cached bookmark current for the rest of the run.
+                if fred_series.code() in self.sdb_bookmarks and \
+                        len(sql_data) > 0:
+                    max_release_date = self.to_datetime(max(row[0]
+                                                            for row in sql_data))
+                    if self.sdb_bookmarks[fred_series.code()] is None or \
+                            self.sdb_bookmarks[fred_series.code()] < \
+                            max_release_date:
+                        self.sdb_bookmarks[fred_series.code()] = max_release_date
+        return row_tally
+
+    # Updates (or inserts) revision deltas of a FRED series in the
+    # fredflow_revisions table in a single transaction.
+    # Missing (NaN) values are stored as NULL.
+    def upsert_revisions(self, fred_series, revisions):
+        if len(revisions) == 0:
+            return 0
+        sql_data = list(zip([fred_series.code()] * len(revisions),
+                            revisions['date'].dt.strftime('%Y-%m-%d'),
+                            revisions['vintage'].dt.strftime('%Y-%m-%d'),
+                            revisions['value'].astype(object)
+                            .where(revisions['value'].notna(), None)))
+        with self.sdb_lock:
+            connection = self.connection()
+            with connection:
+                connection.executemany(
+                    "INSERT INTO fredflow_revisions " +
+                    "(fred_series, release_date, vintage_date, data_value) " +
+                    "VALUES (?, ?, ?, ?) " +
+                    "ON CONFLICT (fred_series, release_date, vintage_date) " +
+                    "DO UPDATE SET data_value = excluded.data_value",
+                    sql_data)
+        return len(sql_data)
+
+    # Returns an INSERT ... ON CONFLICT statement that inserts a row
+    # or overwrites the value of the row with the same primary key.
+    def upsert_statement(self, fred_series):
+        key_column = key_columns[fred_series.granularity()]
+        columns = ['release_date', 'data_value', 'release_jdn']
+        if key_column != 'release_jdn':
+            columns.append(key_column)
+        sql_stmt = \
+            "INSERT INTO " + fred_series.code() + \
+            " (" + ", ".join(columns) + ") VALUES (" + \
+            ", ".join("?" for column in columns) + ") " + \
+            "ON CONFLICT (" + key_column + ") DO UPDATE SET " + \
+            "data_value = excluded.data_value, " + \
+            "last_updated = STRFTIME('%Y-%m-%d %H:%M:%f', 'now')"
+        return sql_stmt
+
+    # Returns and optionally sets the verbosity level for the object.
+    def verbosity(self, v = None):
+        if v is not None:
+            self.sdb_verbosity = v
+        return self.sdb_verbosity
@@ -0,0 +1,210 @@
+# This module defines the StateStore class that keeps the
+# state of each FREDSeries (fetch and release check timestamps,
+# tally, lookback, last observed date and last release timestamp)
+# in a single SQLite database keyed by series code.
+# Each save is an atomic transaction, so an interrupted run
+# cannot leave a half-written state behind.
+
+# Import required resources.
+import os
+import pickle
+import sqlite3
+import threading
+from fred import *
+
+# This is the base class for the FREDflow state store.
+class StateStore:
+    # Static variables.
+    sts_kind = 'STS'
+    sts_title = 'State Store'
+    sts_columns = ['code', 'name', 'granularity', 'lookback',
+                   'first_fetch', 'last_fetch', 'fetch_tally',
+                   'last_observed', 'last_updated', 'last_vintage',
+                   'last_checked']
+
+    def __init__(self, path, verbosity = 0):
+        self.sts_path = str(path)
+        self.sts_verbosity = int(verbosity)
+        self.sts_lock = threading.Lock()
+        self.sts_connection = sqlite3.connect(self.sts_path,
+                                              check_same_thread = False)
+        with self.sts_lock:
+            self.sts_connection.execute("PRAGMA journal_mode = WAL")
+            self.sts_connection.execute("PRAGMA synchronous = NORMAL")
+            self.sts_connection.execute(
+                "CREATE TABLE IF NOT EXISTS fred_series_state (" +
+                "code TEXT PRIMARY KEY, " +
+                "name TEXT NOT NULL, " +
+                "granularity TEXT NOT NULL, " +
+                "lookback INTEGER NOT NULL, " +
+                "first_fetch REAL, " +
+                "last_fetch REAL, " +
+                "fetch_tally INTEGER NOT NULL DEFAULT 0, " +
+                "last_observed TEXT, " +
+                "last_updated TEXT, " +
+                "last_vintage TEXT, " +
+                "last_checked REAL)")
+            # Add the columns of later versions to older state stores.
+            state_columns = {row[1] for row in self.sts_connection.execute(
+                "PRAGMA table_info(fred_series_state)")}
+            if 'last_vintage' not in state_columns:
+                self.sts_connection.execute(
+                    "ALTER TABLE fred_series_state " +
+                    "ADD COLUMN last_vintage TEXT")
+            if 'last_checked' not in state_columns:
+                self.sts_connection.execute(
+                    "ALTER TABLE fred_series_state " +
+                    "ADD COLUMN last_checked REAL")
+            self.sts_connection.execute(
+                "CREATE TABLE IF NOT EXISTS backfill_chunks (" +
+                "code TEXT NOT NULL, " +
+                "target TEXT NOT NULL, " +
+                "chunk_start TEXT NOT NULL, " +
+                "chunk_end TEXT NOT NULL, " +
+                "row_tally INTEGER NOT NULL, " +
+                "PRIMARY KEY (code, target, chunk_start))")
+            self.sts_connection.commit()
+
+    # Clears the completed backfill chunks of a series for a target.
+    def backfill_clear(self, code, target):
+        with self.sts_lock:
+            with self.sts_connection:
+                self.sts_connection.execute(
+                    "DELETE FROM backfill_chunks " +
+                    "WHERE code = ? AND target = ?", (code, target))
+
+    # Returns the set of chunk start dates already backfilled
+    # for a series and target.
+    def backfill_done(self, code, target):
+        with self.sts_lock:
+            rows = self.sts_connection.execute(
+                "SELECT chunk_start FROM backfill_chunks " +
+                "WHERE code = ? AND target = ?", (code, target)).fetchall()
+        return {row[0] for row in rows}
+
+    # Records a completed backfill chunk for a series and target.
+    def backfill_mark(self, code, target, chunk_start, chunk_end, row_tally):
+        with self.sts_lock:
+            with self.sts_connection:
+                self.sts_connection.execute(
+                    "INSERT OR REPLACE INTO backfill_chunks " +
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (code, target, chunk_start, chunk_end, row_tally))
+
+    # Returns the codes of series with a backfill in progress
+    # (some chunks completed) for a target.
+    def backfill_started(self, target):
+        with self.sts_lock:
+            rows = self.sts_connection.execute(
+                "SELECT DISTINCT code FROM backfill_chunks " +
+                "WHERE target = ?", (target,)).fetchall()
+        return {row[0] for row in rows}
+
+    # Closes the state store.
+    def close(self):
+        with self.sts_lock:
+            self.sts_connection.close()
+
+    # Returns the number of series in the state store.
+    def count(self):
+        with self.sts_lock:
+            row = self.sts_connection.execute(
+                "SELECT COUNT(*) FROM fred_series_state").fetchone()
+        return row[0]
+
+    # Deletes the state of the series with the given codes.
+    def delete(self, codes):
+        with self.sts_lock:
+            with self.sts_connection:
+                self.sts_connection.executemany(
+                    "DELETE FROM fred_series_state WHERE code = ?",
+                    [(code,) for code in codes])
+
+    # Returns the kind of object instantiated.
+    def kind(self):
+        return self.sts_kind
+
+    # Loads and returns a list of FREDSeries objects from the
+    # state store, optionally limited to a set of codes.
+    def load(self, codes = None):
+        with self.sts_lock:
+            rows = self.sts_connection.execute(
+                "SELECT " + ", ".join(self.sts_columns) +
+                " FROM fred_series_state").fetchall()
+        fred_series = []
+        for row in rows:
+            state = dict(zip(self.sts_columns, row))
+            if codes is not None and state['code'] not in codes:
+                continue
+            fs = FREDSeries(state['code'], state['name'],
+                            state['granularity'], state['lookback'])
+            fs.restore(state)
+            fred_series.append(fs)
+        return fred_series
+
+    # Imports pickled FREDSeries objects that are not yet in
+    # the state store (a one-time migration from pickle files).
+    # Imported pickle files are renamed with a .migrated suffix,
+    # so later startups do not read them again.
+    # Returns the number of series imported.
+    def migrate(self, pickle_path, skip_files = ('.gitkeep', '.gitignore'),
+                migrated_suffix = '.migrated'):
+        if not os.path.isdir(pickle_path):
+            return 0
+        stored_codes = None
+        migrated_series = []
+        migrated_files = []
+        for file in os.listdir(pickle_path):
+            if file in skip_files or file.endswith(migrated_suffix) or \
+                    not os.path.isfile(os.path.join(pickle_path, file)):
+                continue
+            try:
+                with open(os.path.join(pickle_path, file), 'rb') as f:
+                    pfs = pickle.load(f)
+            except Exception as e:
+                print("WARNING: Skipping pickle file", file, "-", e)
+                continue
+            if stored_codes is None:
+                stored_codes = {fs.code() for fs in self.load()}
+            if pfs.code() not in stored_codes:
+                migrated_series.append(pfs)
+            migrated_files.append(file)
+        if len(migrated_series) > 0:
+            if self.verbosity() > 0:
+                print("Migrating", len(migrated_series),
+                      "pickled FRED series to", self.sts_path, "...")
+            self.save(migrated_series)
+        for file in migrated_files:
+            os.replace(os.path.join(pickle_path, file),
+                       os.path.join(pickle_path, file + migrated_suffix))
+        return len(migrated_series)
+
+    # Saves (inserts or updates) the state of one FREDSeries
+    # or a list of them in a single atomic transaction.
+    def save(self, fred_series):
+        if not isinstance(fred_series, list):
+            fred_series = [fred_series]
+        rows = []
+        for fs in fred_series:
+            state = fs.state()
+            rows.append([state[column] for column in self.sts_columns])
+        sql_stmt = \
+            "INSERT INTO fred_series_state (" + \
+            ", ".join(self.sts_columns) + ") VALUES (" + \
+            ", ".join("?" for column in self.sts_columns) + ") " + \
+            "ON CONFLICT (code) DO UPDATE SET " + \
+            ", ".join(column + " = excluded." + column
+                      for column in self.sts_columns[1:])
+        with self.sts_lock:
+            with self.sts_connection:
+                self.sts_connection.executemany(sql_stmt, rows)
+
+    # Returns the title of the instantiated object.
+    def title(self):
+        return self.sts_title
+
+    # Return and optionally set the verbosity level for the object.
+    def verbosity(self, v = None):
+        if v is not None:
+            self.sts_verbosity = v
+        return self.sts_verbosity
@@ -0,0 +1,54 @@
+# This module checks the calendar keys computed by calkeys.py
+# against the Oracle expressions they stand in for (see the
+# UPSERT functions in sql-ddl.txt), computed one date at a time
+# with datetime, for every day from 1900 through 2100.
+#
+# Usage: python -m pytest test_calkeys.py
+
+# Import required resources.
+import datetime
+import numpy as np
+from calkeys import *
+
+# Julian day number of 0001-01-01 (proleptic Gregorian ordinal 1).
+ordinal_jdn = 1721425
+
+# Returns every date from 1900-01-01 through 2100-12-31.
+def reference_dates():
+    first_date = datetime.date(1900, 1, 1)
+    return [first_date + datetime.timedelta(days = i)
+            for i in range((datetime.date(2100, 12, 31) -
+                            first_date).days + 1)]
+
+# Returns the dates as a NumPy datetime64[D] array.
+def reference_days():
+    return np.array(reference_dates(), 'datetime64[D]')
+
+# TO_NUMBER(TO_CHAR(d, 'J'))
+def test_julian_day_numbers():
+    expected = [d.toordinal() + ordinal_jdn for d in reference_dates()]
+    assert julian_day_numbers(reference_days()).tolist() == expected
+
+# TO_NUMBER(TO_CHAR(d, 'YYYY') || TO_CHAR(d, 'WW'))
+def test_cal_week_keys():
+    expected = [d.year * 100 + (d.timetuple().tm_yday - 1) // 7 + 1
+                for d in reference_dates()]
+    assert cal_week_keys(reference_days()).tolist() == expected
+
+# TO_NUMBER(TO_CHAR(d, 'YYYY') || TO_CHAR(d, 'MM'))
+def test_cal_month_keys():
+    expected = [d.year * 100 + d.month for d in reference_dates()]
+    assert cal_month_keys(reference_days()).tolist() == expected
+
+# TO_NUMBER(TO_CHAR(d, 'YYYY') || TO_CHAR(d, 'Q'))
+def test_cal_quarter_keys():
+    expected = [d.year * 10 + (d.month - 1) // 3 + 1
+                for d in reference_dates()]
+    assert cal_quarter_keys(reference_days()).tolist() == expected
+
+# The keys of a granularity include the Julian day number.
+def test_calendar_keys():
+    keys = calendar_keys(reference_days(), 'MONTHLY')
+    assert list(keys) == ['release_jdn', 'cal_month_key']
+    assert keys['cal_month_key'].tolist() == \
+        cal_month_keys(reference_days()).tolist()
@@ -0,0 +1,76 @@
+# This module checks the SQL statements OracleDB sends against
+# the values it binds to them, with a stand-in connection that
+# records each execute, so no Oracle server is needed.
+#
+# Usage: python -m pytest test_orcldb.py
+
+# Import required resources.
+import re
+from fred import *
+from orcldb import *
+
+# Returns the bind names of an SQL statement, leaving out
+# the contents of string literals.
+def bind_names(sql_stmt):
+    return re.findall(r":(\w+)", re.sub(r"'[^']*'", "''", sql_stmt))
+
+# Records the statements and binds executed on its cursor,
+# answering every query with the given rows.
+class RecordingConnection:
+    def __init__(self, rows = None):
+        self.executed = []
+        self.rows = list(rows or [])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql_stmt, binds = None):
+        self.executed.append((sql_stmt, binds))
+
+    def commit(self):
+        pass
+
+    def __iter__(self):
+        return iter(self.rows)
+
+# Returns an OracleDB whose connections record the statements.
+def recording_db(rows = None):
+    oracle_db = OracleDB('user', 'password', 'localhost', 1521, 'sid', 'test')
+    recording_connection = RecordingConnection(rows)
+    oracle_db.connection = lambda: recording_connection
+    return oracle_db, recording_connection
+
+# Every bind of the checksum query gets a value: by name,
+# as a repeated positional bind needs a value per occurrence.
+def test_checksum_binds():
+    oracle_db, recording_connection = recording_db()
+    fred_series = FREDSeries('GDP', 'Gross Domestic Product', 'QUARTERLY')
+    for bucket in ['year', 'month']:
+        oracle_db.checksums(fred_series, bucket)
+    assert len(recording_connection.executed) == 2
+    for sql_stmt, binds in recording_connection.executed:
+        assert isinstance(binds, dict)
+        assert set(bind_names(sql_stmt)) == set(binds)
+        assert binds['table_name'] == 'GDP'
+
+# Closing a log entry leaves the open entries of the same
+# series on other targets (and of other workers) alone.
+def test_log_stop_target():
+    log_columns = [('fred_series',), ('row_tally',), ('target',),
+                   ('status',), ('message',), ('worker',)]
+    oracle_db, recording_connection = recording_db(log_columns)
+    oracle_db.worker('host:1')
+    fred_series = FREDSeries('GDP', 'Gross Domestic Product', 'QUARTERLY')
+    oracle_db.log_stop(recording_connection, fred_series, 10)
+    sql_stmt, binds = recording_connection.executed[-1]
+    assert len(bind_names(sql_stmt)) == len(binds)
+    where = dict(zip(bind_names(sql_stmt), binds))
+    assert "AND target = :" in sql_stmt
+    assert "AND worker = :" in sql_stmt
+    assert list(where.values())[-3:] == ['GDP', oracle_db.target(), 'host:1']
@@ -0,0 +1,232 @@
+# This module keeps the revision history of FRED series captured
+# from ALFRED (real-time) data. Only values that changed are kept,
+# as compact (date, vintage, value) deltas appended in vintage
+# order to data/<CODE>.revisions, so the series as of any
+# vintage is read from a prefix of the log without rebuilding
+# the series for every vintage in between.
+
+# Import required resources.
+import os
+import numpy as np
+import pandas as pd
+
+# This is the base class for the FREDflow local vintage store.
+class VintageStore:
+    # Static variables.
+    vts_kind = 'VTS'
+    vts_title = 'Vintage Store'
+    # Observation date and vintage as days since 1970-01-01.
+    vts_row_type = np.dtype([('date', '<i8'),
+                             ('vintage', '<i8'),
+                             ('value', '<f8')])
+
+    def __init__(self, path, verbosity = 0):
+        self.vts_path = str(path)
+        self.vts_verbosity = int(verbosity)
+
+    # Appends revision delta rows (see deltas) to the log.
+    def append(self, code, rows):
+        if len(rows) == 0:
+            return
+        with open(self.revisions_file(code), 'ab') as f:
+            # Drop a partial row left by an interrupted write.
+            f.truncate(self.length(code) * self.vts_row_type.itemsize)
+            f.write(rows.tobytes())
+
+    # Returns the series as of a vintage date: for each observation
+    # the last value released on or before the date. Observations
+    # removed (NaN) as of the date are left out.
+    def as_of(self, code, vintage_date):
+        rows = self.rows(code)
+        vintage_day = np.datetime64(pd.Timestamp(vintage_date), 'D') \
+            .astype(np.int64)
+        # The log is in vintage order, so the vintage is a prefix.
+        rows = rows[:int(np.searchsorted(rows['vintage'], vintage_day,
+                                         side = 'right'))]
+        return self.latest_rows(rows)
+
+    # Returns the revision deltas of the fetched real-time values:
+    # the (date, vintage, value) rows whose value differs from the
+    # value of the same date in the previous vintage (or the stored
+    # latest value), in vintage and date order.
+    def deltas(self, code, fred_releases):
+        if len(fred_releases) == 0:
+            return np.empty(0, self.vts_row_type)
+        releases = np.empty(len(fred_releases), self.vts_row_type)
+        releases['date'] = fred_releases['date'].values \
+            .astype('datetime64[D]').astype(np.int64)
+        releases['vintage'] = fred_releases['vintage'].values \
+            .astype('datetime64[D]').astype(np.int64)
+        releases['value'] = fred_releases['value'].to_numpy(np.float64)
+        # Compare each value with the previous one for its date:
+        # the row before it or, for the first row of a date,
+        # the stored latest value (if the date is known).
+        releases = releases[np.lexsort((releases['vintage'],
+                                        releases['date']))]
+        values = releases['value']
+        previous = np.empty(len(releases))
+        previous[1:] = values[:-1]
+        known = np.zeros(len(releases), dtype = bool)
+        known[1:] = releases['date'][1:] == releases['date'][:-1]
+        first = np.flatnonzero(~known)
+        latest = self.latest_rows(self.rows(code), keep_nan = True)
+        index = np.searchsorted(latest['date'], releases['date'][first])
+        stored = index < len(latest)
+        stored[stored] = latest['date'][index[stored]] == \
+            releases['date'][first[stored]]
+        previous[first[stored]] = latest['value'][index[stored]]
+        known[first[stored]] = True
+        same = (values == previous) | (np.isnan(values) & np.isnan(previous))
+        # New dates are kept unless missing (NaN).
+        changed = releases[(known & ~same) | (~known & ~np.isnan(values))]
+        return changed[np.lexsort((changed['date'], changed['vintage']))]
+
+    # Returns True if revisions are stored for a series.
+    def exists(self, code):
+        return self.length(code) > 0
+
+    # Returns a data frame of date, vintage and value for an
+    # array of rows.
+    def frame(self, rows):
+        return pd.DataFrame({
+            'date': rows['date'].astype('datetime64[D]')
+                .astype('datetime64[ns]'),
+            'vintage': rows['vintage'].astype('datetime64[D]')
+                .astype('datetime64[ns]'),
+            'value': rows['value']})
+
+    # Returns the kind of object instantiated.
+    def kind(self):
+        return self.vts_kind
+
+    # Returns the latest value of each date in rows that are in
+    # vintage order, as a Pandas series (or as rows if keep_nan).
+    def latest_rows(self, rows, keep_nan = False):
+        # The last row of each date in the log is its latest value.
+        reversed_rows = rows[::-1]
+        dates, index = np.unique(reversed_rows['date'], return_index = True)
+        latest = reversed_rows[index]
+        if keep_nan:
+            return latest
+        latest = latest[~np.isnan(latest['value'])]
+        return pd.Series(latest['value'],
+                         index = pd.DatetimeIndex(
+                             latest['date'].astype('datetime64[D]')))
+
+    # Returns the number of revision rows stored for a series.
+    def length(self, code):
+        if not os.path.isfile(self.revisions_file(code)):
+            return 0
+        return os.path.getsize(self.revisions_file(code)) // \
+            self.vts_row_type.itemsize
+
+    # Returns all revisions of a series as a data frame of date,
+    # vintage and value in vintage order.
+    def read(self, code):
+        return self.frame(self.rows(code))
+
+    # Returns the revisions file name for a series.
+    def revisions_file(self, code):
+        return os.path.join(self.vts_path, code + '.revisions')
+
+    # Returns the memory-mapped (read-only) revision rows of a
+    # series, or an empty array if none are stored.
+    def rows(self, code):
+        length = self.length(code)
+        if length == 0:
+            return np.empty(0, self.vts_row_type)
+        return np.memmap(self.revisions_file(code), self.vts_row_type,
+                         'r', shape = (length,))
+
+    # Returns the title of the instantiated object.
+    def title(self):
+        return self.vts_title
+
+    # Return and optionally set the verbosity level for the object.
+    def verbosity(self, v = None):
+        if v is not None:
+            self.vts_verbosity = v
+        return self.vts_verbosity
+
+    # Returns the distinct vintage dates stored for a series.
+    def vintages(self, code):
+        return pd.DatetimeIndex(np.unique(self.rows(code)['vintage'])
+                                .astype('datetime64[D]'))
+
+    # Appends the revision deltas of fetched real-time values
+    # and returns them as a data frame of date, vintage and value.
+    def write(self, code, fred_releases):
+        rows = self.deltas(code, fred_releases)
+        self.append(code, rows)
+        if self.verbosity() > 1:
+            print("Stored", len(rows), "of", len(fred_releases),
+                  "real-time value(s) of", code, "as revisions.")
+        return self.frame(rows)
+
+# This captures the vintages of FRED series: it fetches the real-time
+# values released since the last captured vintage, pushes the deltas
+# to the revisions table of each database and then stores them
+# locally. If any database fails, the deltas are neither stored nor
+# the last vintage advanced, so the next run computes and pushes
+# them again (the MERGE makes the retry harmless for the others).
+class VintageCapture:
+    def __init__(self, fetch_scheduler, vintage_store, state_store,
+                 sink_list, verbosity = 0):
+        self.vtc_scheduler = fetch_scheduler
+        self.vtc_vintage_store = vintage_store
+        self.vtc_state_store = state_store
+        self.vtc_databases = list(sink_list)
+        self.vtc_verbosity = int(verbosity)
+
+    # Captures the vintages of the FRED series concurrently
+    # (within the scheduler's rate limit) and returns the number
+    # of revision deltas stored.
+    def run(self, fred_series_list):
+        delta_tally = 0
+        for fs, fred_releases, latency in self.vtc_scheduler.run(
+                fred_series_list, lambda fs: fs.fetch_vintages):
+            if fred_releases is None:
+                continue
+            try:
+                changed_rows = self.vtc_vintage_store.deltas(fs.code(),
+                                                             fred_releases)
+                changed = self.vtc_vintage_store.frame(changed_rows)
+            except Exception as e:
+                print(f"Unexpected error capturing vintages "
+                      f"of {fs.code()}: {e}")
+                continue
+            pushed = True
+            for odb in self.vtc_databases:
+                try:
+                    odb.upsert_revisions(fs, changed)
+                except Exception as e:
+                    print(f"Unexpected error pushing the revisions "
+                          f"of {fs.code()} to {odb.target()}: {e}")
+                    pushed = False
+            if not pushed:
+                continue
+            try:
+                self.vtc_vintage_store.append(fs.code(), changed_rows)
+            except Exception as e:
+                print(f"Unexpected error storing the revisions "
+                      f"of {fs.code()}: {e}")
+                continue
+            if self.verbosity() > 1:
+                print("Stored", len(changed_rows), "of", len(fred_releases),
+                      "real-time value(s) of", fs.code(), "as revisions.")
+            # Resume from the newest vintage once it is stored.
+            if len(fred_releases) > 0:
+                fs.last_vintage(fred_releases['vintage'].max()
+                                .to_pydatetime())
+                self.vtc_state_store.save(fs)
+            delta_tally += len(changed)
+        if self.verbosity() > 0:
+            print("Captured", delta_tally, "revision(s) of",
+                  len(fred_series_list), "series.")
+        return delta_tally
+
+    # Return and optionally set the verbosity level for the object.
+    def verbosity(self, v = None):
+        if v is not None:
+            self.vtc_verbosity = v
+        return self.vtc_verbosity